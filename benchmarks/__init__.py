@@ -0,0 +1,33 @@
+"""End-to-end benchmarks of the storyboard package.
+
+The test suite only checks correctness; this suite measures how long the
+main stages take, so that performance regressions can be caught. Inputs
+are synthetic videos generated locally and deterministically with
+FFmpeg's lavfi sources (see `benchmarks.inputs`), so that results are
+comparable across machines and runs without shipping any media.
+
+Run from the root of the repository (with the package installed or
+``src`` on ``PYTHONPATH``)::
+
+  python -m benchmarks --output results.json
+  python -m benchmarks --baseline results.json
+
+With ``--memory``, peak memory (RSS and traced Python heap, overall and
+per stage) is measured instead of time, for a range of tile sizes and
+source resolutions (see `benchmarks.memory`)::
+
+  python -m benchmarks --memory --output memory.json
+
+See ``python -m benchmarks --help`` for all options.
+
+Modules
+-------
+.. autosummary::
+    inputs
+    harness
+    suite
+    memory
+
+----
+
+"""
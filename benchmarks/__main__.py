@@ -0,0 +1,145 @@
+"""Command line interface of the benchmark suite."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import tempfile
+
+from storyboard import fflocate
+
+from benchmarks import harness
+from benchmarks import memory
+from benchmarks import suite
+
+
+def main(argv=None):
+    """Run the benchmark suite from the command line.
+
+    Returns
+    -------
+    returncode : int
+        0 on success, 1 if any benchmark regressed beyond the tolerance
+        compared to the baseline, 2 on errors.
+
+    """
+
+    # pylint: disable=too-many-locals
+
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description="""Time the main stages of storyboard generation on
+        synthetic videos (or measure their peak memory), and optionally
+        compare against a baseline saved by an earlier run.""")
+    parser.add_argument(
+        '--output', '-o', metavar='FILE',
+        help="Save results as JSON to FILE ('-' for stdout).")
+    parser.add_argument(
+        '--baseline', metavar='FILE',
+        help="""Compare results against those saved in FILE; exit with
+        status 1 if any benchmark regressed beyond the tolerance.""")
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2, metavar='RATIO',
+        help="""Relative slowdown (or increase in peak memory) tolerated
+        before a benchmark is considered a regression. Default is 0.2,
+        i.e., 20%%.""")
+    parser.add_argument(
+        '--memory', action='store_true',
+        help="""Measure peak memory (RSS above baseline, and traced
+        Python heap; overall and per stage) of storyboard generation for
+        a range of tile sizes, instead of timing. --repeat is ignored;
+        benchmarks are named <input>/<cols>x<rows>[-streaming], and
+        --baseline compares peak RSS.""")
+    parser.add_argument(
+        '--repeat', '-r', type=int, default=5, metavar='N',
+        help="Number of timed runs of each benchmark. Default is 5.")
+    parser.add_argument(
+        '--quick', action='store_true',
+        help="Only use the quick subset of inputs.")
+    parser.add_argument(
+        '--filter', '-k', metavar='PATTERN',
+        help="""Only run benchmarks whose names (<input>/<benchmark>)
+        match this shell-style pattern, e.g., '*/gen_frames' or, with
+        --memory, '*/8x8*'.""")
+    parser.add_argument(
+        '--input-dir', metavar='DIR',
+        help="""Directory to cache generated input videos in. Default is
+        storyboard-benchmarks under the system's temporary
+        directory.""")
+    parser.add_argument(
+        '--ffmpeg-bin', metavar='NAME',
+        help="The name/path of the ffmpeg binary.")
+    parser.add_argument(
+        '--ffprobe-bin', metavar='NAME',
+        help="The name/path of the ffprobe binary.")
+    args = parser.parse_args(argv)
+
+    ffmpeg_bin, ffprobe_bin = fflocate.guess_bins()
+    bins = (args.ffmpeg_bin or ffmpeg_bin, args.ffprobe_bin or ffprobe_bin)
+    input_dir = args.input_dir
+    if input_dir is None:
+        input_dir = os.path.join(tempfile.gettempdir(),
+                                 'storyboard-benchmarks')
+
+    baseline = None
+    if args.baseline is not None:
+        try:
+            with open(args.baseline) as fp:
+                baseline = harness.load_results(fp)
+        except (IOError, OSError, ValueError) as err:
+            sys.stderr.write("error: failed to load baseline: %s\n" % err)
+            return 2
+
+    if args.memory:
+        run, key, fmt = memory.run, 'peak_rss', '%8.1fMiB'
+        if not memory.rss_available():
+            sys.stderr.write("error: cannot sample RSS on this platform "
+                             "(install psutil)\n")
+            return 2
+    else:
+        run, key, fmt = suite.run, 'median', '%10.4fs'
+    scale = 1 / 2 ** 20 if args.memory else 1
+
+    try:
+        fflocate.check_bins(bins)
+        results = run({
+            'input_dir': input_dir,
+            'bins': bins,
+            'repeat': args.repeat,
+            'quick': args.quick,
+            'filter': args.filter,
+            'verbose': True,
+        })
+    except OSError as err:
+        sys.stderr.write("error: %s\n" % err)
+        return 2
+
+    if args.output == '-':
+        harness.save_results(results, sys.stdout)
+    elif args.output is not None:
+        with open(args.output, 'w') as fp:
+            harness.save_results(results, fp)
+
+    # human readable summary on stderr, so that stdout can carry JSON
+    if baseline is None:
+        for name, stats in sorted(results['benchmarks'].items()):
+            sys.stderr.write(("%-48s " + fmt + "\n") %
+                             (name, stats[key] * scale))
+        return 0
+    regressed = False
+    sys.stderr.write("%-48s %11s %11s %7s\n" %
+                     ('benchmark', 'baseline', 'current', 'ratio'))
+    for name, old, new, ratio, slower in harness.compare(
+            results, baseline, tolerance=args.tolerance, key=key):
+        sys.stderr.write(("%-48s " + fmt + " " + fmt + " %6.2fx%s\n") %
+                         (name, old * scale, new * scale, ratio,
+                          '  REGRESSION' if slower else ''))
+        regressed = regressed or slower
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""Timing, result files and baseline comparison.
+
+Routines
+--------
+.. autosummary::
+    time_benchmark
+    environment
+    load_results
+    save_results
+    compare
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import multiprocessing
+import platform
+import subprocess
+import sys
+import time
+
+import storyboard.version
+
+# monotonic high resolution clock where available
+_clock = getattr(time, 'perf_counter', time.time)
+
+RESULTS_VERSION = 1
+
+
+def time_benchmark(setup, repeat=5):
+    """Time a benchmark.
+
+    Parameters
+    ----------
+    setup : callable
+        Called without arguments before each run; returns the callable
+        (taking no arguments) to be timed, so that preparation (e.g.,
+        constructing objects whose construction is timed by another
+        benchmark) is excluded from the measurement.
+    repeat : int, optional
+        Number of timed runs. Default is 5.
+
+    Returns
+    -------
+    stats : dict
+        ``min``, ``median`` and ``mean`` wall clock time in seconds, and
+        ``repeat``.
+
+    """
+    times = []
+    for _ in range(repeat):
+        run = setup()
+        start = _clock()
+        run()
+        times.append(_clock() - start)
+    times.sort()
+    middle = len(times) // 2
+    if len(times) % 2:
+        median = times[middle]
+    else:
+        median = (times[middle - 1] + times[middle]) / 2
+    return {
+        'min': times[0],
+        'median': median,
+        'mean': sum(times) / len(times),
+        'repeat': repeat,
+    }
+
+
+def environment(ffmpeg_bin='ffmpeg'):
+    """Describe the environment the benchmarks are run in.
+
+    Results are only comparable across identical environments; the
+    description is saved along with the results for reference.
+
+    """
+    try:
+        ffmpeg_version = subprocess.check_output(
+            [ffmpeg_bin, '-version']).decode('utf-8').splitlines()[0]
+    except (OSError, subprocess.CalledProcessError):
+        ffmpeg_version = None
+    return {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpu_count': multiprocessing.cpu_count(),
+        'storyboard': storyboard.version.__version__,
+        'ffmpeg': ffmpeg_version,
+    }
+
+
+def save_results(results, fp):
+    """Save results (as returned by ``benchmarks.suite.run``) as JSON."""
+    json.dump(results, fp, indent=2, sort_keys=True)
+    fp.write('\n')
+
+
+def load_results(fp):
+    """Load results saved by `save_results`.
+
+    Raises
+    ------
+    ValueError
+        If the file is not a results file of a supported version.
+
+    """
+    results = json.load(fp)
+    if (not isinstance(results, dict) or
+            results.get('version') != RESULTS_VERSION):
+        raise ValueError("not a benchmark results file of version %d" %
+                         RESULTS_VERSION)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, key='median'):
+    """Compare results against a baseline.
+
+    Parameters
+    ----------
+    results, baseline : dict
+        Results, as returned by ``benchmarks.suite.run`` or
+        `load_results`.
+    tolerance : float, optional
+        Relative slowdown tolerated before a benchmark is considered a
+        regression, e.g., 0.2 for 20%. Default is 0.2.
+    key : str, optional
+        Statistic compared. Default is ``'median'``.
+
+    Returns
+    -------
+    rows : list
+        One tuple ``(name, baseline_time, time, ratio, regressed)`` for
+        each benchmark present in both, sorted by name. Benchmarks
+        missing from either are left out.
+
+    """
+    rows = []
+    current = results['benchmarks']
+    reference = baseline['benchmarks']
+    for name in sorted(set(current) & set(reference)):
+        old = reference[name][key]
+        new = current[name][key]
+        ratio = new / old if old > 0 else float('inf')
+        rows.append((name, old, new, ratio, ratio > 1 + tolerance))
+    return rows
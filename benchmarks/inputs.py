@@ -0,0 +1,142 @@
+"""Deterministic synthetic input videos.
+
+Each input is described by an `InputSpec` and generated on demand with
+FFmpeg's ``testsrc2`` (video) and ``sine`` (audio) lavfi sources. The
+specs cover several resolutions, durations, codecs and GOP lengths,
+since those are what the cost of probing and seeking depends on: a long
+GOP means a long decode from the preceding keyframe for every
+(accurate) seek.
+
+Generated files are cached in a directory, named after their specs, and
+only generated again if missing.
+
+Classes
+-------
+.. autosummary::
+    InputSpec
+
+Routines
+--------
+.. autosummary::
+    generate
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import subprocess
+
+
+class InputSpec(object):
+
+    """Specification of a synthetic input video.
+
+    Parameters
+    ----------
+    name : str
+        Unique name, also used as the basename of the generated file.
+    size : tuple
+        ``(width, height)``.
+    duration : float
+        Duration in seconds.
+    codec : str
+        FFmpeg video encoder, e.g., ``'libx264'`` or ``'mpeg4'``.
+    gop : int
+        GOP length, i.e., maximum number of frames between keyframes.
+    quick : bool, optional
+        Whether the input is part of the quick subset of the suite.
+        Default is ``False``.
+
+    """
+
+    # pylint: disable=too-few-public-methods,too-many-arguments
+
+    def __init__(self, name, size, duration, codec, gop, quick=False):
+        self.name = name
+        self.size = size
+        self.duration = duration
+        self.codec = codec
+        self.gop = gop
+        self.quick = quick
+
+    def to_dict(self):
+        """Return the spec as a JSON serializable dict."""
+        return {
+            'size': list(self.size),
+            'duration': self.duration,
+            'codec': self.codec,
+            'gop': self.gop,
+        }
+
+
+INPUTS = [
+    InputSpec('180p-h264-gop12-10s', (320, 180), 10, 'libx264', 12,
+              quick=True),
+    InputSpec('720p-h264-gop250-30s', (1280, 720), 30, 'libx264', 250,
+              quick=True),
+    InputSpec('720p-mpeg4-gop12-30s', (1280, 720), 30, 'mpeg4', 12),
+    InputSpec('1080p-h264-gop250-120s', (1920, 1080), 120, 'libx264', 250),
+    InputSpec('2160p-h264-gop50-10s', (3840, 2160), 10, 'libx264', 50),
+]
+
+
+def generate(spec, directory, ffmpeg_bin='ffmpeg'):
+    """Generate an input video, unless already cached.
+
+    Parameters
+    ----------
+    spec : InputSpec
+    directory : str
+        Cache directory, created if nonexistent.
+    ffmpeg_bin : str, optional
+        Name or path of the ffmpeg binary. Default is ``'ffmpeg'``.
+
+    Returns
+    -------
+    path : str
+        Path to the generated video.
+
+    Raises
+    ------
+    OSError
+        If FFmpeg fails.
+
+    """
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, spec.name + '.mkv')
+    if os.path.exists(path):
+        return path
+
+    width, height = spec.size
+    tmp_path = os.path.join(directory, spec.name + '.tmp.mkv')
+    command = [
+        ffmpeg_bin, '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'lavfi',
+        '-i', 'testsrc2=size=%dx%d:rate=25:duration=%s' %
+        (width, height, spec.duration),
+        '-f', 'lavfi',
+        '-i', 'sine=frequency=440:duration=%s' % spec.duration,
+        '-c:v', spec.codec, '-g', str(spec.gop), '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac',
+        # deterministic output
+        '-threads', '1', '-fflags', '+bitexact', '-flags', '+bitexact',
+        '-map_metadata', '-1',
+        tmp_path,
+    ]
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    _, stderr = proc.communicate()
+    if proc.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise OSError("failed to generate '%s': %s" %
+                      (spec.name, stderr.decode('utf-8', 'replace')))
+    os.rename(tmp_path, path)
+    return path
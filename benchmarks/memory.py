@@ -0,0 +1,316 @@
+"""Memory high-water benchmarks.
+
+Peak memory, rather than time, is what limits how many storyboards can
+be generated concurrently on a host. Two measures are reported, since
+neither is sufficient on its own:
+
+* the peak resident set size (RSS) above the RSS before the workload,
+  sampled from a background thread; this includes pixel data of Pillow
+  images, which is allocated outside of the Python heap;
+* the peak size of the Python heap, traced by ``tracemalloc``.
+
+Peaks are also attributed to the stages of storyboard generation (see
+the `timings` attribute of ``storyboard.storyboard.StoryBoard``): the
+peak of a stage is the highest sample taken while the stage was
+running, so it covers everything alive at that point (e.g., frames
+extracted earlier), not just what the stage itself allocated.
+
+Each workload is measured in a freshly spawned process (see
+`measure_isolated`), so that memory freed by earlier workloads but
+retained by the allocator does not hide later peaks.
+
+Classes
+-------
+.. autosummary::
+    StageMemory
+
+Routines
+--------
+.. autosummary::
+    rss_available
+    measure_workload
+    measure_isolated
+    run
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import contextlib
+import fnmatch
+import multiprocessing
+import os
+import sys
+import threading
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+from storyboard import metadata
+from storyboard import storyboard
+from storyboard import util
+
+from benchmarks import harness
+from benchmarks import inputs
+
+
+# tiles of the memory workloads
+TILES = [(4, 4), (8, 8), (12, 12)]
+
+# seconds between two samples
+SAMPLE_INTERVAL = 0.005
+
+
+def _read_rss():
+    """Return the current RSS of this process in bytes, or None."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def rss_available():
+    """Return whether the RSS can be sampled on this platform.
+
+    RSS is read from ``/proc/self/statm`` on Linux, or with psutil (if
+    installed) elsewhere.
+
+    """
+    return _read_rss() is not None
+
+
+class StageMemory(util.Timings):
+
+    """Timings that also record the memory high-water mark per stage.
+
+    Pass an instance as the `timings` parameter of
+    ``storyboard.metadata.Video``, and construct the
+    ``storyboard.storyboard.StoryBoard`` from that video, so that all
+    stages report to it. While `sampling`, a background thread samples
+    the RSS and the traced Python heap, attributing each sample to the
+    whole run and to every stage running at the time.
+
+    Attributes
+    ----------
+    peaks : dict
+        Maps stage names, and ``None`` for the whole run, to dicts with
+        keys ``'rss'`` and ``'traced'`` (bytes above the baseline taken
+        when sampling started).
+
+    """
+
+    def __init__(self):
+        util.Timings.__init__(self)
+        self.peaks = {}
+        self._active = {}
+        self._baseline_rss = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        """Take a sample and update the peaks of the active stages."""
+        rss = _read_rss()
+        rss = rss - self._baseline_rss if rss is not None else 0
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            traced = tracemalloc.get_traced_memory()[0]
+        else:
+            traced = 0
+        with self._lock:
+            stages = [None] + [stage for stage, count in self._active.items()
+                               if count > 0]
+            for stage in stages:
+                peak = self.peaks.setdefault(stage, {'rss': 0, 'traced': 0})
+                peak['rss'] = max(peak['rss'], rss)
+                peak['traced'] = max(peak['traced'], traced)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Time the enclosed block, and track memory while it runs.
+
+        A sample is taken upon entering and leaving the block, so that
+        even stages shorter than the sampling interval are covered.
+
+        """
+        with self._lock:
+            self._active[stage] = self._active.get(stage, 0) + 1
+        self._sample()
+        try:
+            with util.Timings.timer(self, stage):
+                yield
+        finally:
+            self._sample()
+            with self._lock:
+                self._active[stage] -= 1
+
+    @contextlib.contextmanager
+    def sampling(self):
+        """Context manager sampling memory in a background thread."""
+        self._baseline_rss = _read_rss() or 0
+        self._stop.clear()
+
+        def sample_forever():
+            """Sample until stopped."""
+            while not self._stop.wait(SAMPLE_INTERVAL):
+                self._sample()
+
+        thread = threading.Thread(target=sample_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            yield
+        finally:
+            self._stop.set()
+            thread.join()
+            self._sample()
+
+
+def measure_workload(workload):
+    """Measure the memory high-water mark of a storyboard workload.
+
+    The workload is run in the current process; see `measure_isolated`
+    for reliable results.
+
+    Parameters
+    ----------
+    workload : dict
+        ``video`` (path, required), ``bins`` (default ``('ffmpeg',
+        'ffprobe')``), and any parameters of
+        ``storyboard.storyboard.StoryBoard.gen_storyboard`` (e.g.,
+        ``tile``, ``thumbnail_width`` or ``streaming_assembly``);
+        ``include_sha1sum`` defaults to ``False``.
+
+    Returns
+    -------
+    result : dict
+        ``peak_rss`` and ``peak_traced`` (bytes, for the whole
+        workload), and ``stages``, mapping stages to dicts with keys
+        ``peak_rss`` and ``peak_traced``.
+
+    """
+    params = dict(workload)
+    video_path = params.pop('video')
+    bins = tuple(params.pop('bins', ('ffmpeg', 'ffprobe')))
+    params.setdefault('include_sha1sum', False)
+    # load the font before the baseline, as in a long-running process
+    params.setdefault('timestamp_font', storyboard.Font())
+    params['text_font'] = params['timestamp_font']
+
+    tracker = StageMemory()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    try:
+        with tracker.sampling():
+            video = metadata.Video(video_path, params={
+                'ffprobe_bin': bins[1],
+                'timings': tracker,
+            })
+            sb = storyboard.StoryBoard(video, params={'bins': bins})
+            sb.gen_storyboard(params=params).close()
+            sb.clear_frames()
+    finally:
+        if tracemalloc is not None:
+            tracemalloc.stop()
+
+    stages = {}
+    for stage, peak in tracker.peaks.items():
+        if stage is not None:
+            stages[stage] = {'peak_rss': peak['rss'],
+                             'peak_traced': peak['traced']}
+    overall = tracker.peaks[None]
+    return {
+        'peak_rss': overall['rss'],
+        'peak_traced': overall['traced'],
+        'stages': stages,
+    }
+
+
+def measure_isolated(workload):
+    """Measure a workload (see `measure_workload`) in a new process.
+
+    The process is spawned rather than forked where possible, so that it
+    does not inherit the memory of the current process.
+
+    """
+    if hasattr(multiprocessing, 'get_context'):
+        context = multiprocessing.get_context('spawn')
+    else:
+        context = multiprocessing
+    pool = context.Pool(1)
+    try:
+        return pool.apply(measure_workload, (workload,))
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def run(params):
+    """Run the memory benchmark suite.
+
+    Each input (see `benchmarks.inputs`) is combined with each tile in
+    `TILES`, both with and without streaming assembly; workloads are
+    named ``<input>/<cols>x<rows>`` and
+    ``<input>/<cols>x<rows>-streaming``.
+
+    Parameters
+    ----------
+    params : dict
+        Same as for ``benchmarks.suite.run``, except that ``repeat`` is
+        ignored.
+
+    Returns
+    -------
+    results : dict
+        Same structure as returned by ``benchmarks.suite.run``, with the
+        results of `measure_workload` in place of timing statistics.
+
+    """
+    input_dir = params['input_dir']
+    bins = params.get('bins', ('ffmpeg', 'ffprobe'))
+    quick = params.get('quick', False)
+    pattern = params.get('filter', None)
+    verbose = params.get('verbose', False)
+
+    results = {
+        'version': harness.RESULTS_VERSION,
+        'environment': harness.environment(bins[0]),
+        'inputs': {},
+        'benchmarks': {},
+    }
+    for spec in inputs.INPUTS:
+        if quick and not spec.quick:
+            continue
+        workloads = []
+        for cols, rows in TILES:
+            for streaming in (False, True):
+                name = '%s/%dx%d%s' % (spec.name, cols, rows,
+                                       '-streaming' if streaming else '')
+                if pattern is None or fnmatch.fnmatch(name, pattern):
+                    workloads.append((name, (cols, rows), streaming))
+        if not workloads:
+            continue
+        if verbose:
+            sys.stderr.write("generating input %s...\n" % spec.name)
+        video = inputs.generate(spec, input_dir, ffmpeg_bin=bins[0])
+        results['inputs'][spec.name] = spec.to_dict()
+        for name, tile, streaming in workloads:
+            if verbose:
+                sys.stderr.write("measuring %s...\n" % name)
+            results['benchmarks'][name] = measure_isolated({
+                'video': video,
+                'bins': bins,
+                'tile': tile,
+                'streaming_assembly': streaming,
+            })
+    return results
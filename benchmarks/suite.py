@@ -0,0 +1,251 @@
+"""Benchmark definitions.
+
+Each benchmark is run against each input video (see
+`benchmarks.inputs`), and named ``<input>/<benchmark>`` in results.
+Additionally, the startup time of each console script (see
+`ENTRY_POINTS`) is measured once, named ``startup/<script>``.
+
+Routines
+--------
+.. autosummary::
+    benchmark
+    run
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import fnmatch
+import os
+import subprocess
+import sys
+
+from storyboard import frame
+from storyboard import metadata
+from storyboard import storyboard
+
+from benchmarks import harness
+from benchmarks import inputs
+
+
+# name => function taking a context and returning a setup callable (see
+# harness.time_benchmark), in order of definition
+BENCHMARKS = collections.OrderedDict()
+
+# console script => module of its main function; each script's startup
+# time is measured by running ``<script> --version`` the way the wrappers
+# generated by setuptools do, in a fresh interpreter
+ENTRY_POINTS = collections.OrderedDict([
+    ('storyboard', 'storyboard.storyboard'),
+    ('metadata', 'storyboard.metadata'),
+])
+
+
+def benchmark(name):
+    """Decorator registering a benchmark under `name`.
+
+    The decorated function takes a context object (with attributes
+    ``video``, ``bins``, ``spec`` and ``fixtures``, a dict for caching
+    expensive fixtures shared by benchmarks of the same input), and
+    returns a setup callable for ``benchmarks.harness.time_benchmark``.
+
+    """
+    def decorator(func):
+        """Register func."""
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class _Context(object):
+
+    """Per-input context passed to benchmarks."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, video, bins, spec):
+        self.video = video
+        self.bins = bins
+        self.spec = spec
+        self.fixtures = {}
+
+    def middle_frame(self):
+        """Return a frame from the middle of the video (cached)."""
+        if 'middle_frame' not in self.fixtures:
+            self.fixtures['middle_frame'] = frame.extract_frame(
+                self.video, self.spec.duration / 2,
+                params={'ffmpeg_bin': self.bins[0]})
+        return self.fixtures['middle_frame']
+
+
+@benchmark('video_metadata')
+def _bench_video_metadata(ctx):
+    def run():
+        """Probe the video."""
+        metadata.Video(ctx.video, params={'ffprobe_bin': ctx.bins[1]})
+    return lambda: run
+
+
+@benchmark('extract_frame')
+def _bench_extract_frame(ctx):
+    def run():
+        """Seek to the middle of the video and decode a frame."""
+        extracted = frame.extract_frame(
+            ctx.video, ctx.spec.duration / 2,
+            params={'ffmpeg_bin': ctx.bins[0]})
+        extracted.image.close()
+    return lambda: run
+
+
+@benchmark('gen_frames')
+def _bench_gen_frames(ctx):
+    def setup():
+        """Construct a fresh StoryBoard (no frames extracted yet)."""
+        sb = storyboard.StoryBoard(ctx.video, params={'bins': ctx.bins})
+
+        def run():
+            """Extract the frames of a 4x4 storyboard."""
+            sb.gen_frames(16)
+            sb.clear_frames()
+        return run
+    return setup
+
+
+@benchmark('create_thumbnail')
+def _bench_create_thumbnail(ctx):
+    source = ctx.middle_frame()
+    font = storyboard.Font()
+
+    def run():
+        """Resize a frame and draw its timestamp."""
+        storyboard.create_thumbnail(source, 480, params={
+            'draw_timestamp': True,
+            'timestamp_font': font,
+        }).close()
+    return lambda: run
+
+
+@benchmark('tile_images')
+def _bench_tile_images(ctx):
+    thumbnail = storyboard.create_thumbnail(ctx.middle_frame(), 480)
+    thumbnails = [thumbnail] * 16
+
+    def run():
+        """Tile 16 thumbnails in a 4x4 array."""
+        storyboard.tile_images(thumbnails, (4, 4), params={
+            'tile_spacing': (8, 6),
+        }).close()
+    return lambda: run
+
+
+@benchmark('gen_storyboard')
+def _bench_gen_storyboard(ctx):
+    font = storyboard.Font()
+
+    def run():
+        """Generate a complete storyboard, from probing onwards."""
+        sb = storyboard.StoryBoard(ctx.video, params={'bins': ctx.bins})
+        sb.gen_storyboard(params={
+            'include_sha1sum': False,
+            'timestamp_font': font,
+            'text_font': font,
+        }).close()
+        sb.clear_frames()
+    return lambda: run
+
+
+def _startup_setup(module):
+    """Return a setup callable timing startup of the script in module."""
+    command = [
+        sys.executable, '-c',
+        'import sys; from %s import main; sys.exit(main())' % module,
+        '--version',
+    ]
+    # make sure the interpreter imports the same package as we do
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(
+        metadata.__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [src_dir] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+
+    def run():
+        """Start the script, print the version and exit."""
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call(command, stdout=devnull, env=env)
+    return lambda: run
+
+
+def run(params):
+    """Run the benchmark suite.
+
+    Parameters
+    ----------
+    params : dict
+        Parameters: ``input_dir`` (cache directory of input videos,
+        required), ``bins`` (a tuple ``(ffmpeg_bin, ffprobe_bin)``,
+        default ``('ffmpeg', 'ffprobe')``), ``repeat`` (number of timed
+        runs, default 5), ``quick`` (whether to only use the quick
+        subset of inputs, default ``False``), ``filter`` (an fnmatch
+        pattern that benchmark names, ``<input>/<benchmark>``, must
+        match, default ``None``), and ``verbose`` (whether to report
+        progress to stderr, default ``False``).
+
+    Returns
+    -------
+    results : dict
+        A JSON serializable dict, with the ``environment`` (see
+        ``benchmarks.harness.environment``), the ``inputs`` (specs of
+        the input videos used), and the ``benchmarks`` (mapping names
+        to timing statistics, see
+        ``benchmarks.harness.time_benchmark``).
+
+    """
+    input_dir = params['input_dir']
+    bins = params.get('bins', ('ffmpeg', 'ffprobe'))
+    repeat = params.get('repeat', 5)
+    quick = params.get('quick', False)
+    pattern = params.get('filter', None)
+    verbose = params.get('verbose', False)
+
+    results = {
+        'version': harness.RESULTS_VERSION,
+        'environment': harness.environment(bins[0]),
+        'inputs': {},
+        'benchmarks': {},
+    }
+    for script, module in ENTRY_POINTS.items():
+        name = 'startup/%s' % script
+        if pattern is not None and not fnmatch.fnmatch(name, pattern):
+            continue
+        if verbose:
+            sys.stderr.write("running %s...\n" % name)
+        results['benchmarks'][name] = harness.time_benchmark(
+            _startup_setup(module), repeat=repeat)
+    for spec in inputs.INPUTS:
+        if quick and not spec.quick:
+            continue
+        names = ['%s/%s' % (spec.name, name) for name in BENCHMARKS]
+        if pattern is not None:
+            names = [name for name in names
+                     if fnmatch.fnmatch(name, pattern)]
+        if not names:
+            continue
+        if verbose:
+            sys.stderr.write("generating input %s...\n" % spec.name)
+        video = inputs.generate(spec, input_dir, ffmpeg_bin=bins[0])
+        results['inputs'][spec.name] = spec.to_dict()
+        ctx = _Context(video, bins, spec)
+        for name in names:
+            if verbose:
+                sys.stderr.write("running %s...\n" % name)
+            bench = BENCHMARKS[name.split('/', 1)[1]]
+            results['benchmarks'][name] = harness.time_benchmark(
+                bench(ctx), repeat=repeat)
+        for fixture in ctx.fixtures.values():
+            fixture.image.close()
+    return results
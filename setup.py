@@ -60,12 +60,17 @@ setup(
             'Pygments==1.6',
             'Sphinx==1.2.2',
         ],
+        'smart': [
+            'numpy',
+        ],
     },
     package_data={
         'storyboard': [
             'SourceCodePro-Regular.otf',
         ]
     },
+    # the default font is located relative to storyboard/storyboard.py
+    zip_safe=False,
     entry_points={
         'console_scripts': [
             'storyboard=storyboard.storyboard:main',
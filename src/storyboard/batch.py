@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+
+"""Generate storyboards for many videos in parallel.
+
+Classes
+-------
+.. autosummary::
+    BatchResult
+
+Routines
+--------
+.. autosummary::
+    cpu_budget
+    run
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import tempfile
+
+from storyboard import encoder as _encoder
+from storyboard import scheduler as _scheduler
+from storyboard.util import read_param as _read_param
+
+
+class BatchResult(object):
+    """Result of storyboard generation for one video.
+
+    Parameters
+    ----------
+    video : str
+        Path to the video file.
+    outputs : list
+        Paths to the saved storyboard images, one for each output
+        format.
+    error : str
+        Error message if storyboard generation failed, or ``None``.
+    timings : dict
+        Time spent in each stage, in seconds (see the `timings`
+        attribute of ``storyboard.storyboard.StoryBoard``), or ``None``
+        if not available (e.g., if the video could not be probed).
+    degradations : list, optional
+        Degradations applied to meet the deadline or the memory budget,
+        if any (see the
+        `degradations` attribute of
+        ``storyboard.storyboard.StoryBoard``). Default is ``None``,
+        i.e., none.
+    plan : str
+        Explanation of the frame extraction plan (see
+        ``storyboard.planner.Plan.explain``), or ``None`` if no frame
+        was extracted.
+
+    Attributes
+    ----------
+    video : str
+    outputs : list
+    error : str
+    timings : dict
+    degradations : list
+    plan : str
+
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, video, outputs, error=None, timings=None,
+                 degradations=None, plan=None):
+        self.video = video
+        self.outputs = outputs
+        self.error = error
+        self.timings = timings
+        self.degradations = (degradations if degradations is not None
+                             else [])
+        self.plan = plan
+
+
+def cpu_budget(jobs, budget=None):
+    """Split a CPU budget among concurrent jobs.
+
+    Parameters
+    ----------
+    jobs : int
+        Number of concurrent jobs.
+    budget : int, optional
+        Total number of CPUs to be used. If ``None``, use the number of
+        CPUs of the machine. Default is ``None``.
+
+    Returns
+    -------
+    per_job : int
+        Number of CPUs available to each job, at least one.
+
+    """
+    import multiprocessing
+    if budget is None:
+        budget = multiprocessing.cpu_count()
+    return max(1, budget // max(1, jobs))
+
+
+def run(paths, params=None):
+    """Generate storyboards for a list of videos.
+
+    Videos are processed concurrently in a pool of worker processes. To
+    avoid oversubscribing the machine, a total CPU budget is shared
+    among the workers. FFmpeg and ffprobe processes of all workers run
+    under a single ``storyboard.scheduler.Scheduler`` owning the budget,
+    which limits the number of concurrent processes (see
+    `ffmpeg_processes`) and the number of threads of each, so that a
+    video can use the CPUs left idle by the others (e.g., towards the
+    end of the batch). Output formats are encoded with ``B // J``
+    threads for a budget of B CPUs and J concurrent videos.
+
+    This is a generator, yielding results as they become available.
+
+    Parameters
+    ----------
+    paths : list
+        Paths to the video files.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        Every parameter understood by
+        ``storyboard.storyboard.StoryBoard`` (the constructor) and
+        ``storyboard.storyboard.StoryBoard.gen_storyboard`` is
+        understood here, plus the ones listed in the "Other Parameters"
+        section.
+
+    Yields
+    ------
+    result : BatchResult
+        One for each video. Failures (``OSError`` raised during
+        storyboard generation, and ``MemoryError`` raised upfront when
+        a storyboard does not fit in the memory budget) are reported
+        through the ``error`` attribute rather than raised.
+
+    Other Parameters
+    ----------------
+    jobs : int, optional
+        Maximum number of videos processed concurrently. If ``None``,
+        use the CPU budget. When `jobs` is 1, videos are processed one
+        by one in the current process. Default is ``None``.
+    cpu_budget : int, optional
+        Total number of CPUs to be used. If ``None``, use the number of
+        CPUs of the machine. Default is ``None``.
+    ffmpeg_processes : int, optional
+        Maximum number of FFmpeg and ffprobe processes running at once,
+        across all videos; each gets ``cpu_budget // ffmpeg_processes``
+        threads (unless `ffmpeg_threads` is given). If ``None``, same as
+        `cpu_budget`, i.e., single-threaded processes. Fewer
+        multithreaded processes may be faster for high resolution
+        videos, and are lighter on memory and disk seeks. Default is
+        ``None``.
+    io_limits : dict, optional
+        Maps mount points to the maximum number of concurrent I/O jobs
+        (frame extraction, probing, hashing) on their devices, across
+        all videos; see ``storyboard.scheduler.Scheduler``. Default is
+        ``None``.
+    io_limit : int, optional
+        Maximum number of concurrent I/O jobs on other devices. If
+        ``None``, unlimited. Default is ``None``.
+    ordered : bool, optional
+        Whether to yield results in the order of `paths`, instead of as
+        they complete. Default is ``False``.
+    output_format : str or list, optional
+        Output format, or a list of output formats; see
+        ``storyboard.encoder.encode_image``. When several formats are
+        given, the storyboard is rendered once and encoded into each
+        format. Default is ``'jpeg'``.
+    output_dir : str, optional
+        Directory to save storyboards to, with the filename of each
+        storyboard being that of the video with the extension replaced
+        by that of the output format; videos whose storyboards would
+        collide (e.g., ``a/clip.mp4`` and ``b/clip.mkv``) are rejected.
+        If ``None``, storyboards are saved to secure temporary files.
+        Default is ``None``.
+    quality : int, optional
+        Quality of lossy output formats. Default is 85.
+    preset : {'fast', 'balanced', 'smallest'}, optional
+        Encoder preset. Default is ``'balanced'``.
+    strip_encoding : bool, optional
+        Whether to render and encode storyboards strip by strip; see
+        ``storyboard.storyboard.StoryBoard.save_storyboard_strips``.
+        Only available when the output format is PNG. Default is
+        ``False``.
+    memory_budget : int, optional
+        Memory budget in bytes of all the videos processed
+        concurrently, split evenly among the `jobs` videos; see
+        ``storyboard.storyboard.StoryBoard.gen_storyboard``. Strip
+        encoding may be switched on to meet it if the only output
+        format is PNG. Default is ``None``, i.e., no budget.
+
+    Raises
+    ------
+    ValueError
+        If an output format is not recognized, strip encoding is
+        requested for a format other than PNG, two videos would be
+        saved to the same file in `output_dir`, the CPU budget, number
+        of FFmpeg processes or an I/O cap is not positive, or a mount
+        point in `io_limits` does not exist.
+
+    Notes
+    -----
+    Progress information (the `print_progress` parameter) is only
+    printed when `jobs` is 1, as output from concurrent workers would be
+    garbled.
+
+    """
+
+    import multiprocessing
+
+    if params is None:
+        params = {}
+    jobs = _read_param(params, 'jobs', None)
+    budget = _read_param(params, 'cpu_budget', None)
+    processes = _read_param(params, 'ffmpeg_processes', None)
+    ordered = _read_param(params, 'ordered', False)
+    output_formats = _read_param(params, 'output_format', 'jpeg')
+    strip_encoding = _read_param(params, 'strip_encoding', False)
+
+    if budget is None:
+        budget = multiprocessing.cpu_count()
+    if jobs is None:
+        jobs = budget
+    jobs = max(1, min(jobs, len(paths)))
+
+    # validate upfront rather than in every worker
+    if not isinstance(output_formats, (list, tuple)):
+        output_formats = [output_formats]
+    for output_format in output_formats:
+        _encoder.suffix(output_format)
+    if strip_encoding and list(output_formats) != ['png']:
+        raise ValueError("strip encoding is only available for PNG output")
+    output_dir = _read_param(params, 'output_dir', None)
+    if output_dir is not None:
+        # concurrent workers would race on the same file
+        saved_to = {}
+        for path in paths:
+            for output_format in output_formats:
+                output = _output_path(path, output_dir,
+                                      _encoder.suffix(output_format))
+                if output in saved_to:
+                    raise ValueError("'%s' and '%s' would both be saved to "
+                                     "'%s'" % (saved_to[output], path,
+                                               output))
+                saved_to[output] = path
+
+    # shared by the worker processes, if any
+    scheduler = _scheduler.Scheduler(
+        cpus=budget, processes=processes,
+        io_limits=_read_param(params, 'io_limits', None),
+        io_limit=_read_param(params, 'io_limit', None),
+        shared=jobs > 1)
+
+    worker_params = dict(params)
+    worker_params['output_format'] = list(output_formats)
+    worker_params['cpus'] = cpu_budget(jobs, budget)
+    memory_budget = _read_param(params, 'memory_budget', None)
+    if memory_budget is not None:
+        worker_params['memory_budget'] = memory_budget // jobs
+    # enough to use the whole budget, should the other workers be idle
+    worker_params.setdefault('frame_jobs', scheduler.processes)
+    if jobs > 1:
+        worker_params['print_progress'] = False
+    else:
+        worker_params['scheduler'] = scheduler
+    tasks = [(path, worker_params) for path in paths]
+
+    if jobs == 1:
+        for task in tasks:
+            yield _process_video(task)
+        return
+
+    # the scheduler can only be passed to workers upon their creation
+    pool = multiprocessing.Pool(jobs, initializer=_scheduler.set_scheduler,
+                                initargs=(scheduler,))
+    try:
+        if ordered:
+            results = pool.imap(_process_video, tasks)
+        else:
+            results = pool.imap_unordered(_process_video, tasks)
+        for result in results:
+            yield result
+        pool.close()
+    finally:
+        # terminates outstanding workers if the consumer bails out early
+        pool.terminate()
+        pool.join()
+
+
+def _process_video(task):
+    """Generate and save the storyboard of a single video.
+
+    Parameters
+    ----------
+    task : tuple
+        A tuple ``(path, params)``, where ``params`` is the parameter
+        dict of `run`, with ``output_format`` normalized to a list,
+        ``frame_jobs`` filled in, and an additional ``cpus`` key for the
+        per-video CPU budget (used for encoding).
+
+    Returns
+    -------
+    result : BatchResult
+
+    """
+
+    # imported here to break the circular import between this module and
+    # storyboard.storyboard (whose main() uses run())
+    from storyboard.storyboard import StoryBoard
+
+    path, params = task
+    output_formats = params['output_format']
+    cpus = params['cpus']
+    output_dir = _read_param(params, 'output_dir', None)
+    quality = _read_param(params, 'quality', 85)
+    preset = _read_param(params, 'preset', 'balanced')
+    strip_encoding = _read_param(params, 'strip_encoding', False)
+    memory_budget = _read_param(params, 'memory_budget', None)
+
+    outputs = []
+    # files to be removed upon failure
+    partial_files = []
+    sb = None
+    try:
+        for output_format in output_formats:
+            suffix = _encoder.suffix(output_format)
+            if output_dir is not None:
+                outputs.append(_output_path(path, output_dir, suffix))
+            else:
+                tempfd, output = tempfile.mkstemp(prefix='storyboard-',
+                                                  suffix=suffix)
+                os.close(tempfd)
+                outputs.append(output)
+                partial_files.append(output)
+
+        # FFmpeg threads are granted by the scheduler (installed, or
+        # passed in the params)
+        sb = StoryBoard(path, params=params)
+
+        partial_files = list(outputs)
+        if strip_encoding or (memory_budget is not None and
+                              output_formats == ['png']):
+            # switches to strip encoding by itself to meet the budget
+            sb.save(outputs[0], output_format='png', params=params)
+        else:
+            storyboard_image = sb.gen_storyboard(params=params)
+            with sb.timings.timer('encoding'):
+                _encoder.encode_images([
+                    (storyboard_image, output, output_format,
+                     {'quality': quality, 'preset': preset})
+                    for output, output_format in zip(outputs, output_formats)
+                ], params={'threads': cpus})
+            storyboard_image.close()
+    except (OSError, MemoryError) as err:
+        for output in partial_files:
+            if os.path.exists(output):
+                os.remove(output)
+        return BatchResult(path, [], error=str(err),
+                           timings=_plain_timings(sb),
+                           plan=_plan_explanation(sb))
+
+    return BatchResult(path, outputs, timings=_plain_timings(sb),
+                       degradations=list(sb.degradations),
+                       plan=_plan_explanation(sb))
+
+
+def _output_path(path, output_dir, suffix):
+    """Return the path a storyboard is saved to in `output_dir`."""
+    basename = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir, basename + suffix)
+
+
+def _plain_timings(sb):
+    """Return the timings of a StoryBoard (or None) as a plain dict.
+
+    Unlike ``storyboard.util.Timings``, a plain dict can be sent back
+    from a worker process.
+
+    """
+    return dict(sb.timings) if sb is not None else None
+
+
+def _plan_explanation(sb):
+    """Return the explanation of the plan of a StoryBoard, or None."""
+    if sb is None or sb.plan is None:
+        return None
+    return sb.plan.explain()
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+
+"""Encode storyboard images.
+
+Classes
+-------
+.. autosummary::
+    PNGStripWriter
+
+Routines
+--------
+.. autosummary::
+    encode_image
+    encode_images
+    register_format
+    formats
+    suffix
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+import struct
+import zlib
+
+from storyboard.util import read_param as _read_param
+
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+PRESETS = ('fast', 'balanced', 'smallest')
+
+
+def _encode_jpeg(image, fp, quality, preset):
+    """Encode an image as JPEG."""
+    if preset == 'fast':
+        image.save(fp, 'jpeg', quality=quality)
+    elif preset == 'balanced':
+        image.save(fp, 'jpeg', quality=quality,
+                   optimize=True, progressive=True)
+    else:
+        # progressive and baseline encodings of the same coefficients
+        # decode to the same pixels; either may be smaller
+        encoded = []
+        for progressive in (True, False):
+            output = io.BytesIO()
+            image.save(output, 'jpeg', quality=quality,
+                       optimize=True, progressive=progressive)
+            encoded.append(output.getvalue())
+        data = min(encoded, key=len)
+        if hasattr(fp, 'write'):
+            fp.write(data)
+        else:
+            with open(fp, 'wb') as output:
+                output.write(data)
+
+
+def _encode_png(image, fp, quality, preset):
+    """Encode an image as PNG."""
+    # pylint: disable=unused-argument
+    if preset == 'fast':
+        image.save(fp, 'png', compress_level=1)
+    else:
+        # Pillow has nothing smaller than optimize, which has always
+        # been the default, so smallest is the same as balanced
+        image.save(fp, 'png', optimize=True)
+
+
+def _encode_webp(image, fp, quality, preset):
+    """Encode an image as WebP."""
+    method = {'fast': 0, 'balanced': 4, 'smallest': 6}[preset]
+    image.save(fp, 'webp', quality=quality, method=method)
+
+
+# format name => (encode function, filename suffix)
+_FORMATS = {
+    'jpeg': (_encode_jpeg, '.jpg'),
+    'png': (_encode_png, '.png'),
+    'webp': (_encode_webp, '.webp'),
+}
+
+# builtin format name => Pillow format name, for checking that Pillow
+# can actually encode them (WebP is optional in Pillow builds)
+_PILLOW_FORMATS = {
+    'jpeg': 'JPEG',
+    'png': 'PNG',
+    'webp': 'WEBP',
+}
+
+
+def register_format(fmt, encode, suffix):
+    """Register an output format.
+
+    Parameters
+    ----------
+    fmt : str
+        Name of the format. An existing format of the same name is
+        replaced.
+    encode : callable
+        A function ``encode(image, fp, quality, preset)`` that encodes
+        the ``PIL.Image.Image`` object `image` and writes it to `fp`,
+        which is either a path or a binary file object opened for
+        writing. `quality` is an integer between 1 and 100, and `preset`
+        is one of ``'fast'``, ``'balanced'`` and ``'smallest'``.
+    suffix : str
+        Filename suffix (including the leading dot) of the format.
+
+    """
+    _FORMATS[fmt] = (encode, suffix)
+    _PILLOW_FORMATS.pop(fmt, None)
+
+
+def formats():
+    """Return the names of registered output formats.
+
+    Returns
+    -------
+    formats : list
+        Sorted list of format names.
+
+    """
+    return sorted(_FORMATS)
+
+
+def suffix(fmt):
+    """Return the filename suffix of an output format.
+
+    Parameters
+    ----------
+    fmt : str
+        Name of the format.
+
+    Returns
+    -------
+    suffix : str
+        Filename suffix, including the leading dot, e.g., ``'.jpg'``.
+
+    Raises
+    ------
+    ValueError
+        If `fmt` is not recognized, or not supported by the installed
+        Pillow.
+
+    """
+    _check_format(fmt)
+    return _FORMATS[fmt][1]
+
+
+def _check_format(fmt):
+    """Raise ValueError if an output format cannot be encoded."""
+    if fmt not in _FORMATS:
+        raise ValueError("unrecognized output format '%s'" % fmt)
+    pillow_format = _PILLOW_FORMATS.get(fmt)
+    if pillow_format is not None:
+        from PIL import Image
+        Image.init()
+        if pillow_format not in Image.SAVE:
+            raise ValueError("output format '%s' is not supported by the "
+                             "installed Pillow, which was built without %s "
+                             "support" % (fmt, pillow_format))
+
+
+def encode_image(image, fp, fmt, params=None):
+    """Encode an image and write it to a file.
+
+    Parameters
+    ----------
+    image : PIL.Image.Image
+        The image to be encoded.
+    fp : str or file object
+        Path to the output file, or a binary file object opened for
+        writing.
+    fmt : str
+        Output format, one of the registered formats (see `formats`);
+        ``'jpeg'``, ``'png'`` and ``'webp'`` are available out of the
+        box.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Raises
+    ------
+    ValueError
+        If `fmt` or the preset is not recognized, or if `fmt` is not
+        supported by the installed Pillow (see `suffix`).
+
+    Other Parameters
+    ----------------
+    quality : int, optional
+        Quality of the output image, an integer between 1 and 100. Only
+        meaningful for lossy formats (JPEG and WebP). Default is 85.
+    preset : {'fast', 'balanced', 'smallest'}, optional
+        Trade-off between encoding speed and output size. Default is
+        ``'balanced'``.
+
+    Notes
+    -----
+    The presets of the builtin formats are as follows:
+
+    ========  ======================  ================  ================
+    Format    ``fast``                ``balanced``      ``smallest``
+    ========  ======================  ================  ================
+    JPEG      baseline, no Huffman    optimized         smaller of
+              optimization            progressive       optimized
+                                                        progressive and
+                                                        baseline
+    PNG       zlib level 1            optimized (zlib   n/a
+                                      level 9)
+    WebP      method 0                method 4          method 6
+    ========  ======================  ================  ================
+
+    PNG has no ``smallest`` preset of its own, since Pillow cannot
+    compress further than ``balanced``; it is accepted (e.g., along
+    with lossy formats), and encodes as ``balanced``.
+
+    Quality is unaffected by presets, so that the output of a lossy
+    format looks the same no matter which preset is used.
+
+    """
+
+    if params is None:
+        params = {}
+    quality = _read_param(params, 'quality', 85)
+    preset = _read_param(params, 'preset', 'balanced')
+
+    _check_format(fmt)
+    if preset not in PRESETS:
+        raise ValueError("unrecognized encoder preset '%s'" % preset)
+    _FORMATS[fmt][0](image, fp, quality, preset)
+
+
+def encode_images(jobs, params=None):
+    """Encode several images concurrently.
+
+    Encoding is carried out in a pool of threads; Pillow releases the
+    GIL while encoding, so the images are encoded in parallel.
+
+    Parameters
+    ----------
+    jobs : list
+        A list of tuples ``(image, fp, fmt, params)``, each of which is
+        a set of arguments to `encode_image`.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Other Parameters
+    ----------------
+    threads : int, optional
+        Maximum number of threads. If ``None``, use one thread per
+        job. Default is ``None``.
+
+    """
+
+    if params is None:
+        params = {}
+    threads = _read_param(params, 'threads', None)
+
+    if not jobs:
+        return
+    if len(jobs) == 1:
+        encode_image(*jobs[0])
+        return
+    if threads is None:
+        threads = len(jobs)
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(threads, len(jobs)))
+    try:
+        # get() re-raises exceptions from the worker threads
+        pool.map_async(lambda job: encode_image(*job), jobs).get()
+    finally:
+        pool.close()
+        pool.join()
+
+
+class PNGStripWriter(object):
+    """Incremental PNG writer fed with horizontal strips.
+
+    The dimensions of the image are declared upfront, and the image is
+    then written top to bottom in horizontal strips of arbitrary
+    heights. Each strip is compressed and flushed to the output file as
+    soon as it is received, so that memory usage is bounded by the size
+    of the largest strip rather than the size of the whole image. This
+    allows encoding images that are too large to be held in memory (or
+    opened by Pillow) as a whole.
+
+    The output is an 8-bit RGB, non-interlaced PNG image. No scanline
+    filtering is applied.
+
+    Parameters
+    ----------
+    fp : file object
+        A binary file object opened for writing.
+    size : tuple
+        A tuple ``(width, height)`` of the image.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Raises
+    ------
+    ValueError
+        If `size` is not a tuple of two positive integers.
+
+    Other Parameters
+    ----------------
+    compress_level : int, optional
+        zlib compression level, an integer between 0 and 9. Default
+        is 6.
+    chunk_size : int, optional
+        Size (in bytes) of compressed data accumulated before an
+        ``IDAT`` chunk is written. Default is 65536.
+
+    Attributes
+    ----------
+    size : tuple
+    rows_written : int
+        Number of rows written so far.
+
+    """
+
+    def __init__(self, fp, size, params=None):
+        """Initialize the PNGStripWriter class.
+
+        See class docstring for parameters of the constructor.
+
+        """
+
+        if params is None:
+            params = {}
+        compress_level = _read_param(params, 'compress_level', 6)
+        chunk_size = _read_param(params, 'chunk_size', 65536)
+
+        width, height = size
+        if width <= 0 or height <= 0:
+            raise ValueError("invalid image size %dx%d" % (width, height))
+
+        self.size = (width, height)
+        self.rows_written = 0
+        self._fp = fp
+        self._compressor = zlib.compressobj(compress_level)
+        self._chunk_size = chunk_size
+        self._pending = []
+        self._pending_size = 0
+        self._closed = False
+
+        self._fp.write(_PNG_SIGNATURE)
+        # 8-bit depth, color type 2 (truecolor), default compression
+        # and filter methods, no interlace
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB',
+                                               width, height, 8, 2, 0, 0, 0))
+
+    def write(self, strip):
+        """Append a horizontal strip to the image.
+
+        Parameters
+        ----------
+        strip : PIL.Image.Image
+            The strip, whose width should match that of the image. It is
+            converted to RGB if necessary.
+
+        Raises
+        ------
+        ValueError
+            If the width of the strip doesn't match that of the image,
+            or if the strip would overflow the declared height.
+        RuntimeError
+            If the writer has already been closed.
+
+        """
+
+        if self._closed:
+            raise RuntimeError('operation on closed PNGStripWriter')
+
+        width, height = self.size
+        strip_width, strip_height = strip.size
+        if strip_width != width:
+            raise ValueError("strip width %d does not agree with image "
+                             "width %d" % (strip_width, width))
+        if self.rows_written + strip_height > height:
+            raise ValueError("strip of height %d overflows image of height "
+                             "%d (%d rows already written)" %
+                             (strip_height, height, self.rows_written))
+
+        if strip.mode != 'RGB':
+            strip = strip.convert('RGB')
+        data = strip.tobytes()
+        stride = width * 3
+        scanlines = []
+        for row in range(strip_height):
+            # filter type 0 (None) for each scanline
+            scanlines.append(b'\x00')
+            scanlines.append(data[row * stride:(row + 1) * stride])
+        self._queue(self._compressor.compress(b''.join(scanlines)))
+        self.rows_written += strip_height
+
+    def close(self):
+        """Finish the image.
+
+        Flush remaining compressed data and write the ``IEND``
+        chunk. The underlying file object is not closed.
+
+        Raises
+        ------
+        ValueError
+            If fewer rows than the declared height have been written.
+        RuntimeError
+            If the writer has already been closed.
+
+        """
+
+        if self._closed:
+            raise RuntimeError('operation on closed PNGStripWriter')
+        if self.rows_written != self.size[1]:
+            raise ValueError("only %d of %d rows written" %
+                             (self.rows_written, self.size[1]))
+
+        self._queue(self._compressor.flush())
+        self._flush_pending()
+        self._write_chunk(b'IEND', b'')
+        self._closed = True
+
+    def _queue(self, data):
+        """Queue compressed data, flushing full IDAT chunks."""
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        if self._pending_size >= self._chunk_size:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        """Write queued compressed data as an IDAT chunk."""
+        if self._pending_size > 0:
+            self._write_chunk(b'IDAT', b''.join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def _write_chunk(self, chunk_type, data):
+        """Write a PNG chunk."""
+        self._fp.write(struct.pack('>I', len(data)))
+        self._fp.write(chunk_type)
+        self._fp.write(data)
+        crc = zlib.crc32(chunk_type + data) & 0xffffffff
+        self._fp.write(struct.pack('>I', crc))
@@ -1,19 +1,63 @@
 #!/usr/bin/env python3
 
-"""Check existence of ffmpeg and ffprobe.
+"""Check existence and capabilities of ffmpeg and ffprobe.
+
+Results are cached for the lifetime of the process, and on disk (see
+`default_cache_file`), keyed by the path, size and modification time of
+each binary, so that a pipeline running the console scripts thousands of
+times does not launch FFmpeg thousands of times just to validate it.
+
+Classes
+-------
+.. autosummary::
+    Capabilities
 
 Routines
 --------
 .. autosummary::
     guess_bins
     check_bins
+    probe
+    default_cache_file
 
 ----
 
 """
 
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
 import os
+import re
 import subprocess
+import threading
+
+from storyboard.util import read_param as _read_param
+
+
+# binaries that passed check_bins in this process
+_checked_bins = set()
+_checked_bins_lock = threading.Lock()
+
+# (path, size, mtime) => Capabilities, for binaries probed in this
+# process
+_capabilities = {}
+_capabilities_lock = threading.Lock()
+
+CACHE_VERSION = 1
+
+# queries run by probe, mapped to the attributes of Capabilities they
+# populate, and regexes extracting one name from each line of output
+_PROBE_QUERIES = [
+    ('encoders', ['-encoders'], re.compile(r'^ [A-Z.]{6} (\w\S*)')),
+    ('decoders', ['-decoders'], re.compile(r'^ [A-Z.]{6} (\w\S*)')),
+    ('filters', ['-filters'],
+     re.compile(r'^ [A-Z.|]{2,3} +(\w+) +\S*->\S*')),
+    ('pix_fmts', ['-pix_fmts'], re.compile(r'^[A-Z.]{5} (\w+)')),
+    ('options', ['-h', 'full'], re.compile(r'^ *-(\w+)')),
+]
 
 
 def guess_bins():
@@ -34,7 +78,154 @@ def guess_bins():
         return ('ffmpeg', 'ffprobe')
 
 
-def check_bins(bins):
+def default_cache_file():
+    """Return the path of the default on-disk cache.
+
+    The cache is ``$XDG_CACHE_HOME/storyboard/fflocate.json`` (or if
+    ``$XDG_CACHE_HOME`` is not defined,
+    ``~/.cache/storyboard/fflocate.json``).
+
+    """
+    if 'XDG_CACHE_HOME' in os.environ:
+        cache_dir = os.environ['XDG_CACHE_HOME']
+    else:
+        cache_dir = os.path.expanduser('~/.cache')
+    return os.path.join(cache_dir, 'storyboard', 'fflocate.json')
+
+
+class Capabilities(object):
+
+    """Capabilities of an FFmpeg binary, as reported by `probe`.
+
+    Attributes
+    ----------
+    path : str
+        Absolute path of the binary.
+    version : str
+        Version string, e.g., ``'6.0'`` or ``'N-109541-g1a5d2f4'`` (for
+        builds from git).
+    version_info : tuple
+        Leading numeric components of `version`, e.g., ``(6, 0)``;
+        empty for builds from git.
+    encoders, decoders, filters, pix_fmts : frozenset
+        Names of the available encoders, decoders, filters and pixel
+        formats.
+    options : frozenset
+        Names of all options, including codec and format private ones
+        (e.g., ``'skip_frame'`` or ``'read_intervals'``), without the
+        leading dash.
+
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    _SETS = ('encoders', 'decoders', 'filters', 'pix_fmts', 'options')
+
+    def __init__(self, path, version, **kwargs):
+        self.path = path
+        self.version = version
+        match = re.match(r'^n?([0-9]+(?:\.[0-9]+)*)', version)
+        self.version_info = (tuple(int(n) for n in match.group(1).split('.'))
+                             if match else ())
+        for name in self._SETS:
+            setattr(self, name, frozenset(kwargs.get(name, ())))
+
+    def to_dict(self):
+        """Return the capabilities as a JSON serializable dict."""
+        result = {'path': self.path, 'version': self.version}
+        for name in self._SETS:
+            result[name] = sorted(getattr(self, name))
+        return result
+
+    @classmethod
+    def from_dict(cls, dct):
+        """Construct from a dict returned by `to_dict`."""
+        kwargs = dict((name, dct[name]) for name in cls._SETS)
+        return cls(dct['path'], dct['version'], **kwargs)
+
+
+def _resolve(binary):
+    """Return the absolute path of an executable, or None if not found."""
+    if os.path.dirname(binary):
+        candidates = [binary]
+    else:
+        candidates = [os.path.join(directory, binary) for directory in
+                      os.environ.get('PATH', os.defpath).split(os.pathsep)]
+    for candidate in candidates:
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return os.path.abspath(candidate)
+    return None
+
+
+def _cache_key(binary):
+    """Return the key ``(path, size, mtime)`` of a binary, or None."""
+    path = _resolve(binary)
+    if path is None:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (path, stat.st_size, stat.st_mtime)
+
+
+def _load_cache(cache_file):
+    """Load the on-disk cache; return an empty one upon any error."""
+    if cache_file is not None:
+        try:
+            with open(cache_file) as fp:
+                cache = json.load(fp)
+            if (isinstance(cache, dict) and
+                    cache.get('version') == CACHE_VERSION):
+                return cache
+        except (IOError, OSError, ValueError):
+            pass
+    return {'version': CACHE_VERSION, 'binaries': {}}
+
+
+def _cache_entry(cache, key):
+    """Return the entry for key in a cache if not stale, or None."""
+    entry = cache['binaries'].get(key[0])
+    if (entry is not None and entry.get('size') == key[1] and
+            entry.get('mtime') == key[2]):
+        return entry
+    return None
+
+
+def _update_cache(cache_file, key, **fields):
+    """Record fields for the binary identified by key in the cache.
+
+    Failures are ignored, since the cache is just an optimization.
+    Concurrent updates may be lost, which merely means repeated
+    checks.
+
+    """
+    if cache_file is None:
+        return
+    cache = _load_cache(cache_file)
+    entry = _cache_entry(cache, key)
+    if entry is None:
+        entry = {'size': key[1], 'mtime': key[2]}
+        cache['binaries'][key[0]] = entry
+    entry.update(fields)
+    tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+    try:
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with open(tmp_file, 'w') as fp:
+            json.dump(cache, fp, sort_keys=True)
+        if os.name == 'nt' and os.path.exists(cache_file):
+            os.remove(cache_file)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+
+def check_bins(bins, params=None):
     """Check existance of ffmpeg and ffprobe binaries.
 
     Parameters
@@ -49,17 +240,50 @@ def check_bins(bins):
     True
         If check is successful.
 
+    Other Parameters
+    ----------------
+    cache_file : str, optional
+        Path of the on-disk cache, or ``None`` to disable it. Default is
+        the path returned by `default_cache_file`.
+
     Raises
     ------
     OSError
         If check fails.
 
+    Notes
+    -----
+    Successful checks are remembered for the lifetime of the process,
+    so that each binary is only launched once no matter how many times
+    this function is called (e.g., once for every
+    ``storyboard.storyboard.StoryBoard`` object). They are also
+    remembered on disk, keyed by the path, size and modification time of
+    the binary, so that later processes need not launch it at all until
+    it is replaced. Failed checks are not remembered.
+
     """
 
+    if params is None:
+        params = {}
+    cache_file = _read_param(params, 'cache_file', default_cache_file())
+
+    cache = None
     with open(os.devnull, 'wb') as devnull:
         for binary in bins:
             if binary is None:
                 continue
+            with _checked_bins_lock:
+                if binary in _checked_bins:
+                    continue
+            key = _cache_key(binary)
+            if key is not None and cache_file is not None:
+                if cache is None:
+                    cache = _load_cache(cache_file)
+                entry = _cache_entry(cache, key)
+                if entry is not None and entry.get('checked'):
+                    with _checked_bins_lock:
+                        _checked_bins.add(binary)
+                    continue
             try:
                 subprocess.check_call([binary, '-version'],
                                       stdout=devnull, stderr=devnull)
@@ -67,4 +291,104 @@ def check_bins(bins):
                 raise OSError("%s may be corrupted" % binary)
             except OSError:
                 raise OSError("%s not found on PATH" % binary)
+            with _checked_bins_lock:
+                _checked_bins.add(binary)
+            if key is not None:
+                _update_cache(cache_file, key, checked=True)
     return True
+
+
+def probe(binary, params=None):
+    """Probe the capabilities of an FFmpeg binary.
+
+    The version, encoders, decoders, filters, pixel formats and options
+    are queried by running the binary once for each (concurrently), so
+    that callers can choose faster code paths (e.g., a decoder option)
+    where available instead of always using the most portable one.
+
+    Parameters
+    ----------
+    binary : str
+        Name or path of the binary, e.g., ``'ffmpeg'`` or
+        ``'ffprobe'``.
+
+    Returns
+    -------
+    capabilities : Capabilities
+
+    Other Parameters
+    ----------------
+    cache_file : str, optional
+        Path of the on-disk cache, or ``None`` to disable it. Default is
+        the path returned by `default_cache_file`.
+
+    Raises
+    ------
+    OSError
+        If the binary cannot be found or run.
+
+    Notes
+    -----
+    Results are cached like those of `check_bins`, so probing is cheap
+    except for the first time in the lifetime of each binary.
+
+    """
+
+    if params is None:
+        params = {}
+    cache_file = _read_param(params, 'cache_file', default_cache_file())
+
+    key = _cache_key(binary)
+    if key is None:
+        raise OSError("%s not found on PATH" % binary)
+    with _capabilities_lock:
+        if key in _capabilities:
+            return _capabilities[key]
+    entry = _cache_entry(_load_cache(cache_file), key)
+    if entry is not None and 'capabilities' in entry:
+        try:
+            capabilities = Capabilities.from_dict(entry['capabilities'])
+        except (KeyError, TypeError, ValueError):
+            capabilities = None
+    else:
+        capabilities = None
+    if capabilities is None:
+        capabilities = _run_probe(key[0])
+        _update_cache(cache_file, key, checked=True,
+                      capabilities=capabilities.to_dict())
+    with _capabilities_lock:
+        _capabilities[key] = capabilities
+    return capabilities
+
+
+def _run_probe(path):
+    """Probe the binary at path; see `probe`."""
+    queries = [('version', ['-version'], None)] + _PROBE_QUERIES
+    procs = []
+    try:
+        for _, args, _ in queries:
+            procs.append(subprocess.Popen([path, '-hide_banner'] + args,
+                                          stdout=subprocess.PIPE,
+                                          stderr=subprocess.PIPE))
+        outputs = [proc.communicate()[0].decode('utf-8', 'replace')
+                   for proc in procs]
+    except OSError as err:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        raise OSError("failed to run %s: %s" % (path, err))
+    if procs[0].returncode != 0:
+        raise OSError("%s may be corrupted" % path)
+
+    match = re.match(r'^\S+ version (\S+)', outputs[0])
+    version = match.group(1) if match else ''
+    kwargs = {}
+    for (name, _, regex), output in zip(queries[1:], outputs[1:]):
+        names = set()
+        for line in output.splitlines():
+            match = regex.match(line)
+            if match:
+                names.add(match.group(1))
+        kwargs[name] = names
+    return Capabilities(path, version, **kwargs)
@@ -0,0 +1,589 @@
+#!/usr/bin/env python3
+
+"""Perceptual fingerprints of videos, for near-duplicate detection.
+
+The equally spaced frames of a storyboard (see
+``storyboard.storyboard.StoryBoard.gen_frames``) sample a video at
+fixed relative positions, so that two copies of the same video (e.g.,
+re-encoded, rescaled or with a different container) yield visually
+similar frames at each position. Each frame is reduced to a 64-bit
+perceptual hash, and the sequence of hashes forms the signature of the
+video (see ``storyboard.storyboard.StoryBoard.gen_signature``). The
+distance between two signatures is the total Hamming distance of their
+hashes, position by position, which is a metric; signatures can
+therefore be indexed in a BK-tree, which answers "all videos within
+distance r" queries without comparing against every video in the
+catalog. Computing hashes requires NumPy.
+
+Classes
+-------
+.. autosummary::
+    VideoSignature
+    BKTree
+
+Routines
+--------
+.. autosummary::
+    hash_images
+    hamming_distance
+    find_duplicates
+    main
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import binascii
+import json
+import math
+import os
+import sys
+
+from storyboard import fflocate
+from storyboard import util
+from storyboard.util import import_numpy as _import_numpy
+from storyboard.util import read_param as _read_param
+
+
+HASH_METHODS = ('dhash', 'phash')
+
+
+def _pack_bits(np, bits):
+    """Pack an (N, 64) boolean array into a list of N ints."""
+    return [int(binascii.hexlify(row.tobytes()), 16)
+            for row in np.packbits(bits, axis=1)]
+
+
+def hash_images(images, params=None):
+    """Compute 64-bit perceptual hashes of images.
+
+    Each image is converted to grayscale and shrunk with Pillow (which
+    is what dominates the cost); the shrunk images are then stacked and
+    hashed in a single vectorized pass.
+
+    * dHash (difference hash): the image is shrunk to 9x8, and each bit
+      records whether a pixel is brighter than its left neighbor. Fast,
+      and robust to rescaling, recompression and global brightness or
+      contrast changes.
+    * pHash: the image is shrunk to 32x32, and each bit records whether
+      one of the 8x8 lowest frequency coefficients of its 2-D DCT is
+      above the median. Slightly slower, and more robust to gamma
+      changes and mild cropping.
+
+    Parameters
+    ----------
+    images : list
+        A list of ``PIL.Image.Image`` objects, of any sizes.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Returns
+    -------
+    hashes : list
+        A list of ints, one 64-bit hash for each image.
+
+    Raises
+    ------
+    ValueError
+        If the hash method is not recognized.
+    ImportError
+        If NumPy is not installed.
+
+    Other Parameters
+    ----------------
+    method : {'dhash', 'phash'}, optional
+        Hash method. Default is ``'dhash'``.
+
+    """
+    from PIL import Image
+
+    # pylint: disable=invalid-name
+
+    if params is None:
+        params = {}
+    method = _read_param(params, 'method', 'dhash')
+    if method not in HASH_METHODS:
+        raise ValueError("unknown hash method '%s'" % method)
+    if not images:
+        return []
+
+    np = _import_numpy('perceptual hashing')
+    if method == 'dhash':
+        # shape (N, 8, 9)
+        pixels = np.stack([
+            np.asarray(image.convert('L').resize((9, 8), Image.BILINEAR),
+                       dtype=np.int16)
+            for image in images])
+        bits = (pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(-1, 64)
+    else:
+        # shape (N, 32, 32)
+        pixels = np.stack([
+            np.asarray(image.convert('L').resize((32, 32), Image.BILINEAR),
+                       dtype=np.float64)
+            for image in images])
+        # DCT-II matrix; only the 8 lowest frequencies are needed
+        k = np.arange(8)[:, np.newaxis]
+        n = np.arange(32)[np.newaxis, :]
+        dct = np.cos(math.pi * (2 * n + 1) * k / 64)
+        low = np.matmul(np.matmul(dct, pixels), dct.T).reshape(-1, 64)
+        # the DC coefficient (average brightness) is left out of the
+        # median
+        median = np.median(low[:, 1:], axis=1)
+        bits = low > median[:, np.newaxis]
+    return _pack_bits(np, bits)
+
+
+def hamming_distance(hash1, hash2):
+    """Return the number of differing bits of two hashes.
+
+    Parameters
+    ----------
+    hash1, hash2 : int
+
+    Returns
+    -------
+    distance : int
+
+    """
+    return bin(hash1 ^ hash2).count('1')
+
+
+class VideoSignature(object):
+
+    """Perceptual signature of a video.
+
+    Parameters
+    ----------
+    hashes : list
+        List of 64-bit perceptual hashes (ints) of equally spaced frames
+        of the video, in chronological order.
+
+    Attributes
+    ----------
+    hashes : tuple
+
+    Notes
+    -----
+    Signatures are only comparable if they were computed with the same
+    number of frames and the same hash method.
+
+    """
+
+    def __init__(self, hashes):
+        self.hashes = tuple(hashes)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __eq__(self, other):
+        return (isinstance(other, VideoSignature) and
+                self.hashes == other.hashes)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.hashes)
+
+    def __repr__(self):
+        return 'VideoSignature(%r)' % (self.to_string(),)
+
+    def distance(self, other):
+        """Return the distance to another signature.
+
+        The distance is the sum of the Hamming distances of the hashes
+        at each position, between 0 and 64 times the number of frames.
+
+        Parameters
+        ----------
+        other : VideoSignature
+
+        Returns
+        -------
+        distance : int
+
+        Raises
+        ------
+        ValueError
+            If the signatures are not of the same length.
+
+        """
+        if len(self.hashes) != len(other.hashes):
+            raise ValueError("signatures of %d and %d frames are not "
+                             "comparable" % (len(self), len(other)))
+        return sum(hamming_distance(hash1, hash2)
+                   for hash1, hash2 in zip(self.hashes, other.hashes))
+
+    def to_string(self):
+        """Serialize the signature as a string.
+
+        Returns
+        -------
+        string : str
+            Colon-separated hex digests of the hashes.
+
+        """
+        return ':'.join('%016x' % h for h in self.hashes)
+
+    @classmethod
+    def from_string(cls, string):
+        """Deserialize a signature serialized by `to_string`.
+
+        Parameters
+        ----------
+        string : str
+
+        Returns
+        -------
+        signature : VideoSignature
+
+        Raises
+        ------
+        ValueError
+            If the string is malformed.
+
+        """
+        return cls(int(digest, 16) for digest in string.split(':'))
+
+
+class BKTree(object):
+
+    """A Burkhard-Keller tree, for range queries in a metric space.
+
+    Each node stores a key; the children of a node are indexed by their
+    distance to it. By the triangle inequality, a query for keys within
+    distance r of q only needs to descend into children at distance
+    d(q, node) - r through d(q, node) + r from each node visited, which
+    prunes most of the tree for small radii.
+
+    Parameters
+    ----------
+    distance : callable, optional
+        The metric, a function of two keys returning a nonnegative
+        number. If ``None``, keys are `VideoSignature` objects compared
+        with ``VideoSignature.distance``. Default is ``None``.
+
+    """
+
+    def __init__(self, distance=None):
+        if distance is None:
+            distance = VideoSignature.distance
+        self._distance = distance
+        # each node is a list [key, items, children], where children is
+        # a dict mapping distances to nodes
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, key, item=None):
+        """Add a key to the tree.
+
+        Parameters
+        ----------
+        key
+            The key, e.g., a `VideoSignature`.
+        item : optional
+            An arbitrary item associated with the key, e.g., the path of
+            the video, returned by `search`. Items of equal keys are
+            kept together. Default is ``None``.
+
+        """
+        self._size += 1
+        if self._root is None:
+            self._root = [key, [item], {}]
+            return
+        node = self._root
+        while True:
+            dist = self._distance(key, node[0])
+            if dist == 0 and key == node[0]:
+                node[1].append(item)
+                return
+            children = node[2]
+            if dist not in children:
+                children[dist] = [key, [item], {}]
+                return
+            node = children[dist]
+
+    def search(self, key, radius):
+        """Find all keys within a distance of `key`.
+
+        Parameters
+        ----------
+        key
+            The query key.
+        radius : number
+            Maximum distance (inclusive).
+
+        Returns
+        -------
+        results : list
+            A list of tuples ``(distance, key, item)``, sorted by
+            distance.
+
+        """
+        results = []
+        if self._root is None:
+            return results
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            dist = self._distance(key, node[0])
+            if dist <= radius:
+                results.extend((dist, node[0], item) for item in node[1])
+            for child_dist, child in node[2].items():
+                if dist - radius <= child_dist <= dist + radius:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+
+def find_duplicates(signatures, params=None):
+    """Group near-duplicate videos.
+
+    Each signature is looked up in a BK-tree of the signatures before
+    it, and then added to the tree, so that every pair of videos within
+    the threshold is found without comparing all pairs. Videos are
+    grouped transitively, i.e., if A is close to B and B is close to C,
+    A, B and C are grouped together.
+
+    Parameters
+    ----------
+    signatures : list
+        A list of tuples ``(name, signature)``, where ``name`` (e.g.,
+        the path of the video) identifies the video, and ``signature``
+        is a `VideoSignature`. All signatures must be of the same
+        length.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Returns
+    -------
+    groups : list
+        A list of groups of two or more near-duplicate videos, each
+        group being a list of names in the order of `signatures`.
+
+    Other Parameters
+    ----------------
+    threshold : float, optional
+        Maximum average number of differing bits per frame (out of 64)
+        for two videos to be considered near-duplicates. Default is 10.
+
+    """
+
+    if params is None:
+        params = {}
+    threshold = _read_param(params, 'threshold', 10)
+
+    # union-find over indices of signatures
+    parents = list(range(len(signatures)))
+
+    def find(index):
+        """Return the representative of the group of index."""
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    tree = BKTree()
+    for index, (_, signature) in enumerate(signatures):
+        radius = threshold * len(signature)
+        for _, _, other in tree.search(signature, radius):
+            parents[find(index)] = find(other)
+        tree.add(signature, index)
+
+    groups = {}
+    for index in range(len(signatures)):
+        groups.setdefault(find(index), []).append(index)
+    return [[signatures[index][0] for index in members]
+            for members in sorted(groups.values())
+            if len(members) > 1]
+
+
+def _load_index(index_file):
+    """Load an index file, or return an empty index if nonexistent."""
+    if not os.path.exists(index_file):
+        return {}
+    with open(index_file) as fp:
+        return json.load(fp)
+
+
+def _save_index(index, index_file):
+    """Save an index file atomically."""
+    tmp_file = index_file + '.tmp'
+    with open(tmp_file, 'w') as fp:
+        json.dump(index, fp, indent=1, sort_keys=True)
+    os.rename(tmp_file, index_file)
+
+
+def main(argv=None):
+    """CLI interface of ``storyboard dedup``.
+
+    Parameters
+    ----------
+    argv : list, optional
+        Command line arguments (excluding the program name and the
+        ``dedup`` subcommand). If ``None``, use ``sys.argv[2:]``.
+        Default is ``None``.
+
+    Returns
+    -------
+    returncode : int
+        0 on success, 1 if any video could not be fingerprinted.
+
+    """
+
+    # pylint: disable=too-many-locals,too-many-statements
+
+    # imported here to break the circular import between this module and
+    # storyboard.storyboard
+    from storyboard.storyboard import StoryBoard
+
+    if argv is None:
+        argv = sys.argv[2:]
+
+    description = """Find near-duplicate videos (e.g., re-encoded or
+    rescaled copies) by comparing perceptual hashes of equally spaced
+    frames.
+
+    Signatures can be kept in an index file (--index), so that each
+    video is only fingerprinted once, and a catalog can be built up over
+    several runs; videos already in the index are fingerprinted again
+    only if their size or modification time has changed; an index can
+    only be used with the --frames and --method it was built with.
+    Groups of
+    near-duplicates among all indexed and given videos are printed to
+    stdout, one path per line, with groups separated by blank lines
+    (or as a JSON list of lists with --json).
+
+    Options can also be stored in the configuration file of the
+    storyboard command, under the "storyboard-dedup" section."""
+    parser = argparse.ArgumentParser(prog='storyboard dedup',
+                                     description=description)
+    parser.add_argument(
+        '--ffmpeg-bin', metavar='NAME',
+        help="The name/path of the ffmpeg binary.")
+    parser.add_argument(
+        '--ffprobe-bin', metavar='NAME',
+        help="The name/path of the ffprobe binary.")
+    parser.add_argument(
+        '--index', metavar='FILE',
+        help="""Index file to read signatures from and add signatures
+        to (created if nonexistent).""")
+    parser.add_argument(
+        '--frames', type=int, metavar='N',
+        help="Number of frames per signature. Default is 16.")
+    parser.add_argument(
+        '--method', choices=HASH_METHODS,
+        help="Perceptual hash method. Default is dhash.")
+    parser.add_argument(
+        '--threshold', type=float, metavar='BITS',
+        help="""Maximum average number of differing bits per frame (out
+        of 64) for two videos to be considered near-duplicates. Default
+        is 10.""")
+    parser.add_argument(
+        '--json', action='store_const', const=True,
+        help="Print groups as JSON.")
+    parser.add_argument('videos', nargs='*', metavar='VIDEO',
+                        help="Path(s) to the video file(s).")
+    cli_args = parser.parse_args(argv)
+
+    if 'XDG_CONFIG_HOME' in os.environ:
+        config_file = os.path.join(os.environ['XDG_CONFIG_HOME'],
+                                   'storyboard/storyboard.conf')
+    else:
+        config_file = os.path.expanduser(
+            '~/.config/storyboard/storyboard.conf')
+
+    ffmpeg_bin_guessed, ffprobe_bin_guessed = fflocate.guess_bins()
+    defaults = {
+        'ffmpeg_bin': ffmpeg_bin_guessed,
+        'ffprobe_bin': ffprobe_bin_guessed,
+        'index': None,
+        'frames': 16,
+        'method': 'dhash',
+        'threshold': 10,
+        'json': False,
+    }
+    optreader = util.OptionReader(
+        cli_args=cli_args,
+        config_files=config_file,
+        section='storyboard-dedup',
+        defaults=defaults,
+    )
+    bins = (optreader.opt('ffmpeg_bin'), optreader.opt('ffprobe_bin'))
+    index_file = optreader.opt('index')
+    frame_count = optreader.opt('frames', opttype=int)
+    method = optreader.opt('method')
+    threshold = optreader.opt('threshold', opttype=float)
+    json_output = optreader.opt('json', opttype=bool)
+
+    index = {'frames': frame_count, 'method': method, 'videos': {}}
+    if index_file is not None:
+        try:
+            stored_index = _load_index(index_file)
+        except (OSError, IOError, ValueError) as err:
+            sys.stderr.write("fatal error: failed to load index '%s': %s\n"
+                             % (index_file, str(err)))
+            return 1
+        stored_videos = stored_index.get('videos', {})
+        # signatures computed with other settings are not comparable;
+        # refuse to run rather than dropping them when saving the index
+        if stored_videos and (stored_index.get('frames') != frame_count or
+                              stored_index.get('method') != method):
+            sys.stderr.write(
+                "fatal error: index '%s' holds signatures of %s frames "
+                "hashed with %s; use --frames %s --method %s, or another "
+                "index\n" % (index_file, stored_index.get('frames'),
+                              stored_index.get('method'),
+                              stored_index.get('frames'),
+                              stored_index.get('method')))
+            return 1
+        index['videos'] = stored_videos
+
+    returncode = 0
+    for video in cli_args.videos:
+        path = os.path.abspath(video)
+        try:
+            stat = os.stat(path)
+            entry = index['videos'].get(path)
+            if ((entry is not None and entry['size'] == stat.st_size and
+                 entry['mtime'] == stat.st_mtime)):
+                continue
+            sb = StoryBoard(path, params={'bins': bins})
+            signature = sb.gen_signature(params={
+                'frame_count': frame_count,
+                'method': method,
+            })
+            sb.clear_frames()
+        except OSError as err:
+            sys.stderr.write("error: %s: %s\n" % (video, str(err)))
+            returncode = 1
+            continue
+        index['videos'][path] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'signature': signature.to_string(),
+        }
+
+    if index_file is not None:
+        _save_index(index, index_file)
+
+    signatures = [(path, VideoSignature.from_string(entry['signature']))
+                  for path, entry in sorted(index['videos'].items())]
+    groups = find_duplicates(signatures, params={'threshold': threshold})
+    if json_output:
+        print(json.dumps(groups, indent=1))
+    elif groups:
+        print('\n\n'.join('\n'.join(group) for group in groups))
+    return returncode
@@ -6,11 +6,14 @@ Classes
 -------
 .. autosummary::
     Frame
+    FrameStore
 
 Routines
 --------
 .. autosummary::
     extract_frame
+    extract_frames
+    seek_offset
 
 ----
 
@@ -19,13 +22,21 @@ Routines
 from __future__ import absolute_import
 from __future__ import print_function
 
+import bisect
 import io
 import os
+import re
 import subprocess
-
-from PIL import Image
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 from storyboard import fflocate
+from storyboard import scheduler as _scheduler
+from storyboard import subproc as _subproc
+from storyboard.util import Timings as _Timings
 from storyboard.util import read_param as _read_param
 
 
@@ -49,6 +60,7 @@ class Frame(object):
     # pylint: disable=too-few-public-methods
 
     def __init__(self, timestamp, image):
+        from PIL import Image
         assert isinstance(timestamp, int) or isinstance(timestamp, float),\
             "timestamp is not an int or float"
         assert isinstance(image, Image.Image),\
@@ -57,6 +69,103 @@ class Frame(object):
         self.image = image
 
 
+class FrameStore(object):
+    """Collection of frames keyed by seek mode and timestamp.
+
+    Frames are kept sorted by timestamp, so that the frame nearest to
+    any timestamp can be looked up quickly. This allows a new sampling
+    plan (e.g., a different number of thumbnails) to reuse frames that
+    were extracted for a previous plan, as long as they are close
+    enough to the planned timestamps.
+
+    Frames extracted with keyframe seeking (see the `accurate_seek`
+    parameter of `extract_frame`) are kept apart from accurately seeked
+    frames, and only returned by lookups with the same seek mode, so
+    that a request for the frame at a timestamp is never served a frame
+    snapped to a keyframe.
+
+    The store does not own the images of its frames, i.e., they are not
+    closed when frames are removed.
+
+    """
+
+    def __init__(self):
+        """Initialize the FrameStore class."""
+        self.clear()
+
+    def __len__(self):
+        return sum(len(frames) for frames in self._frames.values())
+
+    def __iter__(self):
+        return iter(self._frames[False] + self._frames[True])
+
+    def __contains__(self, frame):
+        return any(stored is frame for stored in self)
+
+    def add(self, frame, keyframe=False):
+        """Add a frame, replacing any frame with the same key.
+
+        Parameters
+        ----------
+        frame : Frame
+        keyframe : bool, optional
+            Whether the frame was extracted with keyframe seeking.
+            Default is ``False``.
+
+        """
+
+        timestamps = self._timestamps[bool(keyframe)]
+        frames = self._frames[bool(keyframe)]
+        index = bisect.bisect_left(timestamps, frame.timestamp)
+        if index < len(timestamps) and timestamps[index] == frame.timestamp:
+            frames[index] = frame
+        else:
+            timestamps.insert(index, frame.timestamp)
+            frames.insert(index, frame)
+
+    def nearest(self, timestamp, tolerance=0.0, keyframe=False):
+        """Look up the frame nearest to a timestamp.
+
+        Parameters
+        ----------
+        timestamp : float
+            Timestamp in seconds.
+        tolerance : float, optional
+            Maximum distance (in seconds) between `timestamp` and the
+            timestamp of the frame returned. Default is 0, i.e., only
+            an exact match is returned.
+        keyframe : bool, optional
+            Whether to look up frames extracted with keyframe seeking
+            instead of accurately seeked frames. Default is ``False``.
+
+        Returns
+        -------
+        frame : Frame
+            The nearest frame, or ``None`` if there is no frame within
+            `tolerance` of `timestamp`.
+
+        """
+
+        timestamps = self._timestamps[bool(keyframe)]
+        index = bisect.bisect_left(timestamps, timestamp)
+        best = None
+        best_distance = None
+        for candidate in (index - 1, index):
+            if 0 <= candidate < len(timestamps):
+                distance = abs(timestamps[candidate] - timestamp)
+                if best_distance is None or distance < best_distance:
+                    best, best_distance = candidate, distance
+        if best is None or best_distance > tolerance:
+            return None
+        return self._frames[bool(keyframe)][best]
+
+    def clear(self):
+        """Remove all frames."""
+        # keyed by whether frames were extracted with keyframe seeking
+        self._timestamps = {False: [], True: []}
+        self._frames = {False: [], True: []}
+
+
 def extract_frame(video_path, timestamp, params=None):
     """Extract a video frame from a given timestamp.
 
@@ -100,8 +209,44 @@ def extract_frame(video_path, timestamp, params=None):
         ``False``. Note that seeking frame by frame is *extremely* slow,
         but accurate. Only use this when the container metadata is wrong
         or missing, so that input seeking produces wrong image.
+    accurate_seek : bool, optional
+        Whether to decode from the keyframe preceding `timestamp` up to
+        `timestamp` (FFmpeg's default). If ``False``, return that
+        keyframe itself, which is much faster for videos with long
+        GOPs; the timestamp of the returned frame is then that of the
+        keyframe. Ignored when `frame_by_frame` is ``True`` or
+        `seek_margin` is given. Default is ``True``.
+    seek_margin : float, optional
+        If not ``None``, seek in two steps (hybrid seeking): input
+        seeking to `seek_margin` seconds before `timestamp`, then
+        output seeking, i.e., decoding frame by frame, up to
+        `timestamp`. Accurate where input seeking overshoots its target
+        (see `seek_offset`), while decoding at most `seek_margin`
+        seconds of video. Ignored when `frame_by_frame` is ``True``.
+        Default is ``None``.
+    threads : int, optional
+        Number of threads FFmpeg may use for decoding (FFmpeg's
+        ``-threads`` input option). If ``None``, let FFmpeg decide,
+        which usually means one thread per CPU core. Default is
+        ``None``.
+    scheduler : storyboard.scheduler.Scheduler, optional
+        Wait for this scheduler to grant the FFmpeg process an I/O slot
+        on the device of the video and a CPU slot, and use the number
+        of threads it grants (see
+        ``storyboard.scheduler.Scheduler.acquire``; `threads` is the
+        number wanted). Default is the scheduler installed for the
+        process with ``storyboard.scheduler.set_scheduler``, if any;
+        pass ``None`` explicitly to disable scheduling.
+    process_limits : storyboard.subproc.Limits, optional
+        Timeout and resource limits of the FFmpeg process. Default is
+        ``None``.
+    timings : storyboard.util.Timings, optional
+        If not ``None``, record the time spent running FFmpeg (seeking
+        and decoding, as ``'frame_seek'``) and decoding its output (as
+        ``'frame_decode'``). Default is ``None``.
 
     """
+    from PIL import Image
 
     if params is None:
         params = {}
@@ -112,33 +257,71 @@ def extract_frame(video_path, timestamp, params=None):
     codec = _read_param(params, 'codec', 'png')
     frame_by_frame = (params['frame_by_frame'] if 'frame_by_frame' in params
                       else False)
+    seek_margin = _read_param(params, 'seek_margin', None)
+    accurate_seek = (_read_param(params, 'accurate_seek', True) or
+                     frame_by_frame or seek_margin is not None)
+    threads = _read_param(params, 'threads', None)
+    scheduler = _read_param(params, 'scheduler', _scheduler.get_scheduler())
+    limits = _read_param(params, 'process_limits', None)
+    timings = _read_param(params, 'timings', None)
+    if timings is None:
+        # discarded
+        timings = _Timings()
 
     if not os.path.exists(video_path):
         raise OSError("video file '%s' does not exist" % video_path)
 
-    ffmpeg_args = [ffmpeg_bin]
-    if frame_by_frame:
-        # output seeking
+    with _scheduler.io_slot(scheduler, video_path), \
+            _scheduler.process_slot(scheduler, threads) as threads:
+        ffmpeg_args = [ffmpeg_bin]
+        if threads is not None:
+            ffmpeg_args += ['-threads', str(threads)]
+        if frame_by_frame:
+            # output seeking
+            ffmpeg_args += [
+                '-i', video_path,
+                '-ss', str(timestamp),
+            ]
+        elif seek_margin is not None:
+            # hybrid seeking
+            start = max(timestamp - seek_margin, 0)
+            ffmpeg_args += [
+                '-ss', str(start),
+                '-i', video_path,
+                '-ss', str(timestamp - start),
+            ]
+        elif accurate_seek:
+            # input seeking
+            ffmpeg_args += [
+                '-ss', str(timestamp),
+                '-i', video_path,
+            ]
+        else:
+            # input seeking, snapped to the preceding keyframe; the
+            # keyframe is timestamped before the seek target, so it
+            # has to be passed through rather than dropped, and its
+            # timestamp is reported by showinfo
+            ffmpeg_args += [
+                '-ss', str(timestamp),
+                '-noaccurate_seek',
+                '-i', video_path,
+                ('-fps_mode' if _supports_option(ffmpeg_bin, 'fps_mode')
+                 else '-vsync'), 'passthrough',
+                '-vf', 'showinfo',
+            ]
         ffmpeg_args += [
-            '-i', video_path,
-            '-ss', str(timestamp),
-        ]
-    else:
-        # input seeking
-        ffmpeg_args += [
-            '-ss', str(timestamp),
-            '-i', video_path,
+            '-f', 'image2',
+            '-vcodec', codec,
+            '-vframes', '1',
+            '-hide_banner',
+            '-',
         ]
-    ffmpeg_args += [
-        '-f', 'image2',
-        '-vcodec', codec,
-        '-vframes', '1',
-        '-hide_banner',
-        '-',
-    ]
-    proc = subprocess.Popen(ffmpeg_args,
-                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    frame_bytes, ffmpeg_err = proc.communicate()
+        with timings.timer('frame_seek'):
+            proc = _subproc.Process(ffmpeg_args, limits=limits,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            frame_bytes, ffmpeg_err = proc.communicate()
+    proc.check_timeout()
     if proc.returncode != 0:
         msg = (("ffmpeg failed to extract frame at time %.2f\n"
                 "ffmpeg error message:\n%s") %
@@ -153,9 +336,388 @@ def extract_frame(video_path, timestamp, params=None):
                (timestamp, ffmpeg_err.strip().decode('utf-8')))
         raise OSError(msg)
 
+    if not accurate_seek:
+        match = _SHOWINFO_PTS_TIME.search(ffmpeg_err.decode('utf-8',
+                                                            'ignore'))
+        if match:
+            # relative to the seek target
+            timestamp = max(timestamp + float(match.group(1)), 0.0)
+
     try:
-        frame_image = Image.open(io.BytesIO(frame_bytes))
+        with timings.timer('frame_decode'):
+            frame_image = Image.open(io.BytesIO(frame_bytes))
+            # decode now rather than lazily upon first use, so that
+            # decoding is not timed as part of a later stage
+            frame_image.load()
     except IOError:
         raise OSError("failed to open frame with PIL.Image.open")
 
     return Frame(timestamp, frame_image)
+
+
+def seek_offset(video_path, timestamp, params=None):
+    """Measure how far input seeking lands from a timestamp.
+
+    FFmpeg's input seeking is fast, but relies on the index of the file
+    (or on bisection by bit rate), which may be inaccurate or missing;
+    it then returns a frame well after the target, or nothing at all.
+    This function seeks to `timestamp` the way `extract_frame` does by
+    default, and reports the timestamp of the first frame decoded
+    (through the ``showinfo`` filter), without encoding it.
+
+    Parameters
+    ----------
+    video_path : str
+        Path to the video file.
+    timestamp : float
+        Timestamp in seconds.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Returns
+    -------
+    offset : float
+        Seconds from `timestamp` to the frame input seeking lands on,
+        i.e., less than the duration of a frame where input seeking is
+        accurate. ``None`` if no frame is decoded.
+
+    Raises
+    ------
+    OSError
+        If video file doesn't exist, or ffmpeg times out.
+
+    Other Parameters
+    ----------------
+    ffmpeg_bin, threads, scheduler, process_limits
+        See `extract_frame`.
+
+    """
+
+    if params is None:
+        params = {}
+    if 'ffmpeg_bin' in params and params['ffmpeg_bin'] is not None:
+        ffmpeg_bin = params['ffmpeg_bin']
+    else:
+        ffmpeg_bin, _ = fflocate.guess_bins()
+    threads = _read_param(params, 'threads', None)
+    scheduler = _read_param(params, 'scheduler', _scheduler.get_scheduler())
+    limits = _read_param(params, 'process_limits', None)
+
+    if not os.path.exists(video_path):
+        raise OSError("video file '%s' does not exist" % video_path)
+
+    with _scheduler.io_slot(scheduler, video_path), \
+            _scheduler.process_slot(scheduler, threads) as threads:
+        ffmpeg_args = [ffmpeg_bin, '-hide_banner', '-nostats']
+        if threads is not None:
+            ffmpeg_args += ['-threads', str(threads)]
+        ffmpeg_args += [
+            '-ss', str(timestamp),
+            '-i', video_path,
+            '-an', '-sn',
+            '-vf', 'showinfo',
+            '-frames:v', '1',
+            '-f', 'null',
+            '-',
+        ]
+        proc = _subproc.Process(ffmpeg_args, limits=limits,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        _, ffmpeg_err = proc.communicate()
+    proc.check_timeout()
+    if proc.returncode != 0:
+        return None
+    match = _SHOWINFO_PTS_TIME.search(ffmpeg_err.decode('utf-8', 'ignore'))
+    if not match:
+        return None
+    # relative to the seek target
+    return float(match.group(1))
+
+
+# bytes of raw pixels read at once by _read_ppm
+_PPM_BAND = 2 ** 18
+
+# pts_time field in the log lines of FFmpeg's showinfo filter
+_SHOWINFO_PTS_TIME = re.compile(
+    r'Parsed_showinfo.*\bpts_time:\s*(-?[0-9.]+(?:[eE][-+]?[0-9]+)?)')
+
+
+def extract_frames(video_path, params=None):
+    """Extract a series of frames in a single decoding pass.
+
+    Unlike `extract_frame`, which launches one FFmpeg process (and
+    seeks) for each frame, this function decodes the video once with a
+    single FFmpeg process, selecting frames with FFmpeg filters (and
+    optionally downscaling them in FFmpeg). Frames are streamed back
+    through a pipe as they are decoded. This is much more efficient
+    when a large number of frames is needed, e.g., one frame every ten
+    seconds.
+
+    The timestamp of each frame is the presentation timestamp reported
+    by FFmpeg (through the ``showinfo`` filter).
+
+    Parameters
+    ----------
+    video_path : str
+        Path to the video file.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Yields
+    ------
+    frame : Frame
+
+    Raises
+    ------
+    OSError
+        If video file doesn't exist, ffmpeg binary doesn't exist or
+        fails to run, or ffmpeg runs but generates no output.
+
+    Other Parameters
+    ----------------
+    ffmpeg_bin : str, optional
+        Name or path of FFmpeg binary. If ``None``, make educated guess
+        using ``storyboard.fflocate.guess_bins``. Default is ``None``.
+    interval : float, optional
+        Extract one frame every `interval` seconds (through FFmpeg's
+        ``fps`` filter), starting from the beginning of the video. If
+        ``None``, extract every frame. Default is ``None``.
+    accurate_interval : bool, optional
+        Whether to extract the first frame at or after each multiple of
+        `interval` (through FFmpeg's ``select`` filter), i.e., the frame
+        `extract_frame` would extract at that timestamp. Otherwise, the
+        ``fps`` filter picks the last frame before each multiple plus
+        half the interval, and duplicates frames if the interval is
+        shorter than that between frames. Default is ``False``.
+    keyframes_only : bool, optional
+        Whether to decode keyframes only (``-skip_frame nokey``, or
+        the ``select`` filter if FFmpeg does not support that option),
+        skipping all other frames, which is many times faster than
+        decoding every frame; `interval` then applies to keyframes.
+        Default is ``False``.
+    size : tuple, optional
+        A tuple ``(width, height)``. If specified, frames are scaled to
+        this size by FFmpeg (through the ``scale`` filter). As with the
+        ``scale`` filter, one of the dimensions may be -2, in which case
+        it is computed from the other one, preserving the aspect ratio
+        (and rounded to an even number). Default is ``None``.
+    start : float, optional
+        Start of the portion of the video to decode, in seconds. The
+        decoder seeks to `start` (input seeking) rather than decoding
+        from the beginning. Timestamps of frames are still relative to
+        the beginning of the video. Default is ``None``.
+    duration : float, optional
+        Duration of the portion of the video to decode, in
+        seconds. If ``None``, decode until the end. Default is
+        ``None``.
+    threads : int, optional
+        Number of threads FFmpeg may use for decoding. If ``None``, let
+        FFmpeg decide. Default is ``None``.
+    scheduler : storyboard.scheduler.Scheduler, optional
+        See `extract_frame`. The slots are held until the generator is
+        exhausted or closed, and the threads granted are used for
+        filtering as well (``-filter_threads``) where supported.
+    process_limits : storyboard.subproc.Limits, optional
+        Timeout and resource limits of the FFmpeg process; the timeout
+        applies to the wait for each frame rather than to the whole
+        pass. Default is ``None``.
+
+    Notes
+    -----
+    Frames are transferred as PPM images, so the consumer does not
+    need to know the dimensions beforehand.
+
+    If the generator is not exhausted (e.g., the consumer breaks out of
+    the loop), the FFmpeg process is killed when the generator is
+    closed or garbage collected.
+
+    """
+
+    if params is None:
+        params = {}
+    if 'ffmpeg_bin' in params and params['ffmpeg_bin'] is not None:
+        ffmpeg_bin = params['ffmpeg_bin']
+    else:
+        ffmpeg_bin, _ = fflocate.guess_bins()
+    interval = _read_param(params, 'interval', None)
+    accurate_interval = _read_param(params, 'accurate_interval', False)
+    keyframes_only = _read_param(params, 'keyframes_only', False)
+    size = _read_param(params, 'size', None)
+    threads = _read_param(params, 'threads', None)
+    scheduler = _read_param(params, 'scheduler', _scheduler.get_scheduler())
+    limits = _read_param(params, 'process_limits', None)
+    start = _read_param(params, 'start', None)
+    duration = _read_param(params, 'duration', None)
+
+    if not os.path.exists(video_path):
+        raise OSError("video file '%s' does not exist" % video_path)
+
+    skip_frame = keyframes_only and _supports_option(ffmpeg_bin, 'skip_frame')
+    filters = []
+    if keyframes_only and not skip_frame:
+        filters.append(r'select=eq(pict_type\,I)')
+    if interval is not None and accurate_interval:
+        filters.append(r'select=gte(t\,selected_n*%r)' % float(interval))
+    elif interval is not None:
+        filters.append('fps=fps=1/%r' % float(interval))
+    if size is not None:
+        filters.append('scale=%d:%d' % tuple(size))
+    filters.append('showinfo')
+
+    with _scheduler.io_slot(scheduler, video_path), \
+            _scheduler.process_slot(scheduler, threads) as threads:
+        ffmpeg_args = [ffmpeg_bin, '-hide_banner', '-nostats']
+        if threads is not None:
+            ffmpeg_args += ['-threads', str(threads)]
+            if scheduler is not None and _supports_option(ffmpeg_bin,
+                                                          'filter_threads'):
+                ffmpeg_args += ['-filter_threads', str(threads)]
+        if start is not None:
+            ffmpeg_args += ['-ss', str(start)]
+        if skip_frame:
+            ffmpeg_args += ['-skip_frame', 'nokey']
+        ffmpeg_args += ['-i', video_path]
+        if duration is not None:
+            ffmpeg_args += ['-t', str(duration)]
+        if keyframes_only or (interval is not None and accurate_interval):
+            # frames selected keep their timestamps; do not fill the
+            # gaps with duplicates
+            ffmpeg_args += [
+                ('-fps_mode' if _supports_option(ffmpeg_bin, 'fps_mode')
+                 else '-vsync'), 'passthrough',
+            ]
+        ffmpeg_args += [
+            '-an', '-sn',
+            '-vf', ','.join(filters),
+            '-f', 'image2pipe',
+            '-vcodec', 'ppm',
+            '-',
+        ]
+        proc = _subproc.Process(ffmpeg_args, limits=limits,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+
+        # stderr is consumed in a separate thread, both to avoid deadlock
+        # and to collect frame timestamps from the showinfo filter
+        timestamps = queue.Queue()
+        error_lines = []
+
+        def read_stderr():
+            """Parse showinfo lines and collect everything else."""
+            for line in iter(proc.stderr.readline, b''):
+                line = line.decode('utf-8', 'ignore')
+                match = _SHOWINFO_PTS_TIME.search(line)
+                if match:
+                    timestamps.put(float(match.group(1)))
+                elif 'Parsed_showinfo' not in line:
+                    error_lines.append(line)
+            timestamps.put(None)
+
+        stderr_reader = threading.Thread(target=read_stderr)
+        stderr_reader.daemon = True
+        stderr_reader.start()
+
+        count = 0
+        try:
+            while True:
+                image = _read_ppm(proc.stdout)
+                if image is None:
+                    break
+                timestamp = timestamps.get()
+                if timestamp is None:
+                    # stderr closed before the timestamp was reported
+                    # (should not happen); keep the sentinel around
+                    timestamps.put(None)
+                    timestamp = 0.0
+                count += 1
+                if start is not None:
+                    # timestamps restart from zero after input seeking
+                    timestamp += start
+                # the consumer may take its time with the frame
+                proc.stop_timeout()
+                yield Frame(max(timestamp, 0.0), image)
+                proc.reset_timeout()
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+            stderr_reader.join()
+            proc.stderr.close()
+
+    proc.check_timeout()
+    if proc.returncode != 0 or count == 0:
+        msg = ("ffmpeg failed to extract frames from '%s'\n"
+               "ffmpeg error message:\n%s" %
+               (video_path, ''.join(error_lines).strip()))
+        raise OSError(msg)
+
+
+def _supports_option(ffmpeg_bin, option):
+    """Return whether an FFmpeg binary supports an option.
+
+    Capabilities are probed (and cached) with
+    ``storyboard.fflocate.probe``; if probing fails, the option is
+    assumed to be unsupported.
+
+    """
+    try:
+        return option in fflocate.probe(ffmpeg_bin).options
+    except OSError:
+        return False
+
+
+def _read_ppm(stream):
+    """Read a binary PPM (P6) image from a stream.
+
+    Returns
+    -------
+    image : PIL.Image.Image
+        Or ``None`` if the stream is exhausted.
+
+    Raises
+    ------
+    OSError
+        If the stream does not contain a well-formed PPM image, or
+        is truncated.
+
+    """
+    from PIL import Image
+
+    # FFmpeg writes the header as 'P6\n<width> <height>\n<maxval>\n'
+    tokens = []
+    while len(tokens) < 4:
+        line = stream.readline()
+        if not line:
+            if tokens:
+                raise OSError("truncated PPM header")
+            return None
+        tokens.extend(line.split())
+    if tokens[0] != b'P6' or tokens[3] != b'255':
+        raise OSError("unexpected PPM header")
+    width, height = int(tokens[1]), int(tokens[2])
+
+    # read a band of rows at a time, so that no more than _PPM_BAND
+    # bytes of a (possibly huge) raw frame are held outside the image
+    image = Image.new('RGB', (width, height))
+    band_rows = max(1, _PPM_BAND // (width * 3))
+    for top in range(0, height, band_rows):
+        rows = min(band_rows, height - top)
+        expected = width * rows * 3
+        chunks = []
+        remaining = expected
+        while remaining > 0:
+            chunk = stream.read(remaining)
+            if not chunk:
+                image.close()
+                raise OSError("truncated PPM image")
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        band = Image.frombytes('RGB', (width, rows), b''.join(chunks))
+        image.paste(band, (0, top))
+        band.close()
+    return image
@@ -26,12 +26,15 @@ from __future__ import print_function
 import argparse
 import fractions
 import hashlib
+import itertools
 import json
 import os
 import subprocess
 import sys
 
 from storyboard import fflocate
+from storyboard import scheduler as _scheduler
+from storyboard import subproc as _subproc
 from storyboard import util
 from storyboard.util import read_param as _read_param
 from storyboard import version
@@ -95,6 +98,20 @@ _SCODEC_MAP = {
     'subrip': 'SubRip'
 }
 
+# seek target beyond the end of any video, landing on its last keyframe
+_DURATION_SEEK_TARGET = 10 ** 9
+# maximum number of packets read after a seek when probing the end of
+# the video stream
+_DURATION_PROBE_PACKETS = 1024
+# maximum number of bisection steps looking for the end of the data when
+# the index points past it (e.g., truncated files)
+_DURATION_BISECTIONS = 8
+# discrepancy (in seconds, and relative to the duration) between the
+# container duration and the end of the video stream above which the
+# container duration is deemed wrong
+_DURATION_TOLERANCE = 1.0
+_DURATION_RELATIVE_TOLERANCE = 0.01
+
 
 class Stream(object):
 
@@ -115,6 +132,10 @@ class Stream(object):
     codec : str
         (Long) name of codec.
 
+    codec_name : str
+        FFmpeg's (short) name of codec, e.g., ``'h264'``. Video streams
+        only.
+
     bit_rate : float
         Bit rate of stream, in bit per second.
 
@@ -169,6 +190,7 @@ class Stream(object):
         self.index = None
         self.type = None
         self.codec = None
+        self.codec_name = None
         self.bit_rate = None
         self.bit_rate_text = None
         self.language_code = None
@@ -213,7 +235,8 @@ class Video(object):
     OSError
         If fails to extract metadata with ffprobe, e.g., if the file is
         not present, or in a format that is not recognized by ffprobe,
-        or if ffprobe cannot be called, etc.
+        or if ffprobe cannot be called or times out (see
+        `process_limits`), etc.
 
     Other Parameters
     ----------------
@@ -226,11 +249,31 @@ class Video(object):
         duration from container metadata. Default is ``None``. This is
         only needed in edge cases where the duration of the video cannot
         be read off from container metadata, or the duration extracted
-        is wrong. See `#3
+        is wrong (and `estimate_duration` cannot fix it). See `#3
         <https://github.com/zmwangx/storyboard/issues/3>`_ for details.
+    estimate_duration : bool, optional
+        Whether to cross-check the container duration against the end
+        of the video stream, read off the timestamps of the last
+        packets (see `sampling_duration`). Costs an extra ffprobe run
+        that reads a bounded number of packets near the end of the
+        file. Ignored if `video_duration` is given. Default is
+        ``True``.
     print_progress : bool, optional
         Whether to print progress information (to stderr). Default is
         False.
+    timings : storyboard.util.Timings, optional
+        Record the time spent in each stage into this object rather
+        than a new one, e.g., to share it with a
+        ``storyboard.storyboard.StoryBoard``. Default is ``None``.
+    scheduler : storyboard.scheduler.Scheduler, optional
+        Run ffprobe (single-threaded), and hash the file, in slots
+        granted by this scheduler (CPU slots, and I/O slots on the
+        device of the video). Default is the scheduler installed for
+        the process with ``storyboard.scheduler.set_scheduler``, if
+        any; pass ``None`` explicitly to disable scheduling.
+    process_limits : storyboard.subproc.Limits, optional
+        Timeout and resource limits of ffprobe processes. Default is
+        ``None``.
     debug : bool, optional
         Print extra debug information. Default is False.
 
@@ -250,6 +293,18 @@ class Video(object):
     duration : float
         Duration of video in seconds.
 
+    container_duration : float
+        Duration found in container metadata, in seconds. Same as
+        `duration`, unless the `video_duration` parameter is given.
+
+    sampling_duration : float
+        Duration over which frames are sampled (e.g., by
+        ``storyboard.storyboard.StoryBoard``), in seconds. Same as
+        `duration`, unless the container duration is missing, or off
+        by more than a second (or 1%) from the end of the video stream,
+        in which case it is the end of the video stream instead (see
+        the `estimate_duration` parameter).
+
     duration_text : str
         Duration as a human readable string, e.g., ``'00:02:53.33'``.
 
@@ -292,6 +347,13 @@ class Video(object):
     streams : list
         A list of Stream objects, containing per-stream metadata.
 
+    timings : storyboard.util.Timings
+        Time spent in each stage of metadata extraction, in seconds:
+        ``'ffprobe'`` (probing format and streams, and the end of the
+        video stream), ``'scan_type'``
+        (decoding frames to determine the scan type) and ``'sha1sum'``
+        (if the SHA-1 digest has been computed).
+
     Notes
     -----
     The unmodified JSON output of ``ffprobe -show_format -show_streams``
@@ -319,7 +381,14 @@ class Video(object):
         else:
             _, ffprobe_bin = fflocate.guess_bins()
         video_duration = _read_param(params, 'video_duration', None)
+        estimate_duration = _read_param(params, 'estimate_duration', True)
         print_progress = _read_param(params, 'print_progress', False)
+        self.timings = _read_param(params, 'timings', None)
+        if self.timings is None:
+            self.timings = util.Timings()
+        self._scheduler = _read_param(params, 'scheduler',
+                                      _scheduler.get_scheduler())
+        self._process_limits = _read_param(params, 'process_limits', None)
 
         self.path = os.path.abspath(video)
         if not os.path.exists(self.path):
@@ -334,16 +403,25 @@ class Video(object):
             sys.stderr.write("Processing %s\n" % self.filename)
             sys.stderr.write("Crunching metadata...\n")
 
-        self._call_ffprobe(ffprobe_bin)
+        with self.timings.timer('ffprobe'):
+            self._call_ffprobe(ffprobe_bin)
 
         self.title = self._get_title()
         self.format = self._get_format()
         self.size, self.size_text = self._get_size()
+        self.container_duration, _ = self._get_duration()
         if video_duration is None:
             self.duration, self.duration_text = self._get_duration()
+            self.sampling_duration = self.duration
+            if estimate_duration:
+                with self.timings.timer('ffprobe'):
+                    duration = self._estimate_duration(ffprobe_bin)
+                if duration is not None:
+                    self.sampling_duration = duration
         else:
             self.duration = video_duration
             self.duration_text = util.humantime(video_duration)
+            self.sampling_duration = video_duration
         self.bit_rate, self.bit_rate_text = self._get_bit_rate()
         self.sha1sum = None  # SHA-1 digest is generated upon request
 
@@ -368,7 +446,11 @@ class Video(object):
             self.scan_type = None
             self.__dp("left StoryBoard.__init__")
             return
-        self.scan_type = self._get_scan_type(ffprobe_bin, print_progress)
+        with _scheduler.io_slot(self._scheduler, self.path), \
+                _scheduler.process_slot(self._scheduler, 1):
+            with self.timings.timer('scan_type'):
+                self.scan_type = self._get_scan_type(ffprobe_bin,
+                                                     print_progress)
         self.__dp("left StoryBoard.__init__")
 
     def format_metadata(self, params=None):
@@ -534,7 +616,8 @@ class Video(object):
         Raises
         ------
         OSError
-            If the ffprobe call returns with nonzero status.
+            If the ffprobe call returns with nonzero status or times
+            out.
 
         """
 
@@ -546,9 +629,14 @@ class Video(object):
             '-hide_banner',
             self.path
         ]
-        proc = subprocess.Popen(ffprobe_args,
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        ffprobe_out, ffprobe_err = proc.communicate()
+        with _scheduler.io_slot(self._scheduler, self.path), \
+                _scheduler.process_slot(self._scheduler, 1):
+            proc = _subproc.Process(ffprobe_args,
+                                    limits=self._process_limits,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            ffprobe_out, ffprobe_err = proc.communicate()
+        proc.check_timeout()
         ffprobe_out = ffprobe_out.decode('utf-8', 'ignore')
         ffprobe_err = ffprobe_err.decode('utf-8', 'ignore')
 
@@ -689,6 +777,140 @@ class Video(object):
             self.__dp("left StoryBoard._get_duration")
             return (None, None)
 
+    def _estimate_duration(self, ffprobe_bin):
+        """Cross-check the container duration with the video stream.
+
+        The end of the first video stream (other than attached
+        pictures) is the end of its last packet, found by seeking past
+        the end of the file, which lands on the last keyframe, and
+        reading at most ``_DURATION_PROBE_PACKETS`` packets from there.
+        If the seek lands past the end of the data (e.g., the index of
+        a truncated file still covers the missing part), the end of the
+        data is bisected between the beginning of the file and the
+        container duration.
+
+        Parameters
+        ----------
+        ffprobe_bin : str
+            Name/path of the ffprobe binary (should be callable).
+
+        Returns
+        -------
+        duration : float
+            The end of the video stream in seconds, if the container
+            duration is missing or wrong; otherwise (or if the end of
+            the video stream cannot be found), ``None``.
+
+        Raises
+        ------
+        OSError
+            If ffprobe times out.
+
+        """
+
+        self.__dp("entered StoryBoard._estimate_duration")
+        for stream in self._ffprobe['streams']:
+            if (stream.get('codec_type') == 'video' and
+                    not stream.get('disposition', {}).get('attached_pic')):
+                index = stream['index']
+                break
+        else:
+            self.__dp("left StoryBoard._estimate_duration")
+            return None
+
+        end = self._probe_stream_end(ffprobe_bin, index,
+                                     _DURATION_SEEK_TARGET)
+        container_duration = self.container_duration
+        if end is None and container_duration:
+            # the end of the data is somewhere before the container
+            # duration; whatever is found is more accurate than that
+            low, high = 0, container_duration
+            for _ in range(_DURATION_BISECTIONS):
+                middle = (low + high) / 2
+                found = self._probe_stream_end(ffprobe_bin, index, middle)
+                if found is None:
+                    high = middle
+                else:
+                    low = middle
+                    end = (found[0], False)
+        self.__dp("left StoryBoard._estimate_duration")
+        if end is None or end[0] <= 0:
+            return None
+        end, truncated = end
+        if container_duration is None:
+            return end
+        tolerance = max(_DURATION_TOLERANCE,
+                        container_duration * _DURATION_RELATIVE_TOLERANCE)
+        if end > container_duration + tolerance or (
+                not truncated and end < container_duration - tolerance):
+            return end
+        return None
+
+    def _probe_stream_end(self, ffprobe_bin, index, target):
+        """Find the end of the packets of a stream after a seek.
+
+        Parameters
+        ----------
+        ffprobe_bin : str
+            Name/path of the ffprobe binary (should be callable).
+        index : int
+            Index of the stream.
+        target : float
+            Seek target, in seconds.
+
+        Returns
+        -------
+        end : (float, bool)
+            The end of the last packet read, in seconds from the start
+            of the file, and whether the read was cut short by the
+            packet limit (in which case the stream ends later). ``None``
+            if no packet could be read after the seek.
+
+        Raises
+        ------
+        OSError
+            If ffprobe times out.
+
+        """
+
+        ffprobe_args = [
+            ffprobe_bin,
+            '-select_streams', str(index),
+            '-read_intervals', '%s%%+#%d' % (target,
+                                             _DURATION_PROBE_PACKETS),
+            '-show_entries', 'packet=pts_time,dts_time,duration_time',
+            '-print_format', 'json',
+            '-hide_banner',
+            self.path,
+        ]
+        with _scheduler.io_slot(self._scheduler, self.path), \
+                _scheduler.process_slot(self._scheduler, 1):
+            proc = _subproc.Process(ffprobe_args,
+                                    limits=self._process_limits,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            ffprobe_out, _ = proc.communicate()
+        proc.check_timeout()
+        if proc.returncode != 0:
+            return None
+        try:
+            packets = json.loads(ffprobe_out.decode('utf-8', 'ignore')).get(
+                'packets', [])
+        except ValueError:
+            return None
+        end = None
+        for packet in packets:
+            timestamp = packet.get('pts_time', packet.get('dts_time'))
+            if timestamp is None:
+                continue
+            packet_end = (float(timestamp) +
+                          float(packet.get('duration_time', 0)))
+            end = packet_end if end is None else max(end, packet_end)
+        if end is None:
+            return None
+        start_time = float(self._ffprobe['format'].get('start_time', 0))
+        return (end - start_time, len(packets) >= _DURATION_PROBE_PACKETS)
+
     def _get_bit_rate(self):
         """Get bit rate of the video.
 
@@ -744,7 +966,9 @@ class Video(object):
 
         if print_progress:
             sys.stderr.write("Computing SHA-1 digest...\n")
-        with open(self.path, 'rb') as video:
+        with _scheduler.io_slot(self._scheduler, self.path), \
+                self.timings.timer('sha1sum'), \
+                open(self.path, 'rb') as video:
             sha1 = hashlib.sha1()
             totalsize = os.path.getsize(self.path)
             chunksize = self._SHA_CHUNK_SIZE
@@ -830,15 +1054,15 @@ class Video(object):
             '-print_format', 'json',
             self.path,
         ]
-        proc = subprocess.Popen(ffprobe_args,
+        proc = _subproc.Process(ffprobe_args, limits=self._process_limits,
                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         lines = iter(proc.stdout.readline, b'')
 
         # skip two lines:
         # {
         #     "frames" : [
-        self.__dp(next(lines).decode('utf-8'), newline=False)
-        self.__dp(next(lines).decode('utf-8'), newline=False)
+        for line in itertools.islice(lines, 2):
+            self.__dp(line.decode('utf-8'), newline=False)
 
         # empty string for incremental storage of json object
         obj_str = ''
@@ -869,6 +1093,9 @@ class Video(object):
                 pass
         if print_progress:
             sys.stderr.write("\n")
+        if proc.returncode is None:
+            proc.communicate()
+        proc.check_timeout()
         if len(objs) < 40:
             # frame count less than 40, either file is audio or file is
             # video but too short
@@ -993,6 +1220,7 @@ class Video(object):
         s.type = "video"
 
         # codec
+        s.codec_name = sdict.get('codec_name')
         if 'codec_name' not in sdict:
             s.codec = "unknown codec"
         elif sdict['codec_name'] in _VCODEC_MAP:
@@ -1293,6 +1521,14 @@ def main():
         nargs='?', const='auto',
         help="""Whether to print progress information to stderr. Default
         is 'auto'.""")
+    parser.add_argument(
+        '--timings', action='store_const', const=True,
+        help="""Print a breakdown of the time spent in each stage of
+        metadata extraction to stderr.""")
+    parser.add_argument(
+        '--timings-json', metavar='FILE',
+        help="""Write the time spent in each stage of metadata
+        extraction to FILE, as JSON.""")
     parser.add_argument(
         '--version', action='version', version=version.__version__)
     cli_args = parser.parse_args()
@@ -1307,6 +1543,7 @@ def main():
         'ffprobe_bin': fflocate.guess_bins()[1],
         'include_sha1sum': False,
         'verbose': 'auto',
+        'timings': False,
     }
 
     optreader = util.OptionReader(
@@ -1321,6 +1558,8 @@ def main():
         # force override
         include_sha1sum = False
     verbose = optreader.opt('verbose')
+    print_timings = optreader.opt('timings', opttype=bool)
+    timings_json = cli_args.timings_json
     if verbose == 'on':
         print_progress = True
     elif verbose == 'off':
@@ -1346,6 +1585,7 @@ def main():
 
     # real stuff happens from here
     returncode = 0
+    timing_reports = []
     for video in cli_args.videos:
         # pylint: disable=invalid-name
         try:
@@ -1369,6 +1609,18 @@ def main():
             sys.stderr.write("\n")
         print(metadata_string)
         print('')
+        timing_reports.append((video, v.timings))
+
+    if print_timings or timings_json is not None:
+        try:
+            util.report_timings(timing_reports, params={
+                'print_breakdown': print_timings,
+                'json_file': timings_json,
+            })
+        except OSError as err:
+            sys.stderr.write("error: failed to write timings: %s\n" %
+                             str(err))
+            returncode = 1
     return returncode
 
 
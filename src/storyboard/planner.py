@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+"""Choose the cheapest way of extracting a set of frames.
+
+Frames at N timestamps of a video can be extracted
+
+* with N input seeks (``'seek'``), each launching FFmpeg, seeking to the
+  keyframe preceding the timestamp and decoding up to the timestamp;
+* with N input seeks snapped to keyframes (``'keyframe_seek'``), each
+  decoding a single frame, if frames at the preceding keyframes are
+  good enough;
+* in a single sequential pass (``'sequential'``), decoding every frame
+  from the first timestamp to the last one and picking frames with
+  FFmpeg's ``select`` filter.
+
+Which one is the fastest depends on the file: a handful of thumbnails of
+a feature film calls for seeks, while many thumbnails of a short clip
+with long GOPs (so that each seek decodes hundreds of frames) call for a
+sequential pass. `plan` estimates the cost of each strategy with a
+simple model fed with ``storyboard.metadata.Video`` metadata (duration,
+bit rate, frame rate, dimension, codec), corrected by the ratios of
+measured to estimated costs of past extractions (see `History`), and
+picks the cheapest one.
+
+Classes
+-------
+.. autosummary::
+    Plan
+    History
+
+Routines
+--------
+.. autosummary::
+    plan
+    get_history
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import math
+import threading
+
+from storyboard.util import read_param as _read_param
+
+
+STRATEGIES = ('seek', 'keyframe_seek', 'sequential')
+
+# pixels decoded per second by a single thread, by codec
+_DECODE_RATES = {
+    'mpeg1video': 8e8,
+    'mpeg2video': 6e8,
+    'mpeg4': 6e8,
+    'msmpeg4v3': 6e8,
+    'h263': 6e8,
+    'wmv3': 4e8,
+    'vc1': 4e8,
+    'h264': 3e8,
+    'vp8': 3e8,
+    'hevc': 2e8,
+    'vp9': 2e8,
+    'av1': 1.2e8,
+    'mjpeg': 2e8,
+    'dnxhd': 2e8,
+    'prores': 1.5e8,
+    'ffv1': 1e8,
+    'png': 5e7,
+    'rawvideo': 5e9,
+}
+_DEFAULT_DECODE_RATE = 2.5e8
+
+# GOP lengths (in frames) assumed when unknown, i.e., the defaults of
+# common encoders; every frame of an intra-only codec is a keyframe
+_GOP_LENGTHS = {
+    'mpeg1video': 15,
+    'mpeg2video': 15,
+    'mpeg4': 12,
+    'vp8': 128,
+    'vp9': 128,
+    'mjpeg': 1,
+    'dnxhd': 1,
+    'prores': 1,
+    'ffv1': 1,
+    'png': 1,
+    'rawvideo': 1,
+}
+_DEFAULT_GOP_LENGTH = 250
+
+_DEFAULT_FRAME_RATE = 25
+_DEFAULT_DIMENSION = (1280, 720)
+
+# seconds to launch FFmpeg and open the file
+_PROCESS_OVERHEAD = 0.04
+# seconds to seek on the storage
+_SEEK_LATENCY = 0.005
+# bytes read per second from the storage
+_IO_THROUGHPUT = 1e8
+# pixels per second encoded to and decoded from PNG (frames extracted by
+# seeking), or piped as PPM (frames of a sequential pass)
+_PNG_RATE = 5e7
+_PPM_RATE = 5e8
+
+# history shared by the whole process
+_history = None
+_history_lock = threading.Lock()
+
+
+class Plan(object):
+
+    """Extraction strategy chosen by `plan`, with the reasons why.
+
+    Attributes
+    ----------
+    strategy : str
+        The cheapest strategy, one of `STRATEGIES`.
+    estimates : dict
+        Maps each candidate strategy to its estimated cost in seconds,
+        corrected with the history of past extractions.
+    model_estimates : dict
+        Same as `estimates`, but not corrected; these are what
+        `History.record` expects.
+    descriptions : dict
+        Maps each candidate strategy to a short description of the work
+        it involves.
+    basis : list
+        Facts and assumptions the estimates are based on, as human
+        readable strings.
+
+    """
+
+    # pylint: disable=too-few-public-methods,too-many-arguments
+
+    def __init__(self, strategy, estimates, model_estimates, descriptions,
+                 basis):
+        self.strategy = strategy
+        self.estimates = estimates
+        self.model_estimates = model_estimates
+        self.descriptions = descriptions
+        self.basis = basis
+
+    def explain(self):
+        """Return a human readable explanation of the plan.
+
+        Returns
+        -------
+        explanation : str
+            Multiple lines: the chosen strategy, the estimated cost of
+            each candidate, and the basis of the estimates.
+
+        """
+        lines = ["extraction strategy: %s" % self.strategy]
+        for strategy in STRATEGIES:
+            if strategy not in self.estimates:
+                continue
+            lines.append("  %-14s ~%.2fs  %s%s" % (
+                strategy, self.estimates[strategy],
+                self.descriptions[strategy],
+                "  (chosen)" if strategy == self.strategy else ""))
+        lines.append("based on: %s" % '; '.join(self.basis))
+        return '\n'.join(lines)
+
+
+class History(object):
+
+    """Ratios of measured to estimated costs of past extractions.
+
+    The cost model is only accurate up to the speed of the machine and
+    its storage; ratios measured on past extractions, smoothed
+    exponentially, correct the estimates of later plans. A strategy
+    that has never been measured is corrected by the geometric mean of
+    the ratios of the other strategies, if any.
+
+    Parameters
+    ----------
+    smoothing : float, optional
+        Weight of the latest measurement, between 0 and 1. Default is
+        0.5.
+
+    """
+
+    def __init__(self, smoothing=0.5):
+        self.smoothing = smoothing
+        self._ratios = {}
+        self._lock = threading.Lock()
+
+    def record(self, strategy, estimated, measured):
+        """Record the cost of an extraction.
+
+        Parameters
+        ----------
+        strategy : str
+        estimated : float
+            Cost estimated by the model, in seconds (see
+            `Plan.model_estimates`).
+        measured : float
+            Actual cost, in seconds.
+
+        """
+        if estimated <= 0 or measured <= 0:
+            return
+        ratio = measured / estimated
+        with self._lock:
+            previous = self._ratios.get(strategy)
+            if previous is not None:
+                ratio = previous + self.smoothing * (ratio - previous)
+            self._ratios[strategy] = ratio
+
+    def factor(self, strategy):
+        """Return the correction factor of a strategy (1 if unknown)."""
+        with self._lock:
+            if strategy in self._ratios:
+                return self._ratios[strategy]
+            if not self._ratios:
+                return 1.0
+            logs = [math.log(ratio) for ratio in self._ratios.values()]
+            return math.exp(sum(logs) / len(logs))
+
+
+def get_history():
+    """Return the `History` shared by the whole process."""
+    global _history  # pylint: disable=global-statement
+    with _history_lock:
+        if _history is None:
+            _history = History()
+        return _history
+
+
+def plan(video, timestamps, params=None):
+    """Choose the cheapest strategy to extract frames at timestamps.
+
+    Parameters
+    ----------
+    video : storyboard.metadata.Video
+    timestamps : list
+        Sorted timestamps of the frames, in seconds; should not be
+        empty.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Returns
+    -------
+    plan : Plan
+
+    Other Parameters
+    ----------------
+    jobs : int, optional
+        Number of seeks run concurrently. Default is 1.
+    threads : int, optional
+        Number of decoding threads of a sequential pass. If ``None``,
+        same as `jobs`. Default is ``None``.
+    keyframe_seek : bool, optional
+        Whether frames at the keyframes preceding the timestamps are
+        acceptable, in which case ``'keyframe_seek'`` is a candidate
+        instead of ``'seek'``. Default is ``False``.
+    strategies : tuple, optional
+        Candidate strategies. If ``None``, ``('seek', 'sequential')`` or
+        ``('keyframe_seek', 'sequential')`` depending on
+        `keyframe_seek`. Default is ``None``.
+    gop : int, optional
+        Length of the GOPs of the video, in frames, if known. If
+        ``None``, assume the default of the usual encoder of the codec.
+        Default is ``None``.
+    history : History, optional
+        History of past extractions correcting the estimates, or
+        ``None`` to use the model alone. Default is the history shared
+        by the process (see `get_history`).
+
+    """
+
+    # pylint: disable=too-many-locals
+
+    if params is None:
+        params = {}
+    jobs = max(1, _read_param(params, 'jobs', 1))
+    threads = _read_param(params, 'threads', None)
+    threads = max(1, threads if threads is not None else jobs)
+    keyframe_seek = _read_param(params, 'keyframe_seek', False)
+    strategies = _read_param(params, 'strategies', None)
+    gop = _read_param(params, 'gop', None)
+    history = _read_param(params, 'history', get_history())
+    if strategies is None:
+        strategies = ('keyframe_seek' if keyframe_seek else 'seek',
+                      'sequential')
+
+    codec = None
+    for stream in video.streams:
+        if stream.type == 'video':
+            codec = stream.codec_name
+            break
+    width, height = (video.dimension if video.dimension is not None
+                     else _DEFAULT_DIMENSION)
+    pixels = width * height
+    fps = video.frame_rate or _DEFAULT_FRAME_RATE
+    duration = video.duration or 0
+    bit_rate = video.bit_rate
+    if not bit_rate and duration > 0 and video.size:
+        bit_rate = video.size * 8 / duration
+    bit_rate = bit_rate or 0
+    gop_known = gop is not None
+    if not gop_known:
+        gop = _GOP_LENGTHS.get(codec, _DEFAULT_GOP_LENGTH)
+    gop = max(1, min(gop, duration * fps))
+
+    # cost of decoding, and of reading, a single frame
+    frame_cost = (pixels / _DECODE_RATES.get(codec, _DEFAULT_DECODE_RATE) +
+                  bit_rate / 8 / fps / _IO_THROUGHPUT)
+    count = len(timestamps)
+    rounds = -(-count // jobs)
+    # frames decoded by an accurate seek, from the preceding keyframe up
+    # to the target, on average
+    seek_frames = (gop + 1) / 2
+
+    model_estimates = {}
+    descriptions = {}
+    for strategy in strategies:
+        if strategy == 'seek':
+            cost = rounds * (_PROCESS_OVERHEAD + _SEEK_LATENCY +
+                             seek_frames * frame_cost + pixels / _PNG_RATE)
+            description = ("%d input seeks decoding ~%d frames each, %d "
+                           "at a time" % (count, seek_frames, jobs))
+        elif strategy == 'keyframe_seek':
+            cost = rounds * (_PROCESS_OVERHEAD + _SEEK_LATENCY +
+                             frame_cost + pixels / _PNG_RATE)
+            description = ("%d input seeks snapped to keyframes, %d at a "
+                           "time" % (count, jobs))
+        elif strategy == 'sequential':
+            frames = (timestamps[-1] - timestamps[0]) * fps + seek_frames
+            cost = (_PROCESS_OVERHEAD + _SEEK_LATENCY +
+                    frames * frame_cost / threads +
+                    count * pixels / _PPM_RATE)
+            description = ("one pass decoding ~%d frames with %d thread%s" %
+                           (frames, threads, "" if threads == 1 else "s"))
+        else:
+            raise ValueError("unrecognized extraction strategy '%s'" %
+                             strategy)
+        model_estimates[strategy] = cost
+        descriptions[strategy] = description
+
+    estimates = {}
+    for strategy, cost in model_estimates.items():
+        estimates[strategy] = (cost * history.factor(strategy)
+                               if history is not None else cost)
+    # ties go to the first candidate
+    chosen = min(strategies, key=lambda strategy: estimates[strategy])
+
+    basis = [
+        "%dx%d %s at %.4g fps%s" % (width, height, codec or "unknown codec",
+                                    fps, "" if video.frame_rate else
+                                    " (assumed)"),
+        "duration %.2fs, %d kb/s" % (duration, bit_rate / 1000),
+        "GOP ~%d frames%s" % (gop, "" if gop_known else
+                              " (assumed for the codec)"),
+    ]
+    if history is not None:
+        factors = ["x%.2f for %s" % (history.factor(strategy), strategy)
+                   for strategy in strategies
+                   if history.factor(strategy) != 1.0]
+        if factors:
+            basis.append("corrected from past runs: " + ', '.join(factors))
+    return Plan(chosen, estimates, model_estimates, descriptions, basis)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""Score video frames by visual quality.
+
+Used to avoid black, blank (e.g., fade to a solid color) and blurry
+frames in storyboards; see the `smart_select` parameter of
+``storyboard.storyboard.StoryBoard.gen_frames``.
+
+This module requires NumPy, which is an optional dependency of this
+package (install with ``pip install storyboard[smart]``). NumPy is only
+imported when scores are actually computed.
+
+Routines
+--------
+.. autosummary::
+    score_images
+    best_image
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from storyboard.util import import_numpy as _import_numpy
+from storyboard.util import read_param as _read_param
+
+
+def score_images(images, params=None):
+    """Score images by visual quality.
+
+    All images are converted to luma and stacked into a single array,
+    so that the statistics of the whole batch are computed in a few
+    vectorized passes. For each image, three statistics are computed:
+
+    * mean luma, which detects (nearly) black or white frames;
+    * luma variance, which detects blank frames of a solid color;
+    * variance of the Laplacian (a discrete second derivative), a
+      standard measure of sharpness, which is low for blurry frames
+      (e.g., in the middle of a dissolve or with motion blur).
+
+    The score is ``log(1 + sharpness) + 0.5 * log(1 + variance)``,
+    minus a penalty of 100 for frames considered dark, bright or blank
+    (see the "Other Parameters" section), so that any regular frame
+    outscores any such frame.
+
+    Parameters
+    ----------
+    images : list
+        A nonempty list of ``PIL.Image.Image`` objects of the same size
+        (at least 3x3). Small images (e.g., 160 pixels wide) are
+        sufficient and much faster to score.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Returns
+    -------
+    scores : list
+        A list of floats, one for each image; higher is better.
+
+    Raises
+    ------
+    ValueError
+        If `images` is empty, or the images are not of the same size.
+    ImportError
+        If NumPy is not installed.
+
+    Other Parameters
+    ----------------
+    dark_threshold : float, optional
+        Frames with mean luma (0--255) below this value are considered
+        dark. Default is 24.
+    bright_threshold : float, optional
+        Frames with mean luma above this value are considered
+        bright. Default is 240.
+    blank_threshold : float, optional
+        Frames with luma standard deviation below this value are
+        considered blank. Default is 8.
+
+    """
+
+    # pylint: disable=invalid-name
+
+    if params is None:
+        params = {}
+    dark_threshold = _read_param(params, 'dark_threshold', 24)
+    bright_threshold = _read_param(params, 'bright_threshold', 240)
+    blank_threshold = _read_param(params, 'blank_threshold', 8)
+
+    if not images:
+        raise ValueError("no images to score")
+    size = images[0].size
+    if any(image.size != size for image in images):
+        raise ValueError("images are not of the same size")
+
+    np = _import_numpy('frame quality scoring')
+    # shape (N, H, W)
+    luma = np.stack([np.asarray(image.convert('L'), dtype=np.float32)
+                     for image in images])
+    mean = luma.mean(axis=(1, 2))
+    variance = luma.var(axis=(1, 2))
+    laplacian = (4 * luma[:, 1:-1, 1:-1] -
+                 luma[:, :-2, 1:-1] - luma[:, 2:, 1:-1] -
+                 luma[:, 1:-1, :-2] - luma[:, 1:-1, 2:])
+    sharpness = laplacian.var(axis=(1, 2))
+
+    scores = np.log1p(sharpness) + 0.5 * np.log1p(variance)
+    bad = ((mean < dark_threshold) | (mean > bright_threshold) |
+           (variance < blank_threshold ** 2))
+    scores = scores - 100 * bad
+    return [float(score) for score in scores]
+
+
+def best_image(images, params=None):
+    """Return the index of the best image.
+
+    Parameters
+    ----------
+    images : list
+        See `score_images`.
+    params : dict, optional
+        See `score_images`.
+
+    Returns
+    -------
+    index : int
+        Index of the image with the highest score; the first one in case
+        of a tie.
+
+    Raises
+    ------
+    ValueError
+        If `images` is empty, or the images are not of the same size.
+    ImportError
+        If NumPy is not installed.
+
+    """
+
+    scores = score_images(images, params=params)
+    return max(range(len(scores)), key=lambda i: (scores[i], -i))
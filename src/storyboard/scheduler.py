@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+
+"""Share CPUs and disks among FFmpeg, ffprobe and hashing jobs.
+
+Without coordination, every FFmpeg process picks its own number of
+threads (usually one per core), so running several storyboards or
+concurrent extractions at once results in many times more decoder
+threads than cores, all fighting for them. A `Scheduler` owns a budget
+of CPUs: it limits how many FFmpeg processes run at once, and tells each
+one how many threads to use (``-threads``, and ``-filter_threads`` where
+filters are involved), so that the total never exceeds the budget.
+
+A scheduler may also cap the number of concurrent I/O heavy jobs (frame
+extraction, probing, hashing) per storage device, identified by the
+``st_dev`` of the files read: many parallel seeks wreck the throughput
+of a spinning disk, while an SSD needs many to be saturated. Caps are
+configured per mount point (see `parse_io_limits`).
+
+Functions launching FFmpeg or ffprobe (``storyboard.frame`` and
+``storyboard.metadata``) accept a ``scheduler`` parameter, and otherwise
+use the scheduler installed for the process with `set_scheduler`, if
+any. ``storyboard.batch.run`` installs one shared by all its worker
+processes.
+
+Classes
+-------
+.. autosummary::
+    Scheduler
+
+Routines
+--------
+.. autosummary::
+    set_scheduler
+    get_scheduler
+    process_slot
+    io_slot
+    parse_io_limits
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import contextlib
+import os
+import threading
+
+
+# scheduler installed for this process
+_installed = None
+
+# maximum number of devices with I/O jobs in flight at the same time;
+# jobs on further devices are not limited
+_MAX_DEVICES = 64
+
+
+class Scheduler(object):
+
+    """CPU budget and per-device I/O caps shared by FFmpeg processes.
+
+    Parameters
+    ----------
+    cpus : int, optional
+        Total number of threads of all concurrently running FFmpeg
+        processes. If ``None``, use the number of CPUs of the
+        machine. Default is ``None``.
+    processes : int, optional
+        Maximum number of concurrently running FFmpeg processes. If
+        ``None``, same as `cpus`, i.e., at full load each process is
+        single-threaded, which usually maximizes throughput (decoding is
+        parallelized across processes rather than within them). Default
+        is ``None``.
+    io_limits : dict, optional
+        Maps mount points (or any path on the device) to the maximum
+        number of concurrent I/O jobs on the device. Default is
+        ``None``, i.e., no device specific caps.
+    io_limit : int, optional
+        Maximum number of concurrent I/O jobs on devices not in
+        `io_limits`. If ``None``, unlimited. Default is ``None``.
+    shared : bool, optional
+        Whether to keep the state in shared memory, so that the
+        scheduler can be used from several processes (passed to them
+        upon creation, e.g., through the initializer of a
+        ``multiprocessing.Pool``). Default is ``False``.
+
+    Raises
+    ------
+    ValueError
+        If `cpus`, `processes` or an I/O cap is not positive, or a
+        mount point in `io_limits` does not exist.
+
+    Attributes
+    ----------
+    cpus : int
+    processes : int
+    io_limit : int
+
+    """
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, cpus=None, processes=None, io_limits=None,
+                 io_limit=None, shared=False):
+        import multiprocessing
+
+        if cpus is None:
+            cpus = multiprocessing.cpu_count()
+        if processes is None:
+            processes = cpus
+        if cpus < 1:
+            raise ValueError("CPU budget should be a positive integer; "
+                             "%s received instead" % cpus)
+        if processes < 1:
+            raise ValueError("number of FFmpeg processes should be a "
+                             "positive integer; %s received instead" %
+                             processes)
+        self.cpus = cpus
+        self.processes = processes
+        # st_dev => cap
+        self._io_limits = {}
+        for mount_point, limit in (io_limits or {}).items():
+            _check_io_limit(limit)
+            try:
+                self._io_limits[os.stat(mount_point).st_dev] = limit
+            except OSError:
+                raise ValueError("mount point '%s' does not exist" %
+                                 mount_point)
+        if io_limit is not None:
+            _check_io_limit(io_limit)
+        self.io_limit = io_limit
+        # [running processes, threads in use]; devices with jobs in
+        # flight, and the number of their jobs (a device entry is free
+        # when its count drops to zero)
+        if shared:
+            self._cond = multiprocessing.Condition()
+            self._usage = multiprocessing.RawArray('i', 2)
+            self._io_devices = multiprocessing.RawArray('Q', _MAX_DEVICES)
+            self._io_counts = multiprocessing.RawArray('i', _MAX_DEVICES)
+        else:
+            self._cond = threading.Condition()
+            self._usage = [0, 0]
+            self._io_devices = [0] * _MAX_DEVICES
+            self._io_counts = [0] * _MAX_DEVICES
+
+    def acquire(self, threads=None):
+        """Wait until another FFmpeg process may be launched.
+
+        Parameters
+        ----------
+        threads : int, optional
+            Number of threads wanted. If ``None``, ask for an equal
+            share of the budget, ``cpus // processes``. Default is
+            ``None``.
+
+        Returns
+        -------
+        threads : int
+            Number of threads granted, to be passed to FFmpeg. This is
+            the number wanted, capped by the number of CPUs left in the
+            budget, and at least one.
+
+        Notes
+        -----
+        Every successful call must be paired with a call to `release`;
+        prefer `slot`.
+
+        """
+        if threads is None:
+            threads = self.cpus // self.processes
+        threads = max(1, min(threads, self.cpus))
+        with self._cond:
+            while (self._usage[0] >= self.processes or
+                   self._usage[1] >= self.cpus):
+                self._cond.wait()
+            threads = min(threads, self.cpus - self._usage[1])
+            self._usage[0] += 1
+            self._usage[1] += threads
+        return threads
+
+    def release(self, threads):
+        """Return the resources granted by `acquire`."""
+        with self._cond:
+            self._usage[0] -= 1
+            self._usage[1] -= threads
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, threads=None):
+        """Context manager around `acquire` and `release`.
+
+        Yields the number of threads granted.
+
+        """
+        granted = self.acquire(threads)
+        try:
+            yield granted
+        finally:
+            self.release(granted)
+
+    def usage(self):
+        """Return ``(processes, threads)`` currently in use."""
+        with self._cond:
+            return (self._usage[0], self._usage[1])
+
+    def io_acquire(self, path):
+        """Wait until another I/O job may read from the device of path.
+
+        Returns
+        -------
+        token
+            To be passed to `io_release`.
+
+        Notes
+        -----
+        Every call must be paired with a call to `io_release`; prefer
+        `io_slot`. Jobs on files that cannot be stat'ed are not limited
+        (they are bound to fail anyway).
+
+        """
+        try:
+            device = os.stat(path).st_dev
+        except OSError:
+            return None
+        limit = self._io_limits.get(device, self.io_limit)
+        if limit is None:
+            return None
+        with self._cond:
+            while True:
+                index = self._io_index(device)
+                if index is None:
+                    # too many devices busy; do not limit
+                    return None
+                if self._io_counts[index] < limit:
+                    self._io_devices[index] = device
+                    self._io_counts[index] += 1
+                    return index
+                self._cond.wait()
+
+    def io_release(self, token):
+        """Release a slot acquired with `io_acquire`."""
+        if token is None:
+            return
+        with self._cond:
+            self._io_counts[token] -= 1
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def io_slot(self, path):
+        """Context manager around `io_acquire` and `io_release`."""
+        token = self.io_acquire(path)
+        try:
+            yield
+        finally:
+            self.io_release(token)
+
+    def io_usage(self, path):
+        """Return the number of I/O jobs in flight on the device of path."""
+        device = os.stat(path).st_dev
+        with self._cond:
+            for index in range(_MAX_DEVICES):
+                if (self._io_counts[index] > 0 and
+                        self._io_devices[index] == device):
+                    return self._io_counts[index]
+            return 0
+
+    def _io_index(self, device):
+        """Index of the entry of device, or of a free one, or None.
+
+        Must be called with the lock held.
+
+        """
+        free = None
+        for index in range(_MAX_DEVICES):
+            if self._io_counts[index] > 0:
+                if self._io_devices[index] == device:
+                    return index
+            elif free is None:
+                free = index
+        return free
+
+
+def _check_io_limit(limit):
+    """Raise ValueError if an I/O cap is not a positive integer."""
+    if limit < 1:
+        raise ValueError("I/O concurrency cap should be a positive "
+                         "integer; %s received instead" % limit)
+
+
+def set_scheduler(scheduler):
+    """Install a scheduler for this process (``None`` to uninstall)."""
+    global _installed  # pylint: disable=global-statement
+    _installed = scheduler
+
+
+def get_scheduler():
+    """Return the scheduler installed for this process, or ``None``."""
+    return _installed
+
+
+@contextlib.contextmanager
+def process_slot(scheduler, threads=None):
+    """Context manager for running an FFmpeg process under a scheduler.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        Or ``None`` for no scheduling, in which case the slot is granted
+        right away.
+    threads : int, optional
+        Number of threads wanted; see `Scheduler.acquire`. Default is
+        ``None``.
+
+    Yields
+    ------
+    threads : int
+        Number of threads the process should use, or `threads` itself
+        (possibly ``None``, i.e., let FFmpeg decide) if `scheduler` is
+        ``None``.
+
+    """
+    if scheduler is None:
+        yield threads
+    else:
+        with scheduler.slot(threads) as granted:
+            yield granted
+
+
+@contextlib.contextmanager
+def io_slot(scheduler, path):
+    """Context manager for an I/O job reading path under a scheduler.
+
+    Waits until the number of I/O jobs on the device of path is below
+    its cap (see `Scheduler`). If `scheduler` is ``None``, proceeds
+    right away.
+
+    """
+    if scheduler is None:
+        yield
+    else:
+        with scheduler.io_slot(path):
+            yield
+
+
+def parse_io_limits(spec):
+    """Parse a specification of per-device I/O caps.
+
+    Parameters
+    ----------
+    spec : str
+        Comma separated entries, each either ``MOUNT_POINT=N`` (at most
+        N concurrent I/O jobs on the device of MOUNT_POINT), or a bare
+        ``N`` (the cap of the other devices), e.g.,
+        ``'/mnt/hdd=1,/mnt/ssd=16,4'``.
+
+    Returns
+    -------
+    io_limits : dict
+        Maps mount points to caps; see `Scheduler`.
+    io_limit : int
+        The cap of the other devices, or ``None`` if not given.
+
+    Raises
+    ------
+    ValueError
+        If the specification is malformed.
+
+    """
+    io_limits = {}
+    io_limit = None
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        mount_point, sep, limit = entry.rpartition('=')
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("invalid I/O cap '%s'" % entry)
+        if sep:
+            io_limits[os.path.expanduser(mount_point.strip())] = limit
+        else:
+            io_limit = limit
+    return io_limits, io_limit
@@ -0,0 +1,809 @@
+#!/usr/bin/env python3
+
+"""Serve storyboards over HTTP from a long-running process.
+
+Launching the ``storyboard`` command for every storyboard pays the
+price of Python startup, font loading and ffmpeg/ffprobe checks each
+time, and throws away the probed metadata and extracted frames
+afterwards. The server defined here keeps all of those warm, and
+serves generation requests from a bounded work queue with two priority
+tiers (interactive and batch).
+
+HTTP API
+--------
+``POST /storyboard``
+    Generate a storyboard. The request body is a JSON object with the
+    following keys (only ``video`` is required):
+
+    - ``video``: path to the video file (on the server's filesystem);
+    - ``output_format``: ``'jpeg'`` (default), ``'png'``, ``'webp'``;
+    - ``priority``: ``'interactive'`` (default) or ``'batch'``;
+    - ``quality``, ``preset``: see ``storyboard.encoder.encode_image``;
+    - ``video_duration``: see ``storyboard.storyboard.StoryBoard``;
+    - ``deadline``: time budget in seconds, counted from the arrival of
+      the request (time spent in the queue included); see
+      ``storyboard.storyboard.StoryBoard.gen_storyboard``;
+    - any of ``background_color``, ``section_spacing``, ``margins``,
+      ``tile``, ``tile_spacing``, ``thumbnail_width``,
+      ``thumbnail_aspect_ratio``, ``draw_timestamp``,
+      ``timestamp_align``, ``text_color``, ``line_spacing``,
+      ``include_sha1sum``, ``include_promotional_banner``,
+      ``keyframe_seek`` and ``keyframes_only``: see
+      ``storyboard.storyboard.StoryBoard.gen_storyboard``.
+
+    The response is the encoded image. If degradations were applied to
+    meet the deadline, they are listed in an
+    ``X-Storyboard-Degradations`` header, separated by semicolons.
+    Errors are reported as JSON objects ``{"error": message}``, with
+    status 400 for malformed requests, 404 for nonexistent videos, 500
+    for generation failures, and 503 (with a ``Retry-After`` header)
+    when the queue of the requested tier is full.
+
+``GET /status``
+    Return a JSON object with the number of pending requests in each
+    tier, the number of workers, and the number of cached videos.
+
+Classes
+-------
+.. autosummary::
+    StoryBoardServer
+    WorkQueue
+
+Routines
+--------
+.. autosummary::
+    main
+
+----
+
+"""
+
+# pylint: disable=too-many-instance-attributes
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import os
+import socket
+import sys
+import threading
+import time
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    import socketserver
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    import SocketServer as socketserver
+
+from storyboard import encoder as _encoder
+from storyboard import fflocate
+from storyboard import metadata
+from storyboard import scheduler as _scheduler
+from storyboard import storyboard as _storyboard
+from storyboard import subproc as _subproc
+from storyboard import util
+from storyboard.util import read_param as _read_param
+from storyboard import version
+
+
+# request keys passed through to StoryBoard.gen_storyboard
+_GEN_PARAMS = (
+    'background_color',
+    'section_spacing',
+    'margins',
+    'tile',
+    'tile_spacing',
+    'thumbnail_width',
+    'thumbnail_aspect_ratio',
+    'draw_timestamp',
+    'timestamp_align',
+    'text_color',
+    'line_spacing',
+    'include_sha1sum',
+    'include_promotional_banner',
+    'keyframe_seek',
+    'keyframes_only',
+)
+
+# JSON turns tuples into lists
+_TUPLE_PARAMS = ('margins', 'tile', 'tile_spacing')
+
+_CONTENT_TYPES = {
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'webp': 'image/webp',
+}
+
+
+class WorkQueue(object):
+    """Bounded work queue with two priority tiers.
+
+    Items in the ``'interactive'`` tier are always handed out before
+    items in the ``'batch'`` tier; within a tier, items are handed out
+    in FIFO order. Each tier has its own capacity, so that a flood of
+    batch requests can never crowd out interactive ones; once a tier is
+    full, further items are rejected immediately (backpressure) rather
+    than queued indefinitely.
+
+    Parameters
+    ----------
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Other Parameters
+    ----------------
+    interactive_size : int, optional
+        Capacity of the interactive tier. Default is 16.
+    batch_size : int, optional
+        Capacity of the batch tier. Default is 64.
+
+    """
+
+    TIERS = ('interactive', 'batch')
+
+    def __init__(self, params=None):
+        """Initialize the WorkQueue class.
+
+        See class docstring for parameters of the constructor.
+
+        """
+
+        if params is None:
+            params = {}
+        self._capacity = {
+            'interactive': _read_param(params, 'interactive_size', 16),
+            'batch': _read_param(params, 'batch_size', 64),
+        }
+        self._queues = dict((tier, collections.deque()) for tier in self.TIERS)
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item, tier='interactive'):
+        """Enqueue an item without blocking.
+
+        Parameters
+        ----------
+        item
+            The item.
+        tier : {'interactive', 'batch'}, optional
+            Priority tier. Default is ``'interactive'``.
+
+        Returns
+        -------
+        accepted : bool
+            ``False`` if the tier is full (or the queue is closed), in
+            which case the item is not enqueued.
+
+        Raises
+        ------
+        ValueError
+            If `tier` is not recognized.
+
+        """
+
+        if tier not in self.TIERS:
+            raise ValueError("unrecognized priority tier '%s'" % tier)
+        with self._cond:
+            if self._closed or len(self._queues[tier]) >= self._capacity[tier]:
+                return False
+            self._queues[tier].append(item)
+            self._cond.notify()
+            return True
+
+    def get(self):
+        """Dequeue an item, blocking until one is available.
+
+        Returns
+        -------
+        item
+            The item, or ``None`` if the queue has been closed and
+            drained.
+
+        """
+
+        with self._cond:
+            while True:
+                for tier in self.TIERS:
+                    if self._queues[tier]:
+                        return self._queues[tier].popleft()
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+    def close(self):
+        """Close the queue.
+
+        No more items are accepted; items already enqueued are still
+        handed out, after which `get` returns ``None``.
+
+        """
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def pending(self):
+        """Return the number of pending items in each tier.
+
+        Returns
+        -------
+        pending : dict
+            A dict mapping tier names to numbers of pending items.
+
+        """
+
+        with self._cond:
+            return dict((tier, len(queue))
+                        for tier, queue in self._queues.items())
+
+
+class _Job(object):
+    """A storyboard generation request, waited upon by an HTTP handler."""
+
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, video, output_format, params, deadline=None):
+        self.video = video
+        self.output_format = output_format
+        self.params = params
+        # absolute time by which the storyboard is due, or None
+        self.due = time.time() + deadline if deadline is not None else None
+        self.data = None
+        self.error = None
+        self.degradations = []
+        self.done = threading.Event()
+
+
+class StoryBoardServer(object):
+    """HTTP server generating storyboards with warm state.
+
+    The following state is kept across requests:
+
+    - ffmpeg and ffprobe are checked once, at startup;
+    - fonts are loaded once for each worker thread;
+    - ``storyboard.storyboard.StoryBoard`` objects, which hold the
+      probed metadata and the extracted frames of a video, are kept in
+      an LRU cache keyed by the path, size and modification time of the
+      video, so that repeated requests for the same video (e.g., with
+      a different layout or format) skip probing and frame extraction
+      when possible.
+
+    Requests are served by a fixed number of worker threads from a
+    `WorkQueue`. See the module docstring for the HTTP API.
+
+    Parameters
+    ----------
+    address : tuple or str
+        Either a tuple ``(host, port)`` to listen on (use port 0 to
+        pick a free port), or the path of a Unix domain socket.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Raises
+    ------
+    OSError
+        If ffmpeg or ffprobe does not exist or seems corrupted, or the
+        address cannot be bound.
+    ValueError
+        If `cpu_budget`, `ffmpeg_processes` or an I/O cap is not
+        positive, or a mount point in `io_limits` does not exist.
+
+    Other Parameters
+    ----------------
+    bins : tuple, optional
+        A tuple ``(ffmpeg_bin, ffprobe_bin)``. If ``None``, guess with
+        ``storyboard.fflocate.guess_bins``. Default is ``None``.
+    workers : int, optional
+        Number of worker threads, i.e., the maximum number of
+        storyboards generated concurrently. Default is 2.
+    cpu_budget : int, optional
+        Total number of CPUs used by FFmpeg and ffprobe processes of all
+        workers (see ``storyboard.scheduler.Scheduler``). If ``None``,
+        use the number of CPUs of the machine. Default is ``None``.
+    ffmpeg_processes : int, optional
+        Maximum number of FFmpeg and ffprobe processes running at once,
+        each with ``cpu_budget // ffmpeg_processes`` threads. If
+        ``None``, same as `cpu_budget`. Default is ``None``.
+    io_limits : dict, optional
+        Maps mount points to the maximum number of concurrent I/O jobs
+        on their devices; see ``storyboard.scheduler.Scheduler``.
+        Default is ``None``.
+    io_limit : int, optional
+        Maximum number of concurrent I/O jobs on other devices. If
+        ``None``, unlimited. Default is ``None``.
+    process_limits : storyboard.subproc.Limits, optional
+        Timeout and resource limits of FFmpeg and ffprobe processes; a
+        request whose processes exceed them fails with status 500.
+        Default is ``None``.
+    interactive_size : int, optional
+        Capacity of the interactive tier of the work queue. Default is
+        16.
+    batch_size : int, optional
+        Capacity of the batch tier of the work queue. Default is 64.
+    cache_size : int, optional
+        Maximum number of videos whose metadata and frames are
+        cached. Default is 8.
+    verbose : bool, optional
+        Whether to log requests to stderr. Default is ``False``.
+
+    Attributes
+    ----------
+    server_address
+        The address the server is bound to, e.g., ``('127.0.0.1',
+        8000)``, or the path of the Unix domain socket.
+
+    """
+
+    def __init__(self, address, params=None):
+        """Initialize the StoryBoardServer class.
+
+        See class docstring for parameters of the constructor.
+
+        """
+
+        if params is None:
+            params = {}
+        bins = _read_param(params, 'bins', None)
+        if bins is None:
+            bins = fflocate.guess_bins()
+        workers = _read_param(params, 'workers', 2)
+        self._cache_size = _read_param(params, 'cache_size', 8)
+        self._verbose = _read_param(params, 'verbose', False)
+        self._process_limits = _read_param(params, 'process_limits', None)
+        self._scheduler = _scheduler.Scheduler(
+            cpus=_read_param(params, 'cpu_budget', None),
+            processes=_read_param(params, 'ffmpeg_processes', None),
+            io_limits=_read_param(params, 'io_limits', None),
+            io_limit=_read_param(params, 'io_limit', None))
+
+        fflocate.check_bins(bins)
+        self._bins = bins
+        self._queue = WorkQueue(params=params)
+        # (path, size, mtime, video_duration) => [StoryBoard, Lock]
+        self._cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        if isinstance(address, tuple):
+            self._httpd = _ThreadingHTTPServer(address, _RequestHandler)
+        else:
+            if not hasattr(socket, 'AF_UNIX'):
+                raise OSError("Unix domain sockets are not supported on "
+                              "this platform")
+            self._httpd = _ThreadingUnixHTTPServer(address, _RequestHandler)
+        self._httpd.storyboard_server = self
+        self.server_address = self._httpd.server_address
+
+        self._workers = []
+        for _ in range(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def serve_forever(self):
+        """Serve requests until `shutdown` is called."""
+        self._httpd.serve_forever()
+
+    def shutdown(self):
+        """Stop serving, finish pending requests, and release resources.
+
+        Must be called from a thread other than the one running
+        `serve_forever`.
+
+        """
+
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._queue.close()
+        for worker in self._workers:
+            worker.join()
+        if not isinstance(self.server_address, tuple):
+            try:
+                os.remove(self.server_address)
+            except OSError:
+                pass
+
+    def status(self):
+        """Return the status of the server.
+
+        Returns
+        -------
+        status : dict
+            A dict with keys ``'pending'`` (see `WorkQueue.pending`),
+            ``'workers'`` and ``'cached_videos'``.
+
+        """
+
+        with self._cache_lock:
+            cached_videos = len(self._cache)
+        return {
+            'pending': self._queue.pending(),
+            'workers': len(self._workers),
+            'cached_videos': cached_videos,
+        }
+
+    def submit(self, request):
+        """Submit a storyboard generation request.
+
+        Parameters
+        ----------
+        request : dict
+            A request, as described in the module docstring.
+
+        Returns
+        -------
+        job : _Job
+            The accepted job, to be waited upon through its ``done``
+            event; or ``None`` if the tier is full.
+
+        Raises
+        ------
+        ValueError
+            If the request is malformed.
+
+        """
+
+        if not isinstance(request, dict):
+            raise ValueError("request should be a JSON object")
+        video = request.get('video')
+        # JSON strings are unicode on Python 2
+        if not isinstance(video, (str, type(u''))):
+            raise ValueError("'video' should be a path")
+        output_format = request.get('output_format', 'jpeg')
+        _encoder.suffix(output_format)
+        priority = request.get('priority', 'interactive')
+        if priority not in WorkQueue.TIERS:
+            raise ValueError("unrecognized priority tier '%s'" % priority)
+        preset = request.get('preset', 'balanced')
+        if preset not in _encoder.PRESETS:
+            raise ValueError("unrecognized encoder preset '%s'" % preset)
+        deadline = request.get('deadline')
+        if deadline is not None and (
+                not isinstance(deadline, (int, float)) or deadline <= 0):
+            raise ValueError("'deadline' should be a positive number of "
+                             "seconds")
+
+        params = {
+            'quality': request.get('quality', 85),
+            'preset': preset,
+            'video_duration': request.get('video_duration'),
+        }
+        for key in _GEN_PARAMS:
+            if key in request:
+                value = request[key]
+                if key in _TUPLE_PARAMS and isinstance(value, list):
+                    value = tuple(value)
+                params[key] = value
+
+        job = _Job(video, output_format, params, deadline=deadline)
+        if not self._queue.put(job, priority):
+            return None
+        return job
+
+    def _work(self):
+        """Worker thread: generate storyboards from the queue."""
+        # fonts are loaded once per worker; FreeType faces should not be
+        # shared between threads
+        fonts = {
+            'text_font': _storyboard.Font(),
+            'timestamp_font': _storyboard.Font(),
+        }
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                params = dict(job.params)
+                params.update(fonts)
+                if job.due is not None:
+                    params['deadline'] = max(job.due - time.time(), 0)
+                sb, lock = self._get_storyboard(job.video,
+                                                params['video_duration'])
+                with lock:
+                    job.data = sb.gen_storyboard_bytes(
+                        output_format=job.output_format, params=params)
+                    job.degradations = list(sb.degradations)
+            except (OSError, ValueError) as err:
+                job.error = err
+            except Exception as err:  # pylint: disable=broad-except
+                job.error = OSError("unexpected error: %s" % err)
+            finally:
+                job.done.set()
+
+    def _get_storyboard(self, video, video_duration):
+        """Return a (cached) StoryBoard object and its lock."""
+        try:
+            stat = os.stat(video)
+        except OSError:
+            raise OSError("video file '%s' does not exist" % video)
+        key = (os.path.abspath(video), stat.st_size, stat.st_mtime,
+               video_duration)
+        with self._cache_lock:
+            if key in self._cache:
+                entry = self._cache.pop(key)
+                self._cache[key] = entry
+                return entry
+
+        # probe outside the cache lock; a concurrent probe of the same
+        # video is wasteful but harmless
+        sb = _storyboard.StoryBoard(metadata.Video(video, params={
+            'ffprobe_bin': self._bins[1],
+            'video_duration': video_duration,
+            'scheduler': self._scheduler,
+            'process_limits': self._process_limits,
+        }), params={
+            'bins': self._bins,
+            'video_duration': video_duration,
+            'scheduler': self._scheduler,
+            'process_limits': self._process_limits,
+            # the scheduler keeps the total in check
+            'frame_jobs': self._scheduler.processes,
+        })
+        evicted = []
+        with self._cache_lock:
+            if key not in self._cache:
+                self._cache[key] = [sb, threading.Lock()]
+                while len(self._cache) > self._cache_size:
+                    evicted.append(self._cache.popitem(last=False)[1])
+            entry = self._cache.pop(key)
+            self._cache[key] = entry
+        # wait for workers still using evicted storyboards
+        for evicted_sb, lock in evicted:
+            with lock:
+                evicted_sb.clear_frames()
+        return entry
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """HTTP server handling each connection in a thread."""
+    daemon_threads = True
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn,
+                                   socketserver.UnixStreamServer):
+        """HTTP server on a Unix domain socket."""
+        daemon_threads = True
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Handler for the HTTP API (see module docstring)."""
+
+    server_version = 'storyboard/%s' % version.__version__
+
+    def do_GET(self):
+        """Handle GET requests."""
+        # pylint: disable=invalid-name
+        if self.path == '/status':
+            self._send_json(200, self.server.storyboard_server.status())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        """Handle POST requests."""
+        # pylint: disable=invalid-name
+        if self.path != '/storyboard':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            job = self.server.storyboard_server.submit(request)
+        except ValueError as err:
+            self._send_json(400, {'error': str(err)})
+            return
+        if job is None:
+            self._send_json(503, {'error': 'queue is full'},
+                            headers={'Retry-After': '1'})
+            return
+
+        job.done.wait()
+        if job.error is not None:
+            if not os.path.exists(job.video):
+                code = 404
+            elif isinstance(job.error, ValueError):
+                code = 400
+            else:
+                code = 500
+            self._send_json(code, {'error': str(job.error)})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', _CONTENT_TYPES.get(
+            job.output_format, 'application/octet-stream'))
+        self.send_header('Content-Length', str(len(job.data)))
+        if job.degradations:
+            self.send_header('X-Storyboard-Degradations',
+                             '; '.join(job.degradations))
+        self.end_headers()
+        self.wfile.write(job.data)
+
+    def _send_json(self, code, obj, headers=None):
+        """Send a JSON response."""
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if headers is not None:
+            for key, value in headers.items():
+                self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # client_address is an empty string for Unix domain sockets
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
+
+    def log_message(self, format, *args):
+        # pylint: disable=redefined-builtin
+        if self.server.storyboard_server._verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def main(argv=None):
+    """CLI interface of ``storyboard serve``.
+
+    Parameters
+    ----------
+    argv : list, optional
+        Command line arguments (excluding the program name and the
+        ``serve`` subcommand). If ``None``, use ``sys.argv[2:]``.
+        Default is ``None``.
+
+    """
+
+    if argv is None:
+        argv = sys.argv[2:]
+
+    description = """Serve storyboards over HTTP from a long-running
+    process, keeping fonts, binary checks, video metadata and extracted
+    frames warm between requests. See
+    https://storyboard.readthedocs.io/en/stable/storyboard.server.html
+    for the HTTP API.
+
+    Options can also be stored in the configuration file of the
+    storyboard command, under the "storyboard-serve" section."""
+    parser = argparse.ArgumentParser(prog='storyboard serve',
+                                     description=description)
+    parser.add_argument(
+        '--host',
+        help="Host to listen on. Default is 127.0.0.1.")
+    parser.add_argument(
+        '--port', type=int,
+        help="Port to listen on. Default is 8000.")
+    parser.add_argument(
+        '--unix-socket', metavar='PATH',
+        help="""Listen on a Unix domain socket at PATH instead of a TCP
+        port.""")
+    parser.add_argument(
+        '--ffmpeg-bin', metavar='NAME',
+        help="The name/path of the ffmpeg binary.")
+    parser.add_argument(
+        '--ffprobe-bin', metavar='NAME',
+        help="The name/path of the ffprobe binary.")
+    parser.add_argument(
+        '--workers', type=int, metavar='N',
+        help="Number of storyboards generated concurrently. Default is 2.")
+    parser.add_argument(
+        '--cpu-budget', type=int, metavar='N',
+        help="""Number of CPUs shared by all FFmpeg processes. Default is
+        the number of CPUs of the machine.""")
+    parser.add_argument(
+        '--ffmpeg-processes', type=int, metavar='N',
+        help="""Maximum number of FFmpeg processes running at once, each
+        using an equal share of the CPU budget as threads. Default is
+        the CPU budget, i.e., single-threaded processes.""")
+    parser.add_argument(
+        '--io-limits', metavar='SPEC',
+        help="""Maximum numbers of concurrent I/O jobs per storage
+        device, as comma separated MOUNT_POINT=N entries, plus
+        optionally a bare N for all other devices, e.g.,
+        '/mnt/hdd=1,/mnt/ssd=16'. Default is no limit.""")
+    _subproc.add_arguments(parser)
+    parser.add_argument(
+        '--interactive-queue-size', type=int, metavar='N',
+        help="""Maximum number of pending interactive requests; further
+        requests are rejected with status 503. Default is 16.""")
+    parser.add_argument(
+        '--batch-queue-size', type=int, metavar='N',
+        help="""Maximum number of pending batch requests; further
+        requests are rejected with status 503. Default is 64.""")
+    parser.add_argument(
+        '--cache-size', type=int, metavar='N',
+        help="""Maximum number of videos whose metadata and frames are
+        kept in memory. Default is 8.""")
+    parser.add_argument(
+        '--verbose', '-v', action='store_const', const=True,
+        help="Log requests to stderr.")
+    cli_args = parser.parse_args(argv)
+
+    if 'XDG_CONFIG_HOME' in os.environ:
+        config_file = os.path.join(os.environ['XDG_CONFIG_HOME'],
+                                   'storyboard/storyboard.conf')
+    else:
+        config_file = os.path.expanduser(
+            '~/.config/storyboard/storyboard.conf')
+
+    ffmpeg_bin_guessed, ffprobe_bin_guessed = fflocate.guess_bins()
+    defaults = {
+        'host': '127.0.0.1',
+        'port': 8000,
+        'unix_socket': None,
+        'ffmpeg_bin': ffmpeg_bin_guessed,
+        'ffprobe_bin': ffprobe_bin_guessed,
+        'workers': 2,
+        'cpu_budget': None,
+        'ffmpeg_processes': None,
+        'io_limits': None,
+        'timeout': None,
+        'memory_limit': None,
+        'cpu_time_limit': None,
+        'nice': None,
+        'ionice': None,
+        'interactive_queue_size': 16,
+        'batch_queue_size': 64,
+        'cache_size': 8,
+        'verbose': False,
+    }
+    optreader = util.OptionReader(
+        cli_args=cli_args,
+        config_files=config_file,
+        section='storyboard-serve',
+        defaults=defaults,
+    )
+    unix_socket = optreader.opt('unix_socket')
+    if unix_socket is not None:
+        address = unix_socket
+    else:
+        address = (optreader.opt('host'), optreader.opt('port', opttype=int))
+    verbose = optreader.opt('verbose', opttype=bool)
+
+    try:
+        io_limits, io_limit = _scheduler.parse_io_limits(
+            optreader.opt('io_limits') or '')
+        process_limits = _subproc.limits_from_options(optreader)
+        server = StoryBoardServer(address, params={
+            'bins': (optreader.opt('ffmpeg_bin'),
+                     optreader.opt('ffprobe_bin')),
+            'workers': optreader.opt('workers', opttype=int),
+            'cpu_budget': optreader.opt('cpu_budget', opttype=int),
+            'ffmpeg_processes': optreader.opt('ffmpeg_processes',
+                                              opttype=int),
+            'io_limits': io_limits,
+            'io_limit': io_limit,
+            'process_limits': process_limits,
+            'interactive_size': optreader.opt('interactive_queue_size',
+                                              opttype=int),
+            'batch_size': optreader.opt('batch_queue_size', opttype=int),
+            'cache_size': optreader.opt('cache_size', opttype=int),
+            'verbose': verbose,
+        })
+    except (OSError, ValueError, socket.error) as err:
+        sys.stderr.write("fatal error: %s\n" % str(err))
+        return 1
+
+    if isinstance(server.server_address, tuple):
+        sys.stderr.write("serving on http://%s:%d\n" %
+                         server.server_address[:2])
+    else:
+        sys.stderr.write("serving on %s\n" % server.server_address)
+    serving = threading.Thread(target=server.serve_forever)
+    serving.daemon = True
+    serving.start()
+    try:
+        while serving.is_alive():
+            serving.join(1)
+    except KeyboardInterrupt:
+        sys.stderr.write("shutting down\n")
+    server.shutdown()
+    return 0
@@ -27,28 +27,81 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
-import pkg_resources
+import collections
+import contextlib
+import io
+import itertools
 import os
 import sys
-import tempfile
-
-from PIL import Image, ImageDraw, ImageFont
+import threading
+import time
 
+from storyboard import batch
+from storyboard import encoder as _encoder
+from storyboard.encoder import PNGStripWriter as _PNGStripWriter
 from storyboard import fflocate
+from storyboard import fingerprint as _fingerprint
+from storyboard.frame import Frame as _Frame
+from storyboard.frame import FrameStore as _FrameStore
 from storyboard.frame import extract_frame as _extract_frame
+from storyboard.frame import extract_frames as _extract_frames
+from storyboard.frame import seek_offset as _seek_offset
 from storyboard import metadata
+from storyboard import planner as _planner
+from storyboard import quality as _quality
+from storyboard import scheduler as _scheduler
+from storyboard import subproc as _subproc
 from storyboard import util
 from storyboard.util import read_param as _read_param
 from storyboard import version
 
 
-# load default font
-DEFAULT_FONT_FILE = pkg_resources.resource_filename(
-    __name__,
-    'SourceCodePro-Regular.otf'
-)
+# default font, shipped as package data; located relative to this module
+# rather than through pkg_resources, which is slow to import
+DEFAULT_FONT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'SourceCodePro-Regular.otf')
 DEFAULT_FONT_SIZE = 16
 
+# parameters of StoryBoard.gen_frames forwarded by gen_storyboard
+_FRAME_KEYS = ('smart_select', 'smart_select_candidates',
+               'smart_select_width', 'dark_threshold', 'bright_threshold',
+               'blank_threshold', 'keyframe_seek')
+
+# assumed SHA-1 hashing throughput in bytes per second (reading included),
+# for deadline planning
+_SHA1_THROUGHPUT = 256 * 2 ** 20
+
+# share of the deadline planned for frame extraction, resizing and
+# hashing; the rest is left for text, tiling and encoding
+_DEADLINE_SHARE = 0.8
+
+# cost of extracting a smart selected frame relative to a plain one
+_SMART_SELECT_COST = 2
+
+# seek modes, from the fastest to the slowest
+_SEEK_MODES = ('input', 'hybrid', 'output')
+# minimum seconds decoded by hybrid seeks
+_SEEK_MARGIN = 5.0
+# frames input seeking may land after its target before it is deemed
+# inaccurate
+_SEEK_TOLERANCE = 1.5
+# timestamps probed by seek calibration, as fractions of the duration;
+# away from both ends, which are often special, and from simple ratios
+_SEEK_PROBES = (0.382, 0.618)
+
+# bytes per pixel of RGB images, which Pillow pads to 32 bits
+_PIXEL_BYTES = 4
+# pixel rows assumed for the metadata sheet and promotional banner when
+# estimating memory usage
+_TEXT_HEIGHT = 400
+# memory used by encoders on top of the image, in bytes per pixel; rough
+# upper bounds (libjpeg buffers the whole image for optimized and
+# progressive output, libwebp converts it to YUV and ARGB)
+_ENCODING_OVERHEAD = {'jpeg': 4, 'png': 1, 'webp': 6}
+_DEFAULT_ENCODING_OVERHEAD = 4
+# dimension assumed for videos of unknown dimension
+_DEFAULT_DIMENSION = (1920, 1080)
+
 
 # pylint: disable=too-many-locals,invalid-name
 # In this file we use a lot of short local variable names to save space.
@@ -103,6 +156,7 @@ class Font(object):
         See class docstring for parameters of the constructor.
 
         """
+        from PIL import ImageFont
 
         if font_file is None:
             font_file = DEFAULT_FONT_FILE
@@ -116,6 +170,16 @@ class Font(object):
         self.size = font_size
 
 
+def _read_font_param(params, key):
+    """Read a Font parameter, loading the default font only if absent.
+
+    ``_read_param(params, key, Font())`` would load the default font
+    from disk even when a font is supplied.
+
+    """
+    return params[key] if key in params else Font()
+
+
 def draw_text_block(canvas, xy, text, params=None):
     """Draw a block of text.
 
@@ -159,11 +223,12 @@ def draw_text_block(canvas, xy, text, params=None):
         text block. Default is ``False``.
 
     """
+    from PIL import ImageDraw
 
     if params is None:
         params = {}
     x, y = xy
-    font = _read_param(params, 'font', Font())
+    font = _read_font_param(params, 'font')
     color = _read_param(params, 'color', 'black')
     spacing = _read_param(params, 'spacing', 1.2)
     dry_run = _read_param(params, 'dry_run', False)
@@ -224,8 +289,18 @@ def create_thumbnail(frame, width, params=None):
         `draw_timestamp` is ``True``. Default is ``'right'``. Note that
         the timestamp is always vertically aligned towards the bottom of
         the thumbnail.
+    resample : int, optional
+        Resampling filter, e.g., ``PIL.Image.BILINEAR``, which is
+        several times faster than the default at a small cost in
+        sharpness. If ``None``, use ``PIL.Image.LANCZOS``. Default is
+        ``None``.
+    timings : storyboard.util.Timings, optional
+        If not ``None``, record the time spent resizing (as
+        ``'resize'``) and drawing the timestamp (as
+        ``'timestamp_text'``). Default is ``None``.
 
     """
+    from PIL import Image
 
     if params is None:
         params = {}
@@ -238,15 +313,35 @@ def create_thumbnail(frame, width, params=None):
     size = (width, height)
     draw_timestamp = _read_param(params, 'draw_timestamp', False)
     if draw_timestamp:
-        timestamp_font = _read_param(params, 'timestamp_font', Font())
+        timestamp_font = _read_font_param(params, 'timestamp_font')
         timestamp_align = _read_param(params, 'timestamp_align', 'right')
+    resample = _read_param(params, 'resample', None)
+    if resample is None:
+        resample = Image.LANCZOS
+    timings = _read_param(params, 'timings', None)
+    if timings is None:
+        # discarded
+        timings = util.Timings()
 
-    thumbnail = frame.image.resize(size, Image.LANCZOS)
+    with timings.timer('resize'):
+        thumbnail = frame.image.resize(size, resample)
 
     if draw_timestamp:
+        _draw_timestamp(thumbnail, frame.timestamp, timestamp_font,
+                        timestamp_align, timings)
+
+    return thumbnail
+
+
+def _draw_timestamp(thumbnail, timestamp, timestamp_font, timestamp_align,
+                    timings):
+    """Draw a timestamp over a thumbnail; see `create_thumbnail`."""
+    from PIL import ImageDraw
+    width, height = thumbnail.size
+    with timings.timer('timestamp_text'):
         draw = ImageDraw.Draw(thumbnail)
 
-        timestamp_text = util.humantime(frame.timestamp, ndigits=0)
+        timestamp_text = util.humantime(timestamp, ndigits=0)
         timestamp_width, timestamp_height = \
             draw.textsize(timestamp_text, timestamp_font.obj)
 
@@ -273,8 +368,6 @@ def create_thumbnail(frame, width, params=None):
                   timestamp_text,
                   fill='white', font=timestamp_font.obj)
 
-    return thumbnail
-
 
 def tile_images(images, tile, params=None):
     """
@@ -344,6 +437,7 @@ def tile_images(images, tile, params=None):
         ``False``.
 
     """
+    from PIL import Image
 
     # pylint: disable=too-many-branches
 
@@ -435,6 +529,51 @@ def tile_images(images, tile, params=None):
     return canvas
 
 
+def _pyramid_level(image, levels, size, resample=None):
+    """Return a downscaled version of an image from a resize pyramid.
+
+    The smallest existing level of the pyramid with at least the
+    requested width and height is used as the source of the
+    downscaling, falling back to the original image; a level of the
+    exact size is returned as is. A newly created level is appended to
+    the pyramid.
+
+    Parameters
+    ----------
+    image : PIL.Image.Image
+        The original (full resolution) image.
+    levels : list
+        Existing levels of the pyramid, as a list of
+        ``PIL.Image.Image`` objects. The list may be modified.
+    size : tuple
+        Requested size ``(width, height)``.
+    resample : int, optional
+        Resampling filter, e.g., ``PIL.Image.BILINEAR``. If ``None``,
+        use ``PIL.Image.LANCZOS``. Default is ``None``.
+
+    Returns
+    -------
+    PIL.Image.Image
+
+    """
+    from PIL import Image
+
+    if resample is None:
+        resample = Image.LANCZOS
+    width, height = size
+    source = image
+    for level in levels:
+        level_width, level_height = level.size
+        if (level_width, level_height) == size:
+            return level
+        if ((level_width >= width and level_height >= height and
+             level_width * level_height < source.size[0] * source.size[1])):
+            source = level
+    level = source.resize(size, resample)
+    levels.append(level)
+    return level
+
+
 class StoryBoard(object):
     """Class for creating video storyboard.
 
@@ -454,6 +593,8 @@ class StoryBoard(object):
         If ffmpeg and ffprobe binaries do not exist or seem corrupted,
         or if the video does not exist or cannot be recognized by
         FFprobe.
+    ValueError
+        If `extraction_strategy` or `seek_mode` is not recognized.
 
     Other Parameters
     ----------------
@@ -469,16 +610,74 @@ class StoryBoard(object):
         Image codec to use when extracting frames using FFmpeg. Default
         is ``'png'``. Use this option with caution only if your FFmpeg
         cannot encode PNG, which is unlikely.
+    frame_jobs : int, optional
+        Maximum number of frames extracted concurrently (each by its
+        own FFmpeg process). Default is 1.
+    ffmpeg_threads : int, optional
+        Number of decoding threads of each FFmpeg process. If ``None``,
+        let FFmpeg decide, which usually means one thread per CPU
+        core. When `frame_jobs` is greater than one, you may want to
+        set this to a small number to avoid oversubscribing the
+        CPU. Default is ``None``.
+    scheduler : storyboard.scheduler.Scheduler, optional
+        Scheduler granting slots (and threads) to the FFmpeg and ffprobe
+        processes launched, so that they share a CPU budget with those
+        of other storyboards; `ffmpeg_threads` is then the number of
+        threads wanted rather than used. Default is the scheduler
+        installed for the process with
+        ``storyboard.scheduler.set_scheduler``, if any; pass ``None``
+        explicitly to disable scheduling.
+    process_limits : storyboard.subproc.Limits, optional
+        Timeout and resource limits of the FFmpeg and ffprobe processes
+        launched; a process exceeding them fails the operation with
+        ``OSError``. Default is ``None``.
+    extraction_strategy : {'auto', 'seek', 'sequential'}, optional
+        How frames are extracted (see ``storyboard.planner``): one seek
+        per frame, a single sequential decoding pass, or whichever is
+        estimated to be the cheapest for the video and the number of
+        frames (``'auto'``). Seeking frame by frame (see
+        `video_duration`) always seeks. Default is ``'auto'``.
+    plan_history : storyboard.planner.History, optional
+        History of past extractions correcting the cost estimates of
+        the planner, or ``None`` to use the cost model alone. Default
+        is the history shared by the process.
+    seek_mode : {'auto', 'input', 'hybrid', 'output'}, optional
+        How FFmpeg seeks to frames: input seeking (fast, but relies on
+        the index of the file), hybrid seeking (input seeking to a few
+        seconds before the frame, then decoding up to it; see the
+        `seek_margin` parameter of ``storyboard.frame.extract_frame``),
+        or output seeking (decoding the video from the beginning, which
+        is extremely slow). ``'auto'`` calibrates the mode on the video
+        before the first frame is extracted: input seeking to two probe
+        timestamps, and comparing the timestamps of the frames it lands
+        on with the targets (see ``storyboard.frame.seek_offset``); if it
+        overshoots, hybrid seeking with a margin covering the overshoot
+        is probed, and output seeking is the last resort. Default is
+        ``'output'`` if `video_duration` is given, ``'auto'``
+        otherwise.
+    frame_tolerance : float, optional
+        Maximum distance (in seconds) between a planned frame timestamp
+        and an already extracted frame for the latter to be reused
+        instead of extracting a new frame (see `gen_frames`). If
+        ``None``, use half the spacing between planned frames, i.e.,
+        any frame within the time slot represented by a thumbnail is
+        good enough for that thumbnail. Use 0 to only reuse frames at
+        exactly the planned timestamps. Default is ``None``.
     video_duration : float, optional
         Duration of the video in seconds, passed to the
-        ``storyboard.metadata.Video`` constructor. If ``None``, extract
-        the duration from video container metadata. Default is
-        ``None``. You should rarely need this option, unless the
-        duration of the video cannot be extracted from video container
-        metadata, or the duration extracted is wrong. Either case is
-        fatal to the storyboard (since the frames extracted depend on
-        the duration), and this option provides a fallback. See `#3
-        <https://github.com/zmwangx/storyboard/issues/3>`_ for details.
+        ``storyboard.metadata.Video`` constructor. If ``None``, frames
+        are sampled over the duration from video container metadata,
+        or over the video stream if the former is missing or wrong (see
+        the `sampling_duration` attribute of
+        ``storyboard.metadata.Video``); frames are still extracted with
+        fast seeking in that case.
+        Default is ``None``. You should rarely need this option, unless
+        the duration is still wrong, which is fatal to the storyboard
+        (since the frames extracted depend on the duration); this
+        option provides a fallback, at the cost of seeking frame by
+        frame (unless `seek_mode` is given). See `#3
+        <https://github.com/zmwangx/storyboard/issues/3>`_ for
+        details.
     print_progress : bool, optional
         Whether to print progress information (to stderr). Default is
         ``False``.
@@ -490,13 +689,47 @@ class StoryBoard(object):
         List of equally spaced frames in the video, as
         ``storyboard.frame.Frame`` objects. The list is empty after
         `__init__`. See the `gen_frames` method.
+    frame_store : storyboard.frame.FrameStore
+        All frames extracted so far by `gen_frames` (including those of
+        previous sampling plans), keyed by seek mode and timestamp. Use
+        `clear_frames` to release them.
+    plan : storyboard.planner.Plan
+        Plan of the last extraction of frames, or ``None`` if no frame
+        has been extracted yet (see `extraction_strategy`).
+    seek_mode : str
+        ``'input'``, ``'hybrid'`` or ``'output'`` (see the `seek_mode`
+        parameter); ``None`` until calibrated, if ``'auto'``.
+    degradations : list
+        Human readable descriptions of the degradations applied by the
+        last storyboard generated to meet its deadline or its memory
+        budget (see the `deadline` and `memory_budget` parameters of
+        `gen_storyboard`); empty if none.
+    timings : storyboard.util.Timings
+        Cumulative time spent in each stage so far, in seconds; shared
+        with ``self.video.timings`` (see ``storyboard.metadata.Video``
+        for the stages of metadata extraction). The other stages are
+        ``'frame_seek'`` and ``'frame_decode'`` (see
+        ``storyboard.frame.extract_frame``), ``'smart_select'``
+        (decoding and scoring candidates, see `gen_frames`),
+        ``'resize'`` and ``'timestamp_text'`` (see `create_thumbnail`),
+        ``'tiling'`` (pasting thumbnails and sections), ``'text'``
+        (drawing the metadata sheet and promotional banner) and
+        ``'encoding'`` (encoding output images, with the `save` family
+        of methods). Stages run concurrently (see `frame_jobs`) are
+        added up across threads.
 
     Notes
     -----
     For developers: there are two private attributes. ``_bins`` is a
     tuple of two strs holding the name or path of the ffmpeg and ffprobe
     binaries; ``_frame_codec`` is a str holding the image codec used by
-    FFmpeg when generating frames (usually no one needs to touch this).
+    FFmpeg when generating frames (usually no one needs to touch this);
+    ``_frame_jobs``, ``_ffmpeg_threads``, ``_scheduler``,
+    ``_process_limits``, ``_extraction_strategy``, ``_plan_history``
+    and ``_frame_tolerance`` hold the `frame_jobs`, `ffmpeg_threads`,
+    `scheduler`, `process_limits`, `extraction_strategy`,
+    `plan_history` and `frame_tolerance` parameters; ``_seek_margin``
+    holds the margin of hybrid seeks.
 
     """
 
@@ -515,14 +748,34 @@ class StoryBoard(object):
         else:
             bins = fflocate.guess_bins()
         frame_codec = _read_param(params, 'frame_codec', 'png')
+        frame_jobs = _read_param(params, 'frame_jobs', 1)
+        ffmpeg_threads = _read_param(params, 'ffmpeg_threads', None)
+        scheduler = _read_param(params, 'scheduler',
+                                _scheduler.get_scheduler())
+        process_limits = _read_param(params, 'process_limits', None)
+        extraction_strategy = _read_param(params, 'extraction_strategy',
+                                          'auto')
+        plan_history = _read_param(params, 'plan_history',
+                                   _planner.get_history())
+        frame_tolerance = _read_param(params, 'frame_tolerance', None)
         video_duration = _read_param(params, 'video_duration', None)
+        # seek frame by frame if video duration is specially given
+        # (indicating that normal input seeking may not work)
+        seek_mode = _read_param(params, 'seek_mode',
+                                'output' if video_duration is not None
+                                else 'auto')
         print_progress = _read_param(params, 'print_progress', False)
 
+        if extraction_strategy not in ('auto', 'seek', 'sequential'):
+            raise ValueError("unrecognized extraction strategy '%s'" %
+                             extraction_strategy)
+        if seek_mode != 'auto' and seek_mode not in _SEEK_MODES:
+            raise ValueError("unrecognized seek mode '%s'" % seek_mode)
         fflocate.check_bins(bins)
 
-        # seek frame by frame if video duration is specially given
-        # (indicating that normal input seeking may not work)
-        self._seek_frame_by_frame = video_duration is not None
+        self.seek_mode = seek_mode if seek_mode != 'auto' else None
+        self._seek_margin = _SEEK_MARGIN if seek_mode == 'hybrid' else None
+        self._seek_lock = threading.Lock()
 
         self._bins = bins
         if isinstance(video, metadata.Video):
@@ -532,13 +785,29 @@ class StoryBoard(object):
                 'ffprobe_bin': bins[1],
                 'video_duration': video_duration,
                 'print_progress': print_progress,
+                'timings': util.Timings(),
+                'scheduler': scheduler,
+                'process_limits': process_limits,
             })
         else:
             raise ValueError("expected str or storyboard.metadata.Video "
                              "for the video argument, got %s" %
                              type(video).__name__)
+        self.timings = self.video.timings
         self.frames = []
+        self._frames_smart_selected = False
+        self._frames_keyframe_seek = False
+        self.frame_store = _FrameStore()
+        self.degradations = []
+        self.plan = None
         self._frame_codec = frame_codec
+        self._frame_tolerance = frame_tolerance
+        self._frame_jobs = frame_jobs
+        self._ffmpeg_threads = ffmpeg_threads
+        self._scheduler = scheduler
+        self._process_limits = process_limits
+        self._extraction_strategy = extraction_strategy
+        self._plan_history = plan_history
 
     def gen_storyboard(self, params=None):
         """Generate full storyboard.
@@ -642,95 +911,658 @@ class StoryBoard(object):
             the metadata fields. Default is ``False``. Be aware that
             computing SHA-1 digest is an expensive operation.
 
+        streaming_assembly : bool, optional
+            Whether to assemble the bare storyboard in streaming mode,
+            i.e., extract frames one at a time, paste each thumbnail
+            into its slot on the canvas as soon as it is created, and
+            release the full-resolution frame right away. Peak memory
+            usage is then roughly the size of the canvas, regardless of
+            the resolution of the video. Note that in streaming mode
+            extracted frames are not kept in the `frames` attribute
+            (unless they were already there, in which case they are
+            reused). Default is ``False``.
+
+        smart_select : bool, optional
+            Whether to pick the best of several candidates for each
+            thumbnail, avoiding black, blank and blurry frames; see
+            `gen_frames`, which also lists the parameters tuning this
+            option. Requires NumPy. Default is ``False``.
+        keyframe_seek : bool, optional
+            Whether to extract the keyframe at or before each planned
+            timestamp instead of the exact frame; see `gen_frames`.
+            Default is ``False``.
+        keyframes_only : bool, optional
+            Whether to decode all keyframes of the video, and only
+            keyframes, in a single pass scaled down to the thumbnail
+            size, and use the keyframe nearest to each planned
+            timestamp. Much faster than seeking for dense storyboards
+            (hundreds of thumbnails), at the cost of accuracy: the
+            thumbnails show the keyframes actually used (with their
+            timestamps), and the same keyframe may be used for several
+            thumbnails if keyframes are sparse. Frames are neither taken
+            from nor kept in the `frames` attribute, and `smart_select`
+            is ignored. Default is ``False``.
+        thumbnail_resample : int, optional
+            Resampling filter used to create thumbnails, e.g.,
+            ``PIL.Image.BILINEAR``. If ``None``, use
+            ``PIL.Image.LANCZOS``. Default is ``None``.
+
+        deadline : float, optional
+            Time budget in seconds, counted from the call. If the
+            storyboard is estimated not to be ready in time (based on
+            the cost of extracting and resizing one frame, measured
+            upfront), the following degradations are applied in order,
+            until the estimate fits: skip the SHA-1 digest, disable
+            `smart_select`, use bilinear resampling, snap seeks to
+            keyframes, and reduce `tile` (rows first). The degradations
+            applied are recorded in the `degradations` attribute. This
+            is best effort: the deadline is not enforced, and is ignored
+            for tiles of previously generated frames. Default is
+            ``None``, i.e., no deadline.
+        memory_budget : int, optional
+            Memory budget in bytes. Before any frame is extracted, the
+            peak memory usage is estimated from the tile count, the
+            dimension of the video, the thumbnail size and the output
+            format (see `output_format`); if the estimate exceeds the
+            budget, memory-saving modes are switched on in order until
+            it fits: `streaming_assembly`, strip encoding (only when
+            saving as PNG with `save`), and `keyframes_only`. The modes
+            switched on are recorded in the `degradations` attribute.
+            ``MemoryError`` is raised if the storyboard does not fit
+            even then. The estimate only covers pixel data, not the
+            baseline of the process. Default is ``None``, i.e., no
+            budget.
+        output_format : str or list, optional
+            Format, or list of formats, the storyboard is about to be
+            encoded into, so that the memory used by encoders is
+            accounted for by `memory_budget`; set by `save`. Default is
+            ``None``, i.e., not encoded.
+
         print_progress : bool, optional
             Whether to print progress information (to stderr). Default
             is ``False``.
 
         """
 
-        # process parameters -- a ton of them
+        return self._gen_storyboard(params)
+
+    def gen_storyboards(self, variants, params=None):
+        """Generate several storyboards from a single frame extraction.
+
+        Each variant is a set of parameters understood by
+        `gen_storyboard`, e.g., a full storyboard, a small preview with
+        fewer and narrower thumbnails, and a PNG archive copy. Compared
+        to calling `gen_storyboard` once per variant, this method
+
+        * extracts frames only once, at the union of the timestamps
+          needed by all variants, where a frame within the frame
+          tolerance (see the constructor) of a planned timestamp is
+          reused rather than extracted again, both across variants and
+          from the `frame_store` attribute;
+        * creates thumbnails through a resize pyramid shared by all
+          variants: frames are first downscaled for the variant with
+          the largest thumbnails, and each smaller thumbnail is
+          downscaled from the smallest existing level that is at least
+          as large, rather than from the full resolution frame (a level
+          of the exact size is reused as is);
+        * encodes the variants with an ``output`` destination in
+          parallel.
+
+        Parameters
+        ----------
+        variants : list
+            A list of dicts, each containing parameters understood by
+            `gen_storyboard`, plus the optional output parameters listed
+            in "Other Parameters".
+        params : dict, optional
+            Parameters shared by all variants (e.g., `include_sha1sum`
+            or `print_progress`), which can be overridden in each
+            variant. Default is ``None``.
+
+        Returns
+        -------
+        storyboards : list
+            A list of ``PIL.Image.Image`` objects, one for each variant,
+            in the order of `variants`.
+
+        Raises
+        ------
+        OSError
+            If frame extraction with FFmpeg fails.
+        ValueError
+            If `tile` is not a tuple of positive integers, or if a
+            variant (or `params`) sets `deadline`, `memory_budget` or
+            `keyframes_only`, which cannot be honored with frames shared
+            across variants.
+
+        Other Parameters
+        ----------------
+        output : str or file object, optional
+            Path to the output file, or a binary file object opened for
+            writing. If ``None``, the storyboard of this variant is not
+            saved. Default is ``None``.
+        output_format : str, optional
+            Output format, e.g., ``'jpeg'``, ``'png'`` or ``'webp'``
+            (see ``storyboard.encoder.encode_image``). Default is
+            ``'jpeg'``.
+        quality : int, optional
+            Quality of the output image, an integer between 1 and
+            100. Only meaningful for lossy formats. Default is 85.
+        preset : {'fast', 'balanced', 'smallest'}, optional
+            Encoder preset. Default is ``'balanced'``.
+
+        """
+
+        # pylint: disable=too-many-branches
+
         if params is None:
             params = {}
-        include_metadata_sheet = _read_param(
-            params, 'include_metadata_sheet', True)
-        include_promotional_banner = _read_param(
-            params, 'include_promotional_banner', True)
-        background_color = _read_param(params, 'background_color', 'white')
-        margins = _read_param(params, 'margins', (10, 10))
-        tile = _read_param(params, 'tile', (4, 4))
-        tile_spacing = _read_param(params, 'tile_spacing', (8, 6))
-        if (('section_spacing' in params and
-             params['section_spacing'] is not None)):
-            section_spacing = params['section_spacing']
+        variant_params = []
+        for variant in variants:
+            merged = dict(params)
+            merged.update(variant)
+            variant_params.append(merged)
+        print_progress = _read_param(params, 'print_progress', False)
+        for merged in variant_params:
+            for key in ('deadline', 'memory_budget', 'keyframes_only'):
+                if _read_param(merged, key, None) not in (None, False):
+                    raise ValueError("%s is not supported when generating "
+                                     "several storyboards from shared "
+                                     "frames" % key)
+
+        # timestamps needed by each variant
+        plans = []
+        for merged in variant_params:
+            cols, rows = _read_param(merged, 'tile', (4, 4))
+            if (not(isinstance(cols, int) and isinstance(rows, int) and
+                    cols > 0 and rows > 0)):
+                raise ValueError('tile is not a tuple of positive integers')
+            plans.append(self._frame_timestamps(cols * rows))
+
+        # resolve the densest plans first, so that sparser plans can
+        # reuse their frames; frames extracted here are pooled with the
+        # stored ones, but not kept in the frame store afterwards
+        pool = _FrameStore()
+        for frame in itertools.chain(self.frame_store, self.frames):
+            pool.add(frame)
+        kept = set(id(frame) for frame in pool)
+        plan_frames = [None] * len(plans)
+        for index in sorted(range(len(plans)), key=lambda i: len(plans[i]),
+                            reverse=True):
+            merged = variant_params[index]
+            if (_read_param(merged, 'smart_select', False) and
+                    not self._seek_frame_by_frame):
+                plan_frames[index] = list(self._iter_smart_frames(
+                    plans[index], pool, merged,
+                    print_progress=print_progress))
+            else:
+                plan_frames[index] = list(self._iter_stored_frames(
+                    plans[index], pool, print_progress=print_progress))
+
+        # thumbnail size of each variant
+        sizes = []
+        for merged in variant_params:
+            thumbnail_width = _read_param(merged, 'thumbnail_width', 480)
+            aspect_ratio = _read_param(merged, 'thumbnail_aspect_ratio', None)
+            if aspect_ratio is None:
+                aspect_ratio = self.video.dar
+            if aspect_ratio is None:
+                width, height = plan_frames[0][0].image.size
+                aspect_ratio = width / height
+            # same formula as in create_thumbnail
+            sizes.append((thumbnail_width,
+                          int(round(thumbnail_width / aspect_ratio))))
+
+        resamples = [_read_param(merged, 'thumbnail_resample', None)
+                     for merged in variant_params]
+
+        # walk down the resize pyramid, largest thumbnails first
+        if print_progress:
+            sys.stderr.write("Resizing frames...\n")
+        # id of frame => resized levels
+        pyramid = dict((id(frame), []) for frame in pool)
+        variant_frames = [None] * len(variants)
+        for index in sorted(range(len(variants)),
+                            key=lambda i: sizes[i][0] * sizes[i][1],
+                            reverse=True):
+            with self.timings.timer('resize'):
+                variant_frames[index] = [
+                    _Frame(frame.timestamp,
+                           _pyramid_level(frame.image, pyramid[id(frame)],
+                                          sizes[index],
+                                          resample=resamples[index]))
+                    for frame in plan_frames[index]
+                ]
+        # full resolution frames are no longer needed, unless they are
+        # kept in the frames or frame_store attributes
+        for frame in pool:
+            if id(frame) not in kept:
+                frame.image.close()
+
+        storyboards = []
+        for merged, frames in zip(variant_params, variant_frames):
+            storyboards.append(self._gen_storyboard(merged, frames=frames))
+        for levels in pyramid.values():
+            for level in levels:
+                level.close()
+
+        if print_progress:
+            sys.stderr.write("Encoding storyboards...\n")
+        jobs = []
+        for merged, storyboard in zip(variant_params, storyboards):
+            output = _read_param(merged, 'output', None)
+            if output is not None:
+                jobs.append((storyboard, output,
+                             _read_param(merged, 'output_format', 'jpeg'),
+                             {'quality': _read_param(merged, 'quality', 85),
+                              'preset': _read_param(merged, 'preset',
+                                                    'balanced')}))
+        with self.timings.timer('encoding'):
+            _encoder.encode_images(jobs)
+
+        return storyboards
+
+    def save_storyboard_strips(self, fp, params=None):
+        """Generate full storyboard and save it as PNG, strip by strip.
+
+        The storyboard is identical to the one generated by
+        `gen_storyboard`, but it is never assembled in memory as a
+        whole. Instead, it is rendered in horizontal strips (the
+        metadata sheet, each row of thumbnails, and the promotional
+        banner), and each strip is compressed and written out as soon
+        as it is rendered (see ``storyboard.encoder.PNGStripWriter``).
+        Memory usage is therefore bounded by the size of a single row of
+        thumbnails, no matter how many rows the storyboard has.
+
+        Parameters
+        ----------
+        fp : str or file object
+            Path to the output file, or a binary file object opened for
+            writing.
+        params : dict, optional
+            Optional parameters enclosed in a dict. Default is
+            ``None``. Every parameter understood by `gen_storyboard` is
+            understood here, plus the ones listed in the "Other
+            Parameters" section.
+
+        Returns
+        -------
+        size : tuple
+            A tuple ``(width, height)`` of the saved storyboard.
+
+        Raises
+        ------
+        OSError
+            If frame extraction with FFmpeg fails.
+        MemoryError
+            If the storyboard is estimated to exceed `memory_budget` (see
+            `gen_storyboard`).
+
+        Other Parameters
+        ----------------
+        streaming_assembly : bool, optional
+            See `gen_storyboard`. Default is ``True`` here.
+        compress_level : int, optional
+            zlib compression level, an integer between 0 and 9. Default
+            is 6.
+
+        """
+
+        params = dict(params) if params is not None else {}
+        params.setdefault('streaming_assembly', True)
+        compress_level = _read_param(params, 'compress_level', 6)
+
+        size, strips = self._gen_storyboard_strips(params, assembled=False)
+
+        if isinstance(fp, str):
+            fileobj = open(fp, 'wb')
         else:
-            section_spacing = tile_spacing[1]
-        thumbnail_width = _read_param(params, 'thumbnail_width', 480)
+            fileobj = fp
+        try:
+            writer = _PNGStripWriter(fileobj, size, params={
+                'compress_level': compress_level,
+            })
+            for strip in strips:
+                with self.timings.timer('encoding'):
+                    writer.write(strip)
+                strip.close()
+            with self.timings.timer('encoding'):
+                writer.close()
+        finally:
+            if fileobj is not fp:
+                fileobj.close()
+
+        return size
+
+    def save(self, fp, output_format='jpeg', params=None):
+        """Generate full storyboard and save it to a file or file object.
+
+        The encoded image is written straight to `fp`, which may be
+        a regular file, a pipe, a socket (wrapped as a file object), or
+        an in-memory buffer, so that no temporary file is needed.
+
+        Parameters
+        ----------
+        fp : str or file object
+            Path to the output file, or a binary file object opened for
+            writing. The file object is not closed.
+        output_format : str, optional
+            Output format, e.g., ``'jpeg'``, ``'png'`` or ``'webp'``
+            (see ``storyboard.encoder.encode_image``). Default is
+            ``'jpeg'``.
+        params : dict, optional
+            Optional parameters enclosed in a dict. Default is
+            ``None``. Every parameter understood by `gen_storyboard` is
+            understood here, plus the ones listed in the "Other
+            Parameters" section.
+
+        Raises
+        ------
+        OSError
+            If frame extraction with FFmpeg fails.
+        ValueError
+            If `output_format` is not recognized, or if strip encoding
+            is requested for a format other than PNG.
+        MemoryError
+            If the storyboard is estimated to exceed `memory_budget` (see
+            `gen_storyboard`).
+
+        Other Parameters
+        ----------------
+        quality : int, optional
+            Quality of the output image, an integer between 1 and
+            100. Only meaningful for lossy formats. Default is 85.
+        preset : {'fast', 'balanced', 'smallest'}, optional
+            Encoder preset. Default is ``'balanced'``.
+        strip_encoding : bool, optional
+            Whether to render and encode the storyboard strip by strip
+            (see `save_storyboard_strips`). Only available for PNG
+            output. Default is ``False``, but strip encoding may be
+            switched on to meet `memory_budget`.
+
+        """
+
+        if params is None:
+            params = {}
+        params = dict(params)
+        params['output_format'] = output_format
+        quality = _read_param(params, 'quality', 85)
+        preset = _read_param(params, 'preset', 'balanced')
+        strip_encoding = _read_param(params, 'strip_encoding', False)
+        memory_budget = _read_param(params, 'memory_budget', None)
+
+        # fail early, before the expensive part
+        _encoder.suffix(output_format)
+        if strip_encoding and output_format != 'png':
+            raise ValueError("strip encoding is only available for PNG "
+                             "output")
+        # strip encoding comes right after streaming assembly among the
+        # memory-saving modes (see _fit_memory_budget)
+        budget_strips = (
+            memory_budget is not None and output_format == 'png' and
+            not strip_encoding and
+            self._estimate_memory(dict(params, streaming_assembly=True)) >
+            memory_budget)
+        if strip_encoding or budget_strips:
+            self.save_storyboard_strips(fp, params=params)
+            if budget_strips:
+                self.degradations.insert(0, "strip encoding")
+            return
+
+        storyboard_image = self.gen_storyboard(params=params)
+        try:
+            with self.timings.timer('encoding'):
+                _encoder.encode_image(storyboard_image, fp, output_format,
+                                      params={'quality': quality,
+                                              'preset': preset})
+        finally:
+            storyboard_image.close()
+
+    def gen_storyboard_bytes(self, output_format='jpeg', params=None):
+        """Generate full storyboard and return the encoded image.
+
+        See `save` for details.
+
+        Parameters
+        ----------
+        output_format : str, optional
+            Output format. Default is ``'jpeg'``.
+        params : dict, optional
+            Optional parameters enclosed in a dict. Default is
+            ``None``. Every parameter understood by `save` is
+            understood here.
+
+        Returns
+        -------
+        data : bytes
+            The encoded storyboard image.
+
+        Raises
+        ------
+        OSError
+            If frame extraction with FFmpeg fails.
+        ValueError
+            If `output_format` is not recognized.
+        MemoryError
+            If the storyboard is estimated to exceed `memory_budget` (see
+            `gen_storyboard`).
+
+        """
+
+        buf = io.BytesIO()
+        self.save(buf, output_format=output_format, params=params)
+        return buf.getvalue()
+
+    def gen_sprite_track(self, params=None):
+        """Generate sprite sheets and a WebVTT thumbnail track.
+
+        This is meant for seek previews in web video players: one
+        thumbnail is taken every `interval` seconds, thumbnails are
+        packed into sprite sheets, and a WebVTT file maps the time range
+        covered by each thumbnail to its region in a sprite sheet, in
+        the form ``sprite-001.jpg#xywh=x,y,w,h``.
+
+        All thumbnails are extracted in a single decoding pass (see
+        ``storyboard.frame.extract_frames``), with downscaling done by
+        FFmpeg, which is far more efficient than seeking to each
+        timestamp separately when there are hundreds of thumbnails.
+
+        Parameters
+        ----------
+        params : dict, optional
+            Optional parameters enclosed in a dict. Default is
+            ``None``. See the "Other Parameters" section for understood
+            key/value pairs.
+
+        Returns
+        -------
+        sheets : list
+            A list of sprite sheets as ``PIL.Image.Image`` objects. The
+            last sheet is cropped to the rows actually used.
+        vtt : str
+            Content of the WebVTT file.
+
+        Raises
+        ------
+        OSError
+            If frame extraction with FFmpeg fails.
+
+        Other Parameters
+        ----------------
+        interval : float, optional
+            Time interval between thumbnails, in seconds. Default is
+            10.
+        tile : tuple, optional
+            A tuple ``(cols, rows)`` specifying the maximum number of
+            columns and rows of thumbnails in each sprite
+            sheet. Default is ``(10, 10)``.
+        thumbnail_width : int, optional
+            Width of each thumbnail. Default is 160.
+        thumbnail_aspect_ratio : float, optional
+            Aspect ratio of thumbnails. If ``None``, use the display
+            aspect ratio of the video (``self.video.dar``), or the
+            aspect ratio of its pixel dimensions if the former is not
+            available. Default is ``None``.
+        sprite_url : str, optional
+            Template of the URL of each sprite sheet in the WebVTT file,
+            with a printf-style placeholder for the (one-based) index of
+            the sheet. Default is ``'sprite-%03d.jpg'``.
+        print_progress : bool, optional
+            Whether to print progress information (to stderr). Default
+            is ``False``.
+
+        """
+        from PIL import Image
+
+        if params is None:
+            params = {}
+        interval = _read_param(params, 'interval', 10)
+        cols, rows = _read_param(params, 'tile', (10, 10))
+        thumbnail_width = _read_param(params, 'thumbnail_width', 160)
         thumbnail_aspect_ratio = _read_param(
             params, 'thumbnail_aspect_ratio', None)
-        draw_timestamp = _read_param(params, 'draw_timestamp', True)
-        timestamp_font = _read_param(params, 'timestamp_font', Font())
-        timestamp_align = _read_param(params, 'timestamp_align', 'right')
-        text_font = _read_param(params, 'text_font', Font())
-        text_color = _read_param(params, 'text_color', 'black')
-        line_spacing = _read_param(params, 'line_spacing', 1.2)
-        include_sha1sum = _read_param(params, 'include_sha1sum', False)
+        sprite_url = _read_param(params, 'sprite_url', 'sprite-%03d.jpg')
         print_progress = _read_param(params, 'print_progress', False)
 
-        # draw bare storyboard, metadata sheet, and promotional banner
-        if print_progress:
-            sys.stderr.write("Generating main storyboard...\n")
-        bare_storyboard = self._gen_bare_storyboard(
-            tile, thumbnail_width,
-            params={
-                'tile_spacing': tile_spacing,
-                'background_color': background_color,
-                'thumbnail_aspect_ratio': thumbnail_aspect_ratio,
-                'draw_timestamp': draw_timestamp,
-                'timestamp_font': timestamp_font,
-                'timestamp_align': timestamp_align,
-                'print_progress': print_progress,
-            }
-        )
-        total_width, _ = bare_storyboard.size
+        if thumbnail_aspect_ratio is None:
+            if self.video.dar is not None:
+                thumbnail_aspect_ratio = self.video.dar
+            elif self.video.dimension is not None:
+                width, height = self.video.dimension
+                thumbnail_aspect_ratio = width / height
+            else:
+                raise OSError("'%s' has no video stream" % self.video.path)
+        thumbnail_height = int(round(thumbnail_width / thumbnail_aspect_ratio))
+        duration = self.video.sampling_duration
+        per_sheet = cols * rows
 
-        if include_metadata_sheet:
+        sheets = []
+        cues = ["WEBVTT", ""]
+        counter = 0
+        for frame in _extract_frames(self.video.path, params={
+                'ffmpeg_bin': self._bins[0],
+                'threads': self._ffmpeg_threads,
+                'scheduler': self._scheduler,
+                'process_limits': self._process_limits,
+                'interval': interval,
+                'size': (thumbnail_width, thumbnail_height),
+        }):
+            start = counter * interval
+            if duration is not None and start >= duration:
+                # the fps filter may pad the end of the video
+                frame.image.close()
+                break
+            end = start + interval
+            if duration is not None and end > duration:
+                end = duration
+
+            sheet_index, slot = divmod(counter, per_sheet)
+            row, col = divmod(slot, cols)
+            if slot == 0:
+                sheets.append(Image.new('RGB',
+                                        (thumbnail_width * cols,
+                                         thumbnail_height * rows)))
+            x, y = col * thumbnail_width, row * thumbnail_height
+            sheets[-1].paste(frame.image, (x, y))
+            frame.image.close()
+            counter += 1
             if print_progress:
-                sys.stderr.write("Generating metadata sheet...\n")
-            metadata_sheet = self._gen_metadata_sheet(total_width, params={
-                'text_font': text_font,
-                'text_color': text_color,
-                'line_spacing': line_spacing,
-                'background_color': background_color,
-                'include_sha1sum': include_sha1sum,
-                'print_progress': print_progress,
-            })
+                sys.stderr.write("\rExtracted %d thumbnails..." % counter)
+
+            cues.append("%s --> %s" % (util.humantime(start, ndigits=3),
+                                       util.humantime(end, ndigits=3)))
+            cues.append("%s#xywh=%d,%d,%d,%d" % (
+                sprite_url % (sheet_index + 1),
+                x, y, thumbnail_width, thumbnail_height))
+            cues.append("")
+        if print_progress:
+            sys.stderr.write("\n")
 
-        if include_promotional_banner:
-            if print_progress:
-                sys.stderr.write("Generating promotional banner...\n")
-            banner = self._gen_promotional_banner(total_width, params={
-                'text_font': text_font,
-                'text_color': text_color,
-                'background_color': background_color,
-            })
+        # crop the last sheet to the rows actually used
+        used = counter - per_sheet * (len(sheets) - 1)
+        if sheets and used < per_sheet:
+            used_rows = (used + cols - 1) // cols
+            last = sheets.pop()
+            sheets.append(last.crop((0, 0, last.size[0],
+                                     used_rows * thumbnail_height)))
+            last.close()
 
-        # combine different sections
-        if print_progress:
-            sys.stderr.write("Assembling pieces...\n")
-        sections = []
-        if include_metadata_sheet:
-            sections.append(metadata_sheet)
-        sections.append(bare_storyboard)
-        if include_promotional_banner:
-            sections.append(banner)
-        storyboard = tile_images(sections, (1, len(sections)), params={
-            'tile_spacing': (0, section_spacing),
-            'margins': margins,
-            'canvas_color': background_color,
-            'close_separate_images': True,
-        })
+        return sheets, '\n'.join(cues)
 
-        return storyboard
+    def save_sprite_track(self, directory, params=None):
+        """Generate sprite sheets and a WebVTT track, and save them.
+
+        See `gen_sprite_track` for details. Sprite sheets are encoded in
+        parallel.
+
+        Parameters
+        ----------
+        directory : str
+            Path to the output directory, which should exist.
+        params : dict, optional
+            Optional parameters enclosed in a dict. Default is
+            ``None``. Every parameter understood by `gen_sprite_track`
+            is understood here, plus the ones listed in the "Other
+            Parameters" section.
+
+        Returns
+        -------
+        vtt_file : str
+            Path to the saved WebVTT file.
+        sheet_files : list
+            Paths to the saved sprite sheets.
+
+        Other Parameters
+        ----------------
+        output_format : str, optional
+            Output format of the sprite sheets, e.g., ``'jpeg'``,
+            ``'png'`` or ``'webp'``. Default is ``'jpeg'``.
+        quality : int, optional
+            Quality of the sprite sheets, an integer between 1 and
+            100. Only meaningful for lossy formats. Default is 85.
+        preset : {'fast', 'balanced', 'smallest'}, optional
+            Encoder preset. Default is ``'balanced'``.
+        sprite_filename : str, optional
+            Template of the filename of each sprite sheet, with a
+            printf-style placeholder for the (one-based) index of the
+            sheet. Default is ``'sprite-%03d'`` followed by the suffix
+            of the output format, e.g., ``'sprite-%03d.jpg'``.
+        sprite_url : str, optional
+            See `gen_sprite_track`. Default is `sprite_filename`.
+        vtt_filename : str, optional
+            Filename of the WebVTT file. Default is
+            ``'thumbnails.vtt'``.
+
+        """
+
+        if params is None:
+            params = {}
+        output_format = _read_param(params, 'output_format', 'jpeg')
+        quality = _read_param(params, 'quality', 85)
+        preset = _read_param(params, 'preset', 'balanced')
+        sprite_filename = _read_param(
+            params, 'sprite_filename',
+            'sprite-%03d' + _encoder.suffix(output_format))
+        vtt_filename = _read_param(params, 'vtt_filename', 'thumbnails.vtt')
+        track_params = dict(params)
+        track_params.setdefault('sprite_url', sprite_filename)
+
+        sheets, vtt = self.gen_sprite_track(track_params)
+        sheet_files = [os.path.join(directory, sprite_filename % (i + 1))
+                       for i in range(len(sheets))]
+        with self.timings.timer('encoding'):
+            _encoder.encode_images([
+                (sheet, sheet_file, output_format,
+                 {'quality': quality, 'preset': preset})
+                for sheet, sheet_file in zip(sheets, sheet_files)
+            ])
+        for sheet in sheets:
+            sheet.close()
+        vtt_file = os.path.join(directory, vtt_filename)
+        with open(vtt_file, 'w') as fileobj:
+            fileobj.write(vtt)
+
+        return vtt_file, sheet_files
 
     def gen_frames(self, count, params=None):
         """Extract equally spaced frames from the video.
@@ -741,9 +1573,20 @@ class StoryBoard(object):
 
         Note that new frames are extracted only if the number of
         existing frames in the `frames` attribute doesn't match the
-        specified `count` (0 at instantiation), in which case new frames
-        are extracted to match the specification, and the `frames`
-        attribute is overwritten.
+        specified `count` (0 at instantiation), in which case the
+        `frames` attribute is overwritten. Even then, frames extracted
+        earlier (kept in the `frame_store` attribute) are reused
+        wherever they are within `frame_tolerance` (see the
+        constructor) of a planned timestamp, and only the missing
+        frames are extracted. E.g., when going from a 4x4 to a 5x5
+        storyboard, most of the 16 existing frames are reused.
+
+        With the `smart_select` option, each frame is instead chosen
+        among a small burst of candidates spread across its time slot:
+        the candidates are decoded at low resolution by a single FFmpeg
+        process, scored by ``storyboard.quality.best_image`` (which
+        penalizes black, blank and blurry frames), and only the winner
+        is extracted at full resolution. This requires NumPy.
 
         Parameters
         ----------
@@ -763,9 +1606,31 @@ class StoryBoard(object):
         ------
         OSError
             If frame extraction with FFmpeg fails.
+        ImportError
+            If `smart_select` is on but NumPy is not installed.
 
         Other Parameters
         ----------------
+        smart_select : bool, optional
+            Whether to pick the best of several candidates for each
+            frame (see above). Ignored if the `video_duration` parameter
+            was passed to the constructor, since candidates are decoded
+            with input seeking. Default is ``False``.
+        smart_select_candidates : int, optional
+            Number of candidates for each frame. Default is 5.
+        smart_select_width : int, optional
+            Width of candidates, as decoded for scoring. Default is
+            160.
+        dark_threshold, bright_threshold, blank_threshold : float, optional
+            See ``storyboard.quality.score_images``.
+        keyframe_seek : bool, optional
+            Whether to extract the keyframe preceding each planned
+            timestamp instead of the frame at the timestamp (see the
+            `accurate_seek` parameter of
+            ``storyboard.frame.extract_frame``), which is much faster for
+            videos with long GOPs. Ignored with `smart_select`, or if
+            the `video_duration` parameter was passed to the
+            constructor. Default is ``False``.
         print_progress : bool, optional
             Whether to print progress information (to stderr). Default
             is False.
@@ -774,46 +1639,40 @@ class StoryBoard(object):
 
         if params is None:
             params = {}
+        smart_select = (_read_param(params, 'smart_select', False) and
+                        not self._seek_frame_by_frame)
+        keyframe_seek = (_read_param(params, 'keyframe_seek', False) and
+                         not smart_select)
         print_progress = _read_param(params, 'print_progress', False)
 
-        if len(self.frames) == count:
+        if (len(self.frames) == count and
+                smart_select == self._frames_smart_selected and
+                keyframe_seek == self._frames_keyframe_seek):
             return
 
-        duration = self.video.duration
-        interval = duration / count
-        timestamps = [interval * (i + 1/2) for i in range(0, count)]
-        counter = 0
-        for timestamp in timestamps:
-            counter += 1
-            if print_progress:
-                sys.stderr.write("\rExtracting frame %d/%d..." %
-                                 (counter, count))
-            try:
-                frame = _extract_frame(self.video.path, timestamp, params={
-                    'ffmpeg_bin': self._bins[0],
-                    'codec': self._frame_codec,
-                    'frame_by_frame': self._seek_frame_by_frame,
-                })
-                self.frames.append(frame)
-            except:
-                # \rExtracting frame %d/%d... isn't terminated by
-                # newline yet
-                if print_progress:
-                    sys.stderr.write("\n")
-                raise
-        if print_progress:
-            sys.stderr.write("\n")
+        timestamps = self._frame_timestamps(count)
+        if smart_select:
+            self.frames = list(self._iter_smart_frames(
+                timestamps, self.frame_store, params,
+                print_progress=print_progress))
+        else:
+            self.frames = list(self._iter_stored_frames(
+                timestamps, self.frame_store, print_progress=print_progress,
+                keyframe_seek=keyframe_seek))
+        self._frames_smart_selected = smart_select
+        self._frames_keyframe_seek = keyframe_seek
 
-    def _gen_bare_storyboard(self, tile, thumbnail_width, params=None):
-        """Generate bare storyboard (thumbnails only).
+    def gen_signature(self, params=None):
+        """Compute a perceptual signature of the video.
+
+        The signature consists of the perceptual hashes of equally
+        spaced frames (see `gen_frames`, whose frames are reused if
+        their number matches), and identifies near-duplicates of the
+        video, e.g., re-encoded or rescaled copies. See
+        ``storyboard.fingerprint``. Requires NumPy.
 
         Parameters
         ----------
-        tile : tuple
-            A tuple ``(cols, rows)`` specifying the number of columns
-            and rows for the array of thumbnails.
-        thumbnail_width : int
-            Width of each thumbnail.
         params : dict, optional
             Optional parameters enclosed in a dict. Default is
             ``None``. See the "Other Parameters" section for understood
@@ -821,19 +1680,1105 @@ class StoryBoard(object):
 
         Returns
         -------
-        base_storyboard : PIL.Image.Image
+        signature : storyboard.fingerprint.VideoSignature
+
+        Raises
+        ------
+        OSError
+            If frame extraction with FFmpeg fails.
+        ImportError
+            If NumPy is not installed.
 
         Other Parameters
         ----------------
-        tile_spacing : tuple, optional
-            See the `tile_spacing` parameter of the `tile_images`
-            function. Default is ``(0, 0)``.
+        frame_count : int, optional
+            Number of frames. Default is 16.
+        method : {'dhash', 'phash'}, optional
+            Hash method; see ``storyboard.fingerprint.hash_images``.
+            Default is ``'dhash'``.
+        print_progress : bool, optional
+            Whether to print progress information (to stderr). Default
+            is False.
 
-        background_color : color, optional
-            See the `canvas_color` paramter of the `tile_images`
-            function. Default is ``'white'``.
+        """
 
-        thumbnail_aspect_ratio : float, optional
+        if params is None:
+            params = {}
+        frame_count = _read_param(params, 'frame_count', 16)
+        method = _read_param(params, 'method', 'dhash')
+        print_progress = _read_param(params, 'print_progress', False)
+
+        self.gen_frames(frame_count, params={
+            'print_progress': print_progress,
+        })
+        return _fingerprint.VideoSignature(_fingerprint.hash_images(
+            [frame.image for frame in self.frames],
+            params={'method': method}))
+
+    def clear_frames(self):
+        """Release all extracted frames.
+
+        Images of frames in the `frames` and `frame_store` attributes
+        are closed, and both are emptied.
+
+        """
+
+        for frame in self.frame_store:
+            frame.image.close()
+        for frame in self.frames:
+            frame.image.close()
+        self.frame_store.clear()
+        self.frames = []
+
+    def _frame_timestamps(self, count):
+        """Return timestamps of `count` equally spaced frames.
+
+        The timestamps are at positions 1/2N, 3/2N, 5/2N, ... ,
+        (2N-1)/2N of the video, where N is `count`.
+
+        """
+
+        interval = self.video.sampling_duration / count
+        return [interval * (i + 1/2) for i in range(0, count)]
+
+    def _iter_stored_frames(self, timestamps, store, print_progress=False,
+                            add=True, keyframe_seek=False):
+        """Yield frames at the given timestamps, reusing stored frames.
+
+        For each timestamp, the nearest frame in `store` within the
+        frame tolerance and extracted with the same seek mode is reused
+        (but never for two timestamps); the remaining frames are
+        extracted with `_iter_frames` (and added to `store` if `add` is
+        true).
+
+        Parameters
+        ----------
+        timestamps : list
+            Sorted list of equally spaced timestamps.
+        store : storyboard.frame.FrameStore
+        print_progress : bool, optional
+            Default is False.
+        add : bool, optional
+            Default is True.
+        keyframe_seek : bool, optional
+            See `gen_frames`. Default is False.
+
+        Yields
+        ------
+        frame : storyboard.frame.Frame
+
+        """
+
+        hits = self._match_stored_frames(timestamps, store,
+                                         keyframe_seek=keyframe_seek)
+        missing = [timestamp for timestamp, hit in zip(timestamps, hits)
+                   if hit is None]
+        extracted = self._iter_frames(missing, print_progress=print_progress,
+                                      keyframe_seek=keyframe_seek)
+        try:
+            for hit in hits:
+                if hit is None:
+                    frame = next(extracted)
+                    if add:
+                        store.add(frame, keyframe=keyframe_seek)
+                    yield frame
+                else:
+                    yield hit
+        finally:
+            extracted.close()
+
+    def _match_stored_frames(self, timestamps, store, keyframe_seek=False):
+        """Match timestamps to stored frames; see `_iter_stored_frames`.
+
+        Frames extracted with keyframe seeking only match if
+        `keyframe_seek` is true, and vice versa.
+
+        Returns
+        -------
+        hits : list
+            The stored frame reused for each timestamp, or ``None`` if
+            it has to be extracted.
+
+        """
+
+        tolerance = self._frame_tolerance
+        if tolerance is None:
+            tolerance = self.video.sampling_duration / len(timestamps) / 2
+        hits = []
+        used = set()
+        for timestamp in timestamps:
+            hit = store.nearest(timestamp, tolerance, keyframe=keyframe_seek)
+            if hit is not None and id(hit) in used:
+                # right in between two planned timestamps
+                hit = None
+            if hit is not None:
+                used.add(id(hit))
+            hits.append(hit)
+        return hits
+
+    def _iter_smart_frames(self, timestamps, store, params,
+                           print_progress=False, add=True):
+        """Yield the best frame of each time slot.
+
+        See the `smart_select` parameter of `gen_frames`. Chosen frames
+        are added to `store` if `add` is true.
+
+        Parameters
+        ----------
+        timestamps : list
+            Sorted list of equally spaced timestamps (the centers of
+            the time slots).
+        store : storyboard.frame.FrameStore
+        params : dict
+            Parameters of `gen_frames`.
+        print_progress : bool, optional
+            Default is False.
+        add : bool, optional
+            Default is True.
+
+        Yields
+        ------
+        frame : storyboard.frame.Frame
+
+        """
+
+        candidate_count = _read_param(params, 'smart_select_candidates', 5)
+        candidate_width = _read_param(params, 'smart_select_width', 160)
+        quality_params = {}
+        for key in ('dark_threshold', 'bright_threshold', 'blank_threshold'):
+            if key in params:
+                quality_params[key] = params[key]
+
+        step = (self.video.sampling_duration / len(timestamps) /
+                candidate_count)
+        # sets the margin of hybrid seeks
+        self._calibrate_seek()
+        extract_params = {
+            'ffmpeg_bin': self._bins[0],
+            'codec': self._frame_codec,
+            'seek_margin': self._seek_margin,
+            'threads': self._ffmpeg_threads,
+            'scheduler': self._scheduler,
+            'process_limits': self._process_limits,
+            'timings': self.timings,
+        }
+
+        def extract(timestamp):
+            """Extract the best frame in the time slot around timestamp."""
+            with self.timings.timer('smart_select'):
+                start = max(timestamp - step * (candidate_count - 1) / 2, 0)
+                candidates = []
+                candidate_frames = _extract_frames(self.video.path, params={
+                    'ffmpeg_bin': self._bins[0],
+                    'threads': self._ffmpeg_threads,
+                    'scheduler': self._scheduler,
+                    'process_limits': self._process_limits,
+                    'start': start,
+                    'duration': step * candidate_count,
+                    'interval': step,
+                    'size': (candidate_width, -2),
+                })
+                try:
+                    # closed right away, so that its scheduler slots are
+                    # released before the winner is extracted
+                    with contextlib.closing(candidate_frames):
+                        for candidate in candidate_frames:
+                            candidates.append(candidate)
+                            if len(candidates) == candidate_count:
+                                break
+                except OSError:
+                    # e.g., too close to the end; fall back to the timestamp
+                    # itself below
+                    pass
+                if candidates:
+                    best = _quality.best_image(
+                        [candidate.image for candidate in candidates],
+                        params=quality_params)
+                    timestamp = candidates[best].timestamp
+                    for candidate in candidates:
+                        candidate.image.close()
+            return _extract_frame(self.video.path, timestamp,
+                                  params=extract_params)
+
+        for frame in self._iter_frames(timestamps,
+                                       print_progress=print_progress,
+                                       extract=extract):
+            if add:
+                store.add(frame)
+            yield frame
+
+    def _iter_frames(self, timestamps, print_progress=False, extract=None,
+                     keyframe_seek=False):
+        """Extract frames at the given timestamps, in order.
+
+        This is a generator, so that the caller can process (and
+        release) each frame before later ones are extracted. Unless
+        `extract` is given, the strategy is chosen by
+        `_plan_extraction`; when seeking, up to ``self._frame_jobs``
+        frames are extracted concurrently.
+
+        Parameters
+        ----------
+        timestamps : list
+            List of timestamps (floats, in seconds).
+        print_progress : bool, optional
+            Whether to print progress information (to stderr). Default
+            is False.
+        extract : callable, optional
+            A function taking a timestamp and returning a
+            ``storyboard.frame.Frame``. If ``None``, extract the frame
+            at exactly the timestamp (or the preceding keyframe, see
+            `keyframe_seek`). Default is ``None``.
+        keyframe_seek : bool, optional
+            See `gen_frames`. Default is False.
+
+        Yields
+        ------
+        frame : storyboard.frame.Frame
+
+        Raises
+        ------
+        OSError
+            If frame extraction with FFmpeg fails.
+
+        """
+
+        extract_params = {
+            'ffmpeg_bin': self._bins[0],
+            'codec': self._frame_codec,
+            'frame_by_frame': self._seek_frame_by_frame,
+            'seek_margin': self._seek_margin,
+            'accurate_seek': not keyframe_seek,
+            'threads': self._ffmpeg_threads,
+            'scheduler': self._scheduler,
+            'process_limits': self._process_limits,
+            'timings': self.timings,
+        }
+
+        plan = None
+        if extract is None and timestamps:
+            plan = self._plan_extraction(timestamps, keyframe_seek)
+
+            def extract(timestamp):
+                """Extract the frame at timestamp."""
+                return _extract_frame(self.video.path, timestamp,
+                                      params=extract_params)
+
+        pool = None
+        if plan is not None and plan.strategy == 'sequential':
+            def results():
+                """Yield extracted frames in order."""
+                return self._iter_sequential_frames(timestamps)
+        elif self._frame_jobs > 1:
+            # keep at most _frame_jobs extractions in flight, so that
+            # frames are still produced (and can be released) one by
+            # one, in order
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(self._frame_jobs)
+            pending = collections.deque()
+            timestamp_iter = iter(timestamps)
+            for timestamp in itertools.islice(timestamp_iter,
+                                              self._frame_jobs):
+                pending.append(pool.apply_async(extract, (timestamp,)))
+
+            def results():
+                """Yield extracted frames in order."""
+                while pending:
+                    frame = pending.popleft().get()
+                    for timestamp in itertools.islice(timestamp_iter, 1):
+                        pending.append(pool.apply_async(extract,
+                                                        (timestamp,)))
+                    yield frame
+        else:
+            def results():
+                """Yield extracted frames in order."""
+                for timestamp in timestamps:
+                    yield extract(timestamp)
+
+        count = len(timestamps)
+        counter = 0
+        # time spent waiting for frames, as opposed to consuming them
+        elapsed = 0.0
+        frames = results()
+        try:
+            while True:
+                counter += 1
+                if print_progress and counter <= count:
+                    sys.stderr.write("\rExtracting frame %d/%d..." %
+                                     (counter, count))
+                started = time.time()
+                try:
+                    frame = next(frames)
+                except StopIteration:
+                    break
+                except:
+                    # \rExtracting frame %d/%d... isn't terminated by
+                    # newline yet
+                    if print_progress:
+                        sys.stderr.write("\n")
+                    raise
+                finally:
+                    elapsed += time.time() - started
+                if (counter == count and plan is not None and
+                        self._plan_history is not None):
+                    # callers need not exhaust the generator
+                    self._plan_history.record(
+                        plan.strategy, plan.model_estimates[plan.strategy],
+                        elapsed)
+                yield frame
+        finally:
+            frames.close()
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if print_progress:
+            sys.stderr.write("\n")
+
+    def _plan_extraction(self, timestamps, keyframe_seek):
+        """Plan the extraction of frames at timestamps.
+
+        See the `extraction_strategy` parameter of the constructor. The
+        plan is also stored in the `plan` attribute.
+
+        Returns
+        -------
+        plan : storyboard.planner.Plan
+
+        """
+
+        import multiprocessing
+
+        # snapping to keyframes, and sequential passes starting with an
+        # input seek, require accurate input seeking
+        input_seek = self._calibrate_seek() == 'input'
+        if not input_seek or self._extraction_strategy == 'seek':
+            strategies = ('keyframe_seek' if keyframe_seek and input_seek
+                          else 'seek',)
+        elif self._extraction_strategy == 'sequential':
+            strategies = ('sequential',)
+        else:
+            strategies = None
+
+        jobs = self._frame_jobs
+        if self._scheduler is not None:
+            jobs = min(jobs, self._scheduler.processes)
+        # threads a sequential pass actually gets (see
+        # _iter_sequential_frames): those asked for, granted by the
+        # scheduler (an equal share of its budget by default), or else
+        # FFmpeg's own choice, one per CPU
+        threads = self._ffmpeg_threads
+        if self._scheduler is not None:
+            if threads is None:
+                threads = self._scheduler.cpus // self._scheduler.processes
+            threads = max(1, min(threads, self._scheduler.cpus))
+        elif threads is None:
+            threads = multiprocessing.cpu_count()
+        self.plan = _planner.plan(self.video, timestamps, params={
+            'jobs': jobs,
+            'threads': threads,
+            'keyframe_seek': keyframe_seek,
+            'strategies': strategies,
+            'history': self._plan_history,
+        })
+        return self.plan
+
+    @property
+    def _seek_frame_by_frame(self):
+        """Whether frames are extracted with output seeking."""
+        return self._calibrate_seek() == 'output'
+
+    def _calibrate_seek(self):
+        """Choose the seek mode, if not done yet.
+
+        See the `seek_mode` parameter of the constructor. Sets the
+        `seek_mode` attribute, and ``_seek_margin`` for hybrid seeking.
+
+        Returns
+        -------
+        seek_mode : str
+
+        Raises
+        ------
+        OSError
+            If FFmpeg times out.
+
+        """
+
+        with self._seek_lock:
+            if self.seek_mode is not None:
+                return self.seek_mode
+            duration = self.video.sampling_duration
+            if not duration:
+                # frames cannot be planned anyway
+                self.seek_mode = 'input'
+                return self.seek_mode
+            params = {
+                'ffmpeg_bin': self._bins[0],
+                'threads': self._ffmpeg_threads,
+                'scheduler': self._scheduler,
+                'process_limits': self._process_limits,
+            }
+            tolerance = _SEEK_TOLERANCE / (self.video.frame_rate or 25)
+            with self.timings.timer('frame_seek'):
+                for fraction in _SEEK_PROBES:
+                    target = duration * fraction
+                    offset = _seek_offset(self.video.path, target, params)
+                    if offset is None or offset > tolerance:
+                        break
+                else:
+                    self.seek_mode = 'input'
+                    return self.seek_mode
+                if offset is not None:
+                    # input seeking overshoots; check that seeking far
+                    # enough ahead lands before the target
+                    margin = max(_SEEK_MARGIN, 2 * offset)
+                    start = max(target - margin, 0)
+                    offset = _seek_offset(self.video.path, start, params)
+                    if offset is not None and start + offset <= target:
+                        self.seek_mode = 'hybrid'
+                        self._seek_margin = margin
+                        return self.seek_mode
+            self.seek_mode = 'output'
+            return self.seek_mode
+
+    def _iter_sequential_frames(self, timestamps):
+        """Extract frames at timestamps in a single decoding pass.
+
+        The first frame at or after every multiple of I seconds from
+        the first timestamp is picked (see the `accurate_interval`
+        parameter of ``storyboard.frame.extract_frames``), where I is
+        the smallest gap between timestamps; frames off the timestamps
+        (in the larger gaps) are dropped.
+
+        Yields
+        ------
+        frame : storyboard.frame.Frame
+            Timestamped with the planned timestamp, just like frames
+            extracted by seeking.
+
+        Raises
+        ------
+        OSError
+            If frame extraction with FFmpeg fails.
+
+        """
+
+        start = timestamps[0]
+        gaps = [later - earlier
+                for earlier, later in zip(timestamps, timestamps[1:])]
+        interval = min(gaps) if gaps else self.video.sampling_duration
+        pending = collections.deque(timestamps)
+        frames = _extract_frames(self.video.path, params={
+            'ffmpeg_bin': self._bins[0],
+            'threads': self._ffmpeg_threads,
+            'scheduler': self._scheduler,
+            'process_limits': self._process_limits,
+            'interval': interval,
+            'accurate_interval': True,
+            'start': start,
+            'duration': timestamps[-1] - start + interval,
+        })
+        try:
+            while pending:
+                # timed like seeks by extract_frame
+                with self.timings.timer('frame_seek'):
+                    frame = next(frames, None)
+                if frame is None:
+                    break
+                if abs(frame.timestamp - pending[0]) < interval / 2:
+                    yield _Frame(pending.popleft(), frame.image)
+                else:
+                    frame.image.close()
+        finally:
+            frames.close()
+        if pending:
+            raise OSError("ffmpeg failed to extract frame at time %.2f "
+                          "from '%s'" % (pending[0], self.video.path))
+
+    def _iter_keyframes(self, timestamps, size):
+        """Pick the keyframe nearest to each timestamp in a single pass.
+
+        Only keyframes are decoded (see the `keyframes_only` parameter
+        of ``storyboard.frame.extract_frames``), and only the last one
+        is kept while the next one is decoded.
+
+        Parameters
+        ----------
+        timestamps : list
+            Sorted timestamps, in seconds.
+        size : tuple
+            Size keyframes are scaled to by FFmpeg; see the `size`
+            parameter of ``storyboard.frame.extract_frames``.
+
+        Yields
+        ------
+        frame : storyboard.frame.Frame
+            Timestamped with the timestamp of the keyframe. The same
+            frame is yielded for consecutive timestamps nearest to the
+            same keyframe; its image is closed once the generator moves
+            past it, so it should be consumed before the next frame is
+            requested.
+
+        Raises
+        ------
+        OSError
+            If frame extraction with FFmpeg fails.
+
+        """
+
+        pending = collections.deque(timestamps)
+        keyframes = _extract_frames(self.video.path, params={
+            'ffmpeg_bin': self._bins[0],
+            'threads': self._ffmpeg_threads,
+            'scheduler': self._scheduler,
+            'process_limits': self._process_limits,
+            'keyframes_only': True,
+            'size': size,
+        })
+        previous = None
+        try:
+            while pending:
+                # timed like seeks by extract_frame
+                with self.timings.timer('frame_seek'):
+                    keyframe = next(keyframes, None)
+                if keyframe is None:
+                    break
+                # timestamps before this keyframe are settled
+                while pending and pending[0] < keyframe.timestamp:
+                    timestamp = pending.popleft()
+                    if previous is not None and (
+                            timestamp - previous.timestamp <=
+                            keyframe.timestamp - timestamp):
+                        yield previous
+                    else:
+                        yield keyframe
+                if previous is not None:
+                    previous.image.close()
+                previous = keyframe
+            if pending and previous is None:
+                raise OSError("no keyframe decoded from '%s'" %
+                              self.video.path)
+            # the rest are after the last keyframe (or the generator is
+            # being closed)
+            while pending:
+                pending.popleft()
+                yield previous
+        finally:
+            keyframes.close()
+            if previous is not None:
+                previous.image.close()
+
+    def _gen_storyboard(self, params=None, frames=None):
+        """Generate full storyboard, optionally from given frames.
+
+        Parameters
+        ----------
+        params : dict, optional
+            See `gen_storyboard`.
+        frames : list, optional
+            A list of ``storyboard.frame.Frame`` objects to create the
+            thumbnails from, in place of the frames in the `frames`
+            attribute. The length of the list should match the tile
+            count. Default is ``None``.
+
+        Returns
+        -------
+        full_storyboard : PIL.Image.Image
+
+        """
+        from PIL import Image
+
+        if params is None:
+            params = {}
+        background_color = _read_param(params, 'background_color', 'white')
+        print_progress = _read_param(params, 'print_progress', False)
+
+        size, strips = self._gen_storyboard_strips(params, frames=frames)
+
+        if print_progress:
+            sys.stderr.write("Assembling pieces...\n")
+        storyboard = Image.new('RGB', size, background_color)
+        y = 0
+        for strip in strips:
+            with self.timings.timer('tiling'):
+                storyboard.paste(strip, (0, y))
+            y += strip.size[1]
+            strip.close()
+
+        return storyboard
+
+    def _gen_storyboard_strips(self, params=None, frames=None,
+                               assembled=True):
+        """Generate full storyboard as a sequence of horizontal strips.
+
+        The first row of thumbnails, the metadata sheet and the
+        promotional banner are generated upfront (the total size of the
+        storyboard is not known before that); the remaining rows of
+        thumbnails are generated lazily as the strips are consumed.
+
+        Parameters
+        ----------
+        params : dict, optional
+            Optional parameters enclosed in a dict. Default is
+            ``None``. See the "Other Parameters" section of
+            `gen_storyboard` for understood key/value pairs.
+        frames : list, optional
+            See `_gen_storyboard`.
+        assembled : bool, optional
+            Whether the strips are to be assembled into a single image,
+            which counts towards `memory_budget`. Default is ``True``.
+
+        Returns
+        -------
+        size : tuple
+            A tuple ``(width, height)`` of the full storyboard.
+        strips : iterator
+            An iterator of ``PIL.Image.Image`` strips of the full width,
+            to be stacked top to bottom. The heights of the strips sum
+            up to the height of the full storyboard.
+
+        """
+
+        # process parameters -- a ton of them
+        if params is None:
+            params = {}
+        self.degradations = []
+        memory_budget = _read_param(params, 'memory_budget', None)
+        if memory_budget is not None and frames is None:
+            params = self._fit_memory_budget(params, memory_budget,
+                                             assembled=assembled)
+        deadline = _read_param(params, 'deadline', None)
+        if deadline is not None and frames is None:
+            params = self._fit_deadline(params, deadline)
+        include_metadata_sheet = _read_param(
+            params, 'include_metadata_sheet', True)
+        include_promotional_banner = _read_param(
+            params, 'include_promotional_banner', True)
+        background_color = _read_param(params, 'background_color', 'white')
+        margins = _read_param(params, 'margins', (10, 10))
+        tile = _read_param(params, 'tile', (4, 4))
+        tile_spacing = _read_param(params, 'tile_spacing', (8, 6))
+        if (('section_spacing' in params and
+             params['section_spacing'] is not None)):
+            section_spacing = params['section_spacing']
+        else:
+            section_spacing = tile_spacing[1]
+        thumbnail_width = _read_param(params, 'thumbnail_width', 480)
+        thumbnail_aspect_ratio = _read_param(
+            params, 'thumbnail_aspect_ratio', None)
+        draw_timestamp = _read_param(params, 'draw_timestamp', True)
+        timestamp_font = _read_font_param(params, 'timestamp_font')
+        timestamp_align = _read_param(params, 'timestamp_align', 'right')
+        thumbnail_resample = _read_param(params, 'thumbnail_resample', None)
+        text_font = _read_font_param(params, 'text_font')
+        text_color = _read_param(params, 'text_color', 'black')
+        line_spacing = _read_param(params, 'line_spacing', 1.2)
+        include_sha1sum = _read_param(params, 'include_sha1sum', False)
+        streaming_assembly = _read_param(params, 'streaming_assembly', False)
+        keyframes_only = _read_param(params, 'keyframes_only', False)
+        print_progress = _read_param(params, 'print_progress', False)
+
+        cols, rows = tile
+        if (not(isinstance(cols, int) and isinstance(rows, int) and
+                cols > 0 and rows > 0)):
+            raise ValueError('tile is not a tuple of positive integers')
+        # same as the width of the rows of thumbnails
+        section_width = thumbnail_width * cols + tile_spacing[0] * (cols - 1)
+
+        # the metadata sheet comes first, as hashing the video file must
+        # not wait for the I/O and process slots that a suspended
+        # single-pass extraction (sequential or keyframes only) holds
+        if include_metadata_sheet:
+            if print_progress:
+                sys.stderr.write("Generating metadata sheet...\n")
+            metadata_sheet = self._gen_metadata_sheet(section_width, params={
+                'text_font': text_font,
+                'text_color': text_color,
+                'line_spacing': line_spacing,
+                'background_color': background_color,
+                'include_sha1sum': include_sha1sum,
+                'print_progress': print_progress,
+            })
+
+        # draw bare storyboard and promotional banner
+        if print_progress:
+            sys.stderr.write("Generating main storyboard...\n")
+        row_params = {
+            'tile_spacing': tile_spacing,
+            'background_color': background_color,
+            'thumbnail_aspect_ratio': thumbnail_aspect_ratio,
+            'draw_timestamp': draw_timestamp,
+            'timestamp_font': timestamp_font,
+            'timestamp_align': timestamp_align,
+            'thumbnail_resample': thumbnail_resample,
+            'streaming_assembly': streaming_assembly,
+            'keyframes_only': keyframes_only,
+            'print_progress': print_progress,
+        }
+        for key in _FRAME_KEYS:
+            if key in params:
+                row_params[key] = params[key]
+        row_strips = self._iter_bare_storyboard_rows(
+            tile, thumbnail_width, params=row_params, frames=frames)
+        # the first row determines the thumbnail height, which is needed
+        # for the total size
+        first_row = next(row_strips)
+        row_height = first_row.size[1]
+        ver_spacing = tile_spacing[1]
+        bare_storyboard_height = row_height * rows + ver_spacing * (rows - 1)
+
+        if include_promotional_banner:
+            if print_progress:
+                sys.stderr.write("Generating promotional banner...\n")
+            with self.timings.timer('text'):
+                banner = self._gen_promotional_banner(section_width, params={
+                    'text_font': text_font,
+                    'text_color': text_color,
+                    'background_color': background_color,
+                })
+
+        # layout of the sections, which is the same as what tile_images
+        # would produce for a 1xN array of the sections
+        hor_margin, ver_margin = margins
+        total_width = section_width + hor_margin * 2
+        header_height = ver_margin
+        if include_metadata_sheet:
+            header_height += metadata_sheet.size[1] + section_spacing
+        footer_height = ver_margin
+        if include_promotional_banner:
+            footer_height += section_spacing + banner.size[1]
+        total_height = header_height + bare_storyboard_height + footer_height
+
+        def gen_strips():
+            """Generate the strips, top to bottom."""
+            from PIL import Image
+            if header_height > 0:
+                strip = Image.new('RGB', (total_width, header_height),
+                                  background_color)
+                if include_metadata_sheet:
+                    strip.paste(metadata_sheet, (hor_margin, ver_margin))
+                    metadata_sheet.close()
+                yield strip
+
+            row = 0
+            for row_strip in itertools.chain([first_row], row_strips):
+                # vertical tile spacing below all but the last row
+                height = row_height + (ver_spacing if row < rows - 1 else 0)
+                strip = Image.new('RGB', (total_width, height),
+                                  background_color)
+                strip.paste(row_strip, (hor_margin, 0))
+                row_strip.close()
+                row += 1
+                yield strip
+
+            if footer_height > 0:
+                strip = Image.new('RGB', (total_width, footer_height),
+                                  background_color)
+                if include_promotional_banner:
+                    strip.paste(banner, (hor_margin, section_spacing))
+                    banner.close()
+                yield strip
+
+        return (total_width, total_height), gen_strips()
+
+    def _fit_deadline(self, params, deadline):
+        """Degrade generation parameters to meet a deadline.
+
+        See the `deadline` parameter of `gen_storyboard`. The cost of
+        extracting and resizing a frame is measured on one of the
+        frames needed anyway (which is kept in the frame store), and
+        extrapolated to the missing frames; degradations are applied in
+        order of increasing loss until the estimate fits in the budget,
+        and recorded in the `degradations` attribute.
+
+        Parameters
+        ----------
+        params : dict
+            Parameters of `gen_storyboard`.
+        deadline : float
+            Time budget in seconds, counted from now.
+
+        Returns
+        -------
+        params : dict
+            A copy of `params` with the degradations applied.
+
+        """
+        from PIL import Image
+
+        # pylint: disable=too-many-branches,too-many-statements
+
+        ends_at = time.time() + deadline * _DEADLINE_SHARE
+        params = dict(params)
+        tile = _read_param(params, 'tile', (4, 4))
+        thumbnail_width = _read_param(params, 'thumbnail_width', 480)
+        include_sha1sum = (_read_param(params, 'include_sha1sum', False) and
+                           self.video.sha1sum is None)
+        smart_select = (_read_param(params, 'smart_select', False) and
+                        not self._seek_frame_by_frame)
+        keyframe_seek = _read_param(params, 'keyframe_seek', False)
+        resample = _read_param(params, 'thumbnail_resample', None)
+        if resample is None:
+            resample = Image.LANCZOS
+        jobs = self._frame_jobs
+        if self._scheduler is not None:
+            jobs = min(jobs, self._scheduler.processes)
+
+        def missing(tile, keyframe_seek):
+            """Return the timestamps of frames still to be extracted."""
+            timestamps = self._frame_timestamps(tile[0] * tile[1])
+            hits = self._match_stored_frames(timestamps, self.frame_store,
+                                             keyframe_seek=keyframe_seek)
+            return [timestamp for timestamp, hit in zip(timestamps, hits)
+                    if hit is None]
+
+        # seconds per frame, keyed by keyframe_seek and by resample
+        extract_costs = {}
+        resize_costs = {}
+
+        def measure(keyframe_seek, resample):
+            """Measure the costs of a configuration, if not done yet."""
+            sample = None
+            if keyframe_seek not in extract_costs:
+                timestamps = missing(tile, keyframe_seek)
+                if timestamps:
+                    # calibrates seeking first, which is not part of
+                    # the cost of a frame
+                    extract_params = {
+                        'ffmpeg_bin': self._bins[0],
+                        'codec': self._frame_codec,
+                        'frame_by_frame': self._seek_frame_by_frame,
+                        'seek_margin': self._seek_margin,
+                        'accurate_seek': not keyframe_seek,
+                        'threads': self._ffmpeg_threads,
+                        'scheduler': self._scheduler,
+                        'process_limits': self._process_limits,
+                        'timings': self.timings,
+                    }
+                    started = time.time()
+                    sample = _extract_frame(self.video.path, timestamps[0],
+                                            params=extract_params)
+                    extract_costs[keyframe_seek] = time.time() - started
+                    self.frame_store.add(sample, keyframe=keyframe_seek)
+                else:
+                    extract_costs[keyframe_seek] = 0
+            if resample not in resize_costs:
+                if sample is None:
+                    sample = next(iter(self.frame_store))
+                started = time.time()
+                create_thumbnail(sample, thumbnail_width,
+                                 params={'resample': resample}).close()
+                resize_costs[resample] = time.time() - started
+
+        def fits():
+            """Whether the current configuration fits in the budget."""
+            measure(keyframe_seek, resample)
+            extract_cost = extract_costs[keyframe_seek]
+            if smart_select:
+                extract_cost *= _SMART_SELECT_COST
+            # concurrent extractions proceed in rounds
+            rounds = -(-len(missing(tile, keyframe_seek)) // jobs)
+            cost = (rounds * extract_cost +
+                    tile[0] * tile[1] * resize_costs[resample])
+            if include_sha1sum:
+                cost += self.video.size / _SHA1_THROUGHPUT
+            return time.time() + cost <= ends_at
+
+        if not fits() and include_sha1sum:
+            include_sha1sum = False
+            params['include_sha1sum'] = False
+            self.degradations.append("skipped SHA-1 digest")
+        if not fits() and smart_select:
+            smart_select = False
+            params['smart_select'] = False
+            self.degradations.append("disabled smart frame selection")
+        if not fits() and resample != Image.BILINEAR:
+            resample = Image.BILINEAR
+            params['thumbnail_resample'] = resample
+            self.degradations.append("bilinear thumbnail resampling")
+        if (not fits() and not keyframe_seek and
+                self._calibrate_seek() == 'input'):
+            keyframe_seek = True
+            params['keyframe_seek'] = True
+            self.degradations.append("seeks snapped to keyframes")
+        if not fits():
+            cols, rows = tile
+            while not fits() and tile != (1, 1):
+                # keep the width, drop rows first
+                if tile[1] > 1:
+                    tile = (tile[0], tile[1] - 1)
+                else:
+                    tile = (tile[0] - 1, 1)
+            params['tile'] = tile
+            self.degradations.append("tiles reduced from %dx%d to %dx%d" %
+                                     (cols, rows, tile[0], tile[1]))
+        return params
+
+    def _estimate_memory(self, params, assembled=True):
+        """Estimate the peak memory usage of a storyboard.
+
+        Only pixel data is counted: frames held at once (all of them
+        unless in streaming assembly, since they are kept in the
+        `frames` attribute), rows of thumbnails, the assembled
+        storyboard, and the working memory of encoders.
+
+        Parameters
+        ----------
+        params : dict
+            Parameters of `gen_storyboard`.
+        assembled : bool, optional
+            Whether the storyboard is assembled into a single image,
+            rather than encoded strip by strip. Default is ``True``.
+
+        Returns
+        -------
+        estimate : int
+            Estimated peak memory usage, in bytes.
+
+        """
+        tile = _read_param(params, 'tile', (4, 4))
+        tile_spacing = _read_param(params, 'tile_spacing', (8, 6))
+        margins = _read_param(params, 'margins', (10, 10))
+        thumbnail_width = _read_param(params, 'thumbnail_width', 480)
+        aspect_ratio = _read_param(params, 'thumbnail_aspect_ratio', None)
+        streaming_assembly = _read_param(params, 'streaming_assembly', False)
+        keyframes_only = _read_param(params, 'keyframes_only', False)
+        output_formats = _read_param(params, 'output_format', None)
+        if output_formats is None:
+            output_formats = []
+        elif not isinstance(output_formats, (list, tuple)):
+            output_formats = [output_formats]
+        width, height = (self.video.dimension
+                         if self.video.dimension is not None
+                         else _DEFAULT_DIMENSION)
+        if aspect_ratio is None:
+            aspect_ratio = (self.video.dar if self.video.dar is not None
+                            else width / height)
+        jobs = self._frame_jobs
+        if self._scheduler is not None:
+            jobs = min(jobs, self._scheduler.processes)
+
+        cols, rows = tile
+        # same formula as in create_thumbnail
+        thumbnail_height = int(round(thumbnail_width / aspect_ratio))
+        total_width = (thumbnail_width * cols + tile_spacing[0] * (cols - 1) +
+                       margins[0] * 2)
+        total_height = (thumbnail_height * rows +
+                        tile_spacing[1] * (rows - 1) + margins[1] * 2 +
+                        _TEXT_HEIGHT)
+
+        # pixels alive throughout, and alive at the peak of extraction
+        kept = 0
+        if keyframes_only:
+            # the previous and the current keyframe, already scaled
+            extracting = 2 * thumbnail_width * thumbnail_height
+        elif streaming_assembly:
+            # frames being extracted, plus the one being resized
+            extracting = min(cols * rows, jobs + 1) * width * height
+        else:
+            kept = cols * rows * width * height
+            extracting = 0
+        # the first row is kept until the header is out, next to the row
+        # being drawn and its strip
+        extracting += total_width * (thumbnail_height * 3 + _TEXT_HEIGHT)
+        # bytes used by encoders, which run after extraction
+        encoding = 0
+        if assembled:
+            kept += total_width * total_height
+            for output_format in output_formats:
+                encoding += (total_width * total_height *
+                             _ENCODING_OVERHEAD.get(
+                                 output_format, _DEFAULT_ENCODING_OVERHEAD))
+        return int(kept * _PIXEL_BYTES +
+                   max(extracting * _PIXEL_BYTES, encoding))
+
+    def _fit_memory_budget(self, params, budget, assembled=True):
+        """Switch to memory-saving modes to meet a memory budget.
+
+        See the `memory_budget` parameter of `gen_storyboard`. Modes are
+        switched on in order of increasing loss (`streaming_assembly`
+        only gives up keeping frames, `keyframes_only` gives up
+        accuracy) until the estimate of `_estimate_memory` fits in the
+        budget, and recorded in the `degradations` attribute. Strip
+        encoding is up to `save`, which knows the output format. These
+        modes suspend extraction between rows, which is safe under any
+        scheduler caps since nothing else needs I/O or process slots
+        once the metadata sheet is done (see `_gen_storyboard_strips`).
+
+        Parameters
+        ----------
+        params : dict
+            Parameters of `gen_storyboard`.
+        budget : int
+            Memory budget in bytes.
+        assembled : bool, optional
+            See `_estimate_memory`. Default is ``True``.
+
+        Returns
+        -------
+        params : dict
+            A copy of `params` with the memory-saving modes switched on.
+
+        Raises
+        ------
+        MemoryError
+            If the estimate exceeds the budget with all modes on.
+
+        """
+        params = dict(params)
+        for mode, description in (
+                ('streaming_assembly', "streaming assembly"),
+                ('keyframes_only', "keyframes only")):
+            estimate = self._estimate_memory(params, assembled=assembled)
+            if estimate <= budget:
+                return params
+            if not _read_param(params, mode, False):
+                params[mode] = True
+                self.degradations.append(description)
+        estimate = self._estimate_memory(params, assembled=assembled)
+        if estimate <= budget:
+            return params
+        hint = ""
+        if assembled:
+            hint = " (%s if encoded strip by strip as PNG)" % util.humansize(
+                self._estimate_memory(params, assembled=False))
+        raise MemoryError(
+            "storyboard of '%s' needs an estimated %s of memory%s even with "
+            "streaming assembly and keyframes only, over the budget of %s; "
+            "use fewer or narrower thumbnails, or raise the budget" %
+            (self.video.path, util.humansize(estimate), hint,
+             util.humansize(budget)))
+
+    def _gen_bare_storyboard(self, tile, thumbnail_width, params=None):
+        """Generate bare storyboard (thumbnails only).
+
+        Parameters
+        ----------
+        tile : tuple
+            A tuple ``(cols, rows)`` specifying the number of columns
+            and rows for the array of thumbnails.
+        thumbnail_width : int
+            Width of each thumbnail.
+        params : dict, optional
+            Optional parameters enclosed in a dict. Default is
+            ``None``. See the "Other Parameters" section for understood
+            key/value pairs.
+
+        Returns
+        -------
+        base_storyboard : PIL.Image.Image
+
+        Other Parameters
+        ----------------
+        tile_spacing : tuple, optional
+            See the `tile_spacing` parameter of the `tile_images`
+            function. Default is ``(0, 0)``.
+
+        background_color : color, optional
+            See the `canvas_color` paramter of the `tile_images`
+            function. Default is ``'white'``.
+
+        thumbnail_aspect_ratio : float, optional
             Aspect ratio of generated thumbnails. If ``None``, first try
             to use the display aspect ratio of the video
             (``self.video.dar``), then the aspect ratio of the frames if
@@ -849,12 +2794,96 @@ class StoryBoard(object):
         timestamp_align : {'right', 'center', 'left'}, optional
             See the `timestamp_align` parameter of the
             `create_thumbnail` function. Default is ``'right'``.
+        thumbnail_resample : int, optional
+            See the `resample` parameter of the `create_thumbnail`
+            function. Default is ``None``.
+
+        streaming_assembly : bool, optional
+            Whether to extract frames one at a time and release each
+            full-resolution frame as soon as its thumbnail has been
+            pasted onto the canvas, instead of keeping all of them in
+            the `frames` attribute. Existing frames matching the tile
+            count are reused either way. Default is ``False``.
+
+        smart_select : bool, optional
+            See the `smart_select` parameter of `gen_frames`, which also
+            lists the parameters tuning it. Default is ``False``.
+        keyframe_seek : bool, optional
+            See the `keyframe_seek` parameter of `gen_frames`. Default
+            is ``False``.
+        keyframes_only : bool, optional
+            See the `keyframes_only` parameter of `gen_storyboard`; the
+            thumbnails are created from the keyframes nearest to the
+            planned timestamps (see `_iter_keyframes`). Default is
+            ``False``.
 
         print_progress : bool, optional
             Whether to print progress information (to stderr). Default
             is False.
 
+        Notes
+        -----
+        Thumbnails are pasted into their slots as soon as they are
+        created (see `_iter_bare_storyboard_rows`), so that no list of
+        intermediate thumbnails is ever held in memory. The result is
+        identical to tiling the thumbnails with `tile_images`.
+
         """
+        from PIL import Image
+
+        if params is None:
+            params = {}
+        tile_spacing = _read_param(params, 'tile_spacing', (0, 0))
+        background_color = _read_param(params, 'background_color', 'white')
+
+        _, rows = tile
+        _, ver_spacing = tile_spacing
+        row_params = dict(params)
+        row_params['background_color'] = background_color
+        canvas = None
+        row = 0
+        for row_strip in self._iter_bare_storyboard_rows(
+                tile, thumbnail_width, params=row_params):
+            row_width, row_height = row_strip.size
+            if canvas is None:
+                canvas_height = row_height * rows + ver_spacing * (rows - 1)
+                canvas = Image.new('RGB', (row_width, canvas_height),
+                                   background_color)
+            canvas.paste(row_strip, (0, row * (row_height + ver_spacing)))
+            row_strip.close()
+            row += 1
+
+        return canvas
+
+    def _iter_bare_storyboard_rows(self, tile, thumbnail_width, params=None,
+                                   frames=None):
+        """Generate the rows of the bare storyboard, one at a time.
+
+        Each row is a strip of thumbnails with horizontal tile spacing
+        in between, but without vertical spacing.
+
+        Parameters
+        ----------
+        tile : tuple
+            A tuple ``(cols, rows)`` specifying the number of columns
+            and rows for the array of thumbnails.
+        thumbnail_width : int
+            Width of each thumbnail.
+        params : dict, optional
+            Optional parameters enclosed in a dict. Default is
+            ``None``. See the "Other Parameters" section of
+            `_gen_bare_storyboard` for understood key/value pairs.
+        frames : list, optional
+            A list of ``storyboard.frame.Frame`` objects to create the
+            thumbnails from, in place of the frames in the `frames`
+            attribute. Default is ``None``.
+
+        Yields
+        ------
+        row : PIL.Image.Image
+
+        """
+        from PIL import Image
 
         if params is None:
             params = {}
@@ -870,8 +2899,14 @@ class StoryBoard(object):
             thumbnail_aspect_ratio = None
         draw_timestamp = _read_param(params, 'draw_timestamp', False)
         if draw_timestamp:
-            timestamp_font = _read_param(params, 'timestamp_font', Font())
+            timestamp_font = _read_font_param(params, 'timestamp_font')
             timestamp_align = _read_param(params, 'timestamp_align', 'right')
+        resample = _read_param(params, 'thumbnail_resample', None)
+        streaming_assembly = _read_param(params, 'streaming_assembly', False)
+        smart_select = (_read_param(params, 'smart_select', False) and
+                        not self._seek_frame_by_frame)
+        keyframe_seek = _read_param(params, 'keyframe_seek', False)
+        keyframes_only = _read_param(params, 'keyframes_only', False)
         print_progress = _read_param(params, 'print_progress', False)
 
         cols, rows = tile
@@ -879,36 +2914,96 @@ class StoryBoard(object):
                 cols > 0 and rows > 0)):
             raise ValueError('tile is not a tuple of positive integers')
         thumbnail_count = cols * rows
-        self.gen_frames(cols * rows, params={
-            'print_progress': print_progress,
-        })
-        if thumbnail_aspect_ratio is None:
-            frame_size = self.frames[0].image.size
-            thumbnail_aspect_ratio = frame_size[0] / frame_size[1]
-
-        thumbnails = []
+        if frames is not None:
+            if len(frames) != thumbnail_count:
+                msg = "{} frames cannot fit into a {}x{}={} array".format(
+                    len(frames), cols, rows, thumbnail_count)
+                raise ValueError(msg)
+            release_frames = False
+        elif keyframes_only:
+            # decoded straight to the thumbnail size; the generator
+            # releases keyframes itself, as they may be used repeatedly
+            if thumbnail_aspect_ratio is not None:
+                size = (thumbnail_width,
+                        int(round(thumbnail_width / thumbnail_aspect_ratio)))
+            else:
+                size = (thumbnail_width, -2)
+            frames = self._iter_keyframes(
+                self._frame_timestamps(thumbnail_count), size)
+            release_frames = False
+        elif streaming_assembly and (
+                len(self.frames) != thumbnail_count or
+                smart_select != self._frames_smart_selected or
+                (keyframe_seek and not smart_select) !=
+                self._frames_keyframe_seek):
+            # stored frames are reused, but new ones are not stored
+            timestamps = self._frame_timestamps(thumbnail_count)
+            if smart_select:
+                frames = self._iter_smart_frames(
+                    timestamps, self.frame_store, params,
+                    print_progress=print_progress, add=False,
+                )
+            else:
+                frames = self._iter_stored_frames(
+                    timestamps, self.frame_store,
+                    print_progress=print_progress, add=False,
+                    keyframe_seek=keyframe_seek,
+                )
+            release_frames = True
+            stored = set(id(frame) for frame in self.frame_store)
+        else:
+            frame_params = {'print_progress': print_progress}
+            for key in _FRAME_KEYS:
+                if key in params:
+                    frame_params[key] = params[key]
+            self.gen_frames(thumbnail_count, params=frame_params)
+            frames = self.frames
+            release_frames = False
+        if not release_frames:
+            stored = set()
+
+        hor_spacing, _ = tile_spacing
+        row_width = thumbnail_width * cols + hor_spacing * (cols - 1)
+        row_strip = None
         counter = 0
-        for frame in self.frames:
+        for frame in frames:
+            col = counter % cols
             counter += 1
+            if row_strip is None:
+                # the aspect ratio might have to be read off from the
+                # first frame
+                if thumbnail_aspect_ratio is None:
+                    frame_size = frame.image.size
+                    thumbnail_aspect_ratio = frame_size[0] / frame_size[1]
+                # same formula as in create_thumbnail
+                thumbnail_height = int(round(thumbnail_width /
+                                             thumbnail_aspect_ratio))
+                row_strip = Image.new('RGB', (row_width, thumbnail_height),
+                                      background_color)
+
             if print_progress:
                 sys.stderr.write("\rGenerating thumbnail %d/%d..." %
                                  (counter, thumbnail_count))
-            thumbnails.append(create_thumbnail(frame, thumbnail_width, params={
+            thumbnail = create_thumbnail(frame, thumbnail_width, params={
                 'aspect_ratio': thumbnail_aspect_ratio,
                 'draw_timestamp': draw_timestamp,
                 'timestamp_font': timestamp_font,
                 'timestamp_align': timestamp_align,
-            }))
-        if print_progress:
-            sys.stderr.write("\n")
-
-        if print_progress:
-            sys.stderr.write("Tiling thumbnails...\n")
-        return tile_images(thumbnails, tile, params={
-            'tile_spacing': tile_spacing,
-            'canvas_color': background_color,
-            'close_separate_images': True,
-        })
+                'resample': resample,
+                'timings': self.timings,
+            })
+            with self.timings.timer('tiling'):
+                row_strip.paste(thumbnail,
+                                (col * (thumbnail_width + hor_spacing), 0))
+            thumbnail.close()
+            if release_frames and id(frame) not in stored:
+                frame.image.close()
+
+            if col == cols - 1:
+                if print_progress and counter == thumbnail_count:
+                    sys.stderr.write("\n")
+                yield row_strip
+                row_strip = None
 
     def _gen_metadata_sheet(self, total_width, params=None):
         """Generate metadata sheet.
@@ -947,10 +3042,11 @@ class StoryBoard(object):
             is False.
 
         """
+        from PIL import Image
 
         if params is None:
             params = {}
-        text_font = _read_param(params, 'text_font', Font())
+        text_font = _read_font_param(params, 'text_font')
         text_color = _read_param(params, 'text_color', 'black')
         line_spacing = _read_param(params, 'line_spacing', 1.2)
         background_color = _read_param(params, 'background_color', 'white')
@@ -962,19 +3058,20 @@ class StoryBoard(object):
             'print_progress': print_progress,
         })
 
-        _, total_height = draw_text_block(None, (0, 0), text, params={
-            'font': text_font,
-            'spacing': line_spacing,
-            'dry_run': True,
-        })
+        with self.timings.timer('text'):
+            _, total_height = draw_text_block(None, (0, 0), text, params={
+                'font': text_font,
+                'spacing': line_spacing,
+                'dry_run': True,
+            })
 
-        metadata_sheet = Image.new('RGBA', (total_width, total_height),
-                                   background_color)
-        draw_text_block(metadata_sheet, (0, 0), text, params={
-            'font': text_font,
-            'color': text_color,
-            'spacing': line_spacing,
-        })
+            metadata_sheet = Image.new('RGBA', (total_width, total_height),
+                                       background_color)
+            draw_text_block(metadata_sheet, (0, 0), text, params={
+                'font': text_font,
+                'color': text_color,
+                'spacing': line_spacing,
+            })
 
         return metadata_sheet
 
@@ -1009,10 +3106,11 @@ class StoryBoard(object):
             Default is 'white'.
 
         """
+        from PIL import Image
 
         if params is None:
             params = {}
-        text_font = _read_param(params, 'text_font', Font())
+        text_font = _read_font_param(params, 'text_font')
         text_color = _read_param(params, 'text_color', 'black')
         background_color = _read_param(params, 'background_color', 'white')
 
@@ -1042,6 +3140,13 @@ def main():
 
     # pylint: disable=too-many-statements,too-many-branches
 
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        # imported here since the server is not needed otherwise
+        from storyboard import server
+        return server.main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'dedup':
+        return _fingerprint.main(sys.argv[2:])
+
     description = """Generate video storyboards with metadata reports.
 
     You may supply a list of videos. For each video, the generated
@@ -1051,7 +3156,9 @@ def main():
     etc). Note that stdout is guaranteed to only receive the image
     paths, one per line, so you may embed this program in a streamlined
     script; stderr, on the other hand, may receive progress information
-    without guaranteed format (see the --print-progress option).
+    without guaranteed format (see the --print-progress option). Use
+    --output-dir or --output to save storyboards to their final
+    destination, or --output - to write the image itself to stdout.
 
     Below is the list of available options and their brief
     explanations. The options can also be stored in a configuration
@@ -1067,6 +3174,11 @@ def main():
     parameters are not exposed in the CLI, but you may easily write a
     wrapper script around the storyboard.storyboard if you'd like to.
 
+    Run "storyboard serve --help" for the long-running HTTP server mode,
+    and "storyboard dedup --help" to find near-duplicate videos (video
+    files named "serve" or "dedup" can be passed as "./serve" or
+    "./dedup").
+
     For more detailed explanations, see
     https://storyboard.readthedocs.io/en/stable/storyboard-cli.html (or
     replace "stable" with the version you are using).
@@ -1084,22 +3196,101 @@ def main():
         help="""The name/path of the ffprobe binary. The binay is
         guessed from OS type if this option is not specified.""")
     parser.add_argument(
-        '-f', '--output-format', choices=['jpeg', 'png'],
-        help="Output format of the storyboard image. Default is JPEG.")
+        '-f', '--output-format', metavar='FORMAT[,FORMAT...]',
+        help="""Output format(s) of the storyboard image, one or more
+        of %s, separated by commas. When several formats are given, the
+        storyboard is rendered once and encoded into all of them
+        concurrently, and one path is printed per format. Default is
+        JPEG.""" % ', '.join(_encoder.formats()))
     parser.add_argument(
         '--quality', type=int,
         help="""Quality of the output image, should be an integer
-        between 1 and 100. Only meaningful when the output format is
-        JPEG. Default is 85.""")
+        between 1 and 100. Only meaningful for lossy formats (JPEG and
+        WebP). Default is 85.""")
+    parser.add_argument(
+        '--preset', choices=_encoder.PRESETS,
+        help="""Encoder preset, trading encoding speed for output
+        size. Default is 'balanced'.""")
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument(
+        '-o', '--output', metavar='FILE',
+        help="""Save the storyboard to FILE, or write it to stdout if FILE
+        is '-', instead of a temporary file. Only available when a
+        single video and a single output format are given.""")
+    output_group.add_argument(
+        '--output-dir', metavar='DIR',
+        help="""Save storyboards to the existing directory DIR, instead
+        of temporary files. The filename of each storyboard is that of
+        the video with the extension replaced by that of the output
+        format; existing files are overwritten.""")
+    parser.add_argument(
+        '--strip-encoding', action='store_const', const=True,
+        help="""Render and encode the storyboard in horizontal strips
+        (one row of thumbnails at a time), so that memory usage stays
+        bounded no matter how large the storyboard is. Only available
+        for PNG output.""")
+    parser.add_argument(
+        '-j', '--jobs', type=int, metavar='N',
+        help="""Number of videos processed in parallel. The CPU cores of
+        the machine are shared among the videos being processed, so that
+        the machine is not oversubscribed. Paths are printed as
+        storyboards are finished, unless --ordered is given. Default
+        is 1.""")
+    parser.add_argument(
+        '--ordered', action='store_const', const=True,
+        help="""Print paths of storyboards in the order of the videos
+        given, rather than as they are finished. Only meaningful when
+        --jobs is greater than 1.""")
+    parser.add_argument(
+        '--cpu-budget', type=int, metavar='N',
+        help="""Number of CPUs shared by all FFmpeg processes (of all
+        videos processed in parallel). Default is the number of CPUs of
+        the machine.""")
+    parser.add_argument(
+        '--ffmpeg-processes', type=int, metavar='N',
+        help="""Maximum number of FFmpeg processes running at once, each
+        using an equal share of the CPU budget as threads. Default is
+        the CPU budget, i.e., single-threaded processes, which usually
+        maximizes throughput; fewer multithreaded processes may be
+        faster for high resolution videos.""")
+    parser.add_argument(
+        '--io-limits', metavar='SPEC',
+        help="""Maximum numbers of concurrent I/O jobs (frame
+        extraction, probing, hashing) per storage device, as comma
+        separated MOUNT_POINT=N entries, plus optionally a bare N for
+        all other devices, e.g., '/mnt/hdd=1,/mnt/ssd=16'. Limiting a
+        spinning disk to one or two jobs avoids seek thrashing when
+        several videos on it are processed in parallel. Default is no
+        limit.""")
+    _subproc.add_arguments(parser)
+    parser.add_argument(
+        '--deadline', type=float, metavar='SECONDS',
+        help="""Time budget of each storyboard, in seconds. If a
+        storyboard is estimated not to be ready in time, it is degraded
+        (SHA-1 digest skipped, bilinear resampling, seeks snapped to
+        keyframes, fewer thumbnails, in that order) until the estimate
+        fits, and a warning listing the degradations is printed. Best
+        effort; default is no deadline.""")
+    parser.add_argument(
+        '--memory-budget', type=int, metavar='MiB',
+        help="""Memory budget of the storyboards being generated at once
+        (split evenly among the --jobs videos), in MiB. If a storyboard
+        is estimated to need more, memory-saving modes (streaming
+        assembly, strip encoding for PNG output, keyframes only) are
+        switched on until it fits, and a warning listing them is
+        printed; if it still does not fit, it fails upfront. Default is
+        no budget.""")
     parser.add_argument(
         '--video-duration', type=float, metavar='SECONDS',
         help="""Video duration in seconds (float). By default the
-        duration is extracted from container metadata, but in case it is
-        not available or wrong, use this option to correct it and get a
-        saner storyboard. Note however that this option activates output
-        seeking (i.e., seeking the video frame by frame) in thumbnail
-        generation, so it will be *infinitely* slower than without this
-        option.""")
+        duration is extracted from container metadata, and thumbnails
+        are sampled over the video stream instead (read off the
+        timestamps of its last packets) if it is missing or wrong; in
+        case both are wrong, use this option to
+        correct it and get a saner storyboard. Note however that this
+        option activates output seeking (i.e., seeking the video frame
+        by frame) in thumbnail generation, so it will be *infinitely*
+        slower than without this option.""")
     parser.add_argument(
         '--exclude-sha1sum', '-s', action='store_const', const=True,
         help="Exclude SHA-1 digest of the video(s) from storyboard(s).")
@@ -1113,6 +3304,20 @@ def main():
         nargs='?', const='auto',
         help="""Whether to print progress information to stderr. Default
         is 'auto'.""")
+    parser.add_argument(
+        '--timings', action='store_const', const=True,
+        help="""Print a breakdown of the time spent in each stage
+        (probing, frame extraction, resizing, text drawing, tiling,
+        encoding, etc.) of each video to stderr.""")
+    parser.add_argument(
+        '--explain-plan', action='store_const', const=True,
+        help="""Print how frames of each video were extracted (a seek
+        per frame, or a single sequential pass), and the estimated
+        costs the choice was based on, to stderr.""")
+    parser.add_argument(
+        '--timings-json', metavar='FILE',
+        help="""Write the time spent in each stage of each video to
+        FILE, as JSON.""")
     parser.add_argument(
         '--version', action='version', version=version.__version__)
     cli_args = parser.parse_args()
@@ -1129,9 +3334,26 @@ def main():
         'ffprobe_bin': ffprobe_bin_guessed,
         'output_format': 'jpeg',
         'quality': 85,
+        'preset': 'balanced',
+        'output_dir': None,
+        'strip_encoding': False,
+        'jobs': 1,
+        'ordered': False,
+        'cpu_budget': None,
+        'ffmpeg_processes': None,
+        'io_limits': None,
+        'timeout': None,
+        'memory_limit': None,
+        'cpu_time_limit': None,
+        'nice': None,
+        'ionice': None,
+        'deadline': None,
+        'memory_budget': None,
         'video_duration': None,
         'exclude-sha1sum': False,
         'verbose': 'auto',
+        'timings': False,
+        'explain_plan': False,
     }
 
     optreader = util.OptionReader(
@@ -1141,14 +3363,93 @@ def main():
         defaults=defaults,
     )
     bins = (optreader.opt('ffmpeg_bin'), optreader.opt('ffprobe_bin'))
-    output_format = optreader.opt('output_format')
-    if output_format not in ['jpeg', 'png']:
-        msg = ("fatal error: output format should be either 'jpeg' or 'png'; "
-               "'%s' received instead\n" % output_format)
+    output_formats = [fmt.strip() for fmt in
+                      optreader.opt('output_format').split(',')]
+    for output_format in output_formats:
+        if output_format not in _encoder.formats():
+            msg = ("fatal error: output format should be one of %s; "
+                   "'%s' received instead\n" %
+                   (', '.join("'%s'" % fmt for fmt in _encoder.formats()),
+                    output_format))
+            sys.stderr.write(msg)
+            exit(1)
+        try:
+            # e.g., WebP support missing from Pillow
+            _encoder.suffix(output_format)
+        except ValueError as err:
+            sys.stderr.write("fatal error: %s\n" % str(err))
+            exit(1)
+    # remove duplicates while preserving order
+    output_formats = [fmt for index, fmt in enumerate(output_formats)
+                      if fmt not in output_formats[:index]]
+    quality = optreader.opt('quality', opttype=int)
+    preset = optreader.opt('preset')
+    if preset not in _encoder.PRESETS:
+        msg = ("fatal error: encoder preset should be one of %s; "
+               "'%s' received instead\n" %
+               (', '.join("'%s'" % p for p in _encoder.PRESETS), preset))
         sys.stderr.write(msg)
         exit(1)
-    suffix = '.jpg' if output_format == 'jpeg' else '.png'
-    quality = optreader.opt('quality', opttype=int)
+    output = cli_args.output
+    output_dir = None if output is not None else optreader.opt('output_dir')
+    if output is not None:
+        if len(cli_args.videos) > 1 or len(output_formats) > 1:
+            msg = ("fatal error: --output is only available for a single "
+                   "video and a single output format\n")
+            sys.stderr.write(msg)
+            exit(1)
+    if output_dir is not None:
+        output_dir = os.path.expanduser(output_dir)
+        if not os.path.isdir(output_dir):
+            msg = ("fatal error: output directory '%s' does not exist\n" %
+                   output_dir)
+            sys.stderr.write(msg)
+            exit(1)
+    strip_encoding = optreader.opt('strip_encoding', opttype=bool)
+    if strip_encoding and output_formats != ['png']:
+        msg = ("fatal error: strip encoding is only available for PNG "
+               "output\n")
+        sys.stderr.write(msg)
+        exit(1)
+    jobs = optreader.opt('jobs', opttype=int)
+    if jobs < 1:
+        msg = ("fatal error: number of jobs should be a positive integer; "
+               "%d received instead\n" % jobs)
+        sys.stderr.write(msg)
+        exit(1)
+    ordered = optreader.opt('ordered', opttype=bool)
+    cpu_budget = optreader.opt('cpu_budget', opttype=int)
+    ffmpeg_processes = optreader.opt('ffmpeg_processes', opttype=int)
+    for name, value in (('CPU budget', cpu_budget),
+                        ('number of FFmpeg processes', ffmpeg_processes)):
+        if value is not None and value < 1:
+            msg = ("fatal error: %s should be a positive integer; "
+                   "%d received instead\n" % (name, value))
+            sys.stderr.write(msg)
+            exit(1)
+    try:
+        io_limits, io_limit = _scheduler.parse_io_limits(
+            optreader.opt('io_limits') or '')
+        # validate caps and mount points upfront
+        _scheduler.Scheduler(cpus=1, io_limits=io_limits, io_limit=io_limit)
+        process_limits = _subproc.limits_from_options(optreader)
+    except ValueError as err:
+        sys.stderr.write("fatal error: %s\n" % str(err))
+        exit(1)
+    deadline = optreader.opt('deadline', opttype=float)
+    if deadline is not None and deadline <= 0:
+        msg = ("fatal error: deadline should be positive; %s received "
+               "instead\n" % deadline)
+        sys.stderr.write(msg)
+        exit(1)
+    memory_budget = optreader.opt('memory_budget', opttype=int)
+    if memory_budget is not None:
+        if memory_budget <= 0:
+            msg = ("fatal error: memory budget should be positive; %s "
+                   "received instead\n" % memory_budget)
+            sys.stderr.write(msg)
+            exit(1)
+        memory_budget *= 2 ** 20
     video_duration = optreader.opt('video_duration', opttype=float)
     include_sha1sum = not optreader.opt('exclude_sha1sum', opttype=bool)
     if cli_args.include_sha1sum:
@@ -1168,6 +3469,25 @@ def main():
             print_progress = True
         else:
             print_progress = False
+    print_timings = optreader.opt('timings', opttype=bool)
+    explain_plan = optreader.opt('explain_plan', opttype=bool)
+    timings_json = cli_args.timings_json
+    # list of (video, timings)
+    timing_reports = []
+
+    def report_timings(returncode):
+        """Report timings if requested, and return the return code."""
+        if print_timings or timings_json is not None:
+            try:
+                util.report_timings(timing_reports, params={
+                    'print_breakdown': print_timings,
+                    'json_file': timings_json,
+                })
+            except OSError as err:
+                sys.stderr.write("error: failed to write timings: %s\n" %
+                                 str(err))
+                returncode = 1
+        return returncode
 
     # test bins
     try:
@@ -1179,40 +3499,123 @@ def main():
         exit(1)
 
     # real stuff happens from here
-    returncode = 0
-    for video in cli_args.videos:
+    if output is None:
+        returncode = 0
         try:
-            storyboard_image = StoryBoard(video, params={
-                'bins': bins,
-                'video_duration': video_duration,
-                'print_progress': print_progress,
-            }).gen_storyboard(params={
-                'include_sha1sum': include_sha1sum,
-                'print_progress': print_progress,
-            })
-        except OSError as err:
-            sys.stderr.write("error: %s\n\n" % str(err))
-            returncode = 1
-            continue
-
-        tempfd, storyboard_file = tempfile.mkstemp(
-            prefix='storyboard-', suffix=suffix)
-        os.close(tempfd)
-        if output_format == 'jpeg':
-            storyboard_image.save(storyboard_file, 'jpeg', quality=quality,
-                                  optimize=True, progressive=True)
-        else:  # 'png'
-            storyboard_image.save(storyboard_file, 'png', optimize=True)
-
+            for result in batch.run(cli_args.videos, params={
+                    'jobs': jobs,
+                    'ordered': ordered,
+                    'cpu_budget': cpu_budget,
+                    'ffmpeg_processes': ffmpeg_processes,
+                    'io_limits': io_limits,
+                    'io_limit': io_limit,
+                    'process_limits': process_limits,
+                    'bins': bins,
+                    'video_duration': video_duration,
+                    'output_format': output_formats,
+                    'output_dir': output_dir,
+                    'quality': quality,
+                    'preset': preset,
+                    'strip_encoding': strip_encoding,
+                    'include_sha1sum': include_sha1sum,
+                    'deadline': deadline,
+                    'memory_budget': memory_budget,
+                    'print_progress': print_progress,
+            }):
+                if result.timings is not None:
+                    timing_reports.append((result.video, result.timings))
+                if explain_plan and result.plan is not None:
+                    sys.stderr.write("%s:\n%s\n" % (result.video, result.plan))
+                if result.degradations:
+                    sys.stderr.write("warning: %s: degraded to meet the "
+                                     "deadline or memory budget: %s\n" %
+                                     (result.video,
+                                      ', '.join(result.degradations)))
+                if result.error is not None:
+                    if jobs > 1:
+                        sys.stderr.write("error: %s: %s\n\n" %
+                                         (result.video, result.error))
+                    else:
+                        sys.stderr.write("error: %s\n\n" % result.error)
+                    returncode = 1
+                    continue
+                if print_progress:
+                    sys.stderr.write("\n")
+                    sys.stderr.write("storyboard saved to: ")
+                    sys.stderr.flush()
+                    print(result.outputs[0])
+                    for storyboard_file in result.outputs[1:]:
+                        sys.stderr.write("                     ")
+                        sys.stderr.flush()
+                        print(storyboard_file)
+                    sys.stderr.write("\n")
+                else:
+                    for storyboard_file in result.outputs:
+                        print(storyboard_file)
+                sys.stdout.flush()
+        except ValueError as err:
+            # e.g., two videos saved to the same file
+            sys.stderr.write("fatal error: %s\n" % str(err))
+            exit(1)
+        return report_timings(returncode)
+
+    # a single video, saved to the given file or stdout
+    video = cli_args.videos[0]
+    output_format = output_formats[0]
+    if output == '-':
+        # Python 3 writes bytes through sys.stdout.buffer, while Python
+        # 2's sys.stdout is binary already
+        fileobj = getattr(sys.stdout, 'buffer', sys.stdout)
+    else:
+        fileobj = output
+        output_existed = os.path.exists(output)
+    scheduler = _scheduler.Scheduler(cpus=cpu_budget,
+                                     processes=ffmpeg_processes,
+                                     io_limits=io_limits, io_limit=io_limit)
+    try:
+        sb = StoryBoard(video, params={
+            'bins': bins,
+            'video_duration': video_duration,
+            'print_progress': print_progress,
+            'scheduler': scheduler,
+            'process_limits': process_limits,
+            'frame_jobs': scheduler.processes,
+        })
+        timing_reports.append((video, sb.timings))
+        sb.save(fileobj, output_format=output_format, params={
+            'quality': quality,
+            'preset': preset,
+            'strip_encoding': strip_encoding,
+            'include_sha1sum': include_sha1sum,
+            'deadline': deadline,
+            'memory_budget': memory_budget,
+            'print_progress': print_progress,
+        })
+        if explain_plan and sb.plan is not None:
+            sys.stderr.write("%s:\n%s\n" % (video, sb.plan.explain()))
+        if sb.degradations:
+            sys.stderr.write("warning: %s: degraded to meet the deadline or "
+                             "memory budget: %s\n" %
+                             (video, ', '.join(sb.degradations)))
+    except (OSError, MemoryError) as err:
+        sys.stderr.write("error: %s\n\n" % str(err))
+        if (output != '-' and not output_existed and
+                os.path.exists(output)):
+            os.remove(output)
+        return report_timings(1)
+    if output == '-':
+        fileobj.flush()
         if print_progress:
-            sys.stderr.write("\n")
-            sys.stderr.write("storyboard saved to: ")
-            sys.stderr.flush()
-            print(storyboard_file)
-            sys.stderr.write("\n")
-        else:
-            print(storyboard_file)
-    return returncode
+            sys.stderr.write("\nstoryboard written to stdout\n\n")
+    elif print_progress:
+        sys.stderr.write("\n")
+        sys.stderr.write("storyboard saved to: ")
+        sys.stderr.flush()
+        print(output)
+        sys.stderr.write("\n")
+    else:
+        print(output)
+    return report_timings(0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+
+"""Run FFmpeg and ffprobe under timeouts and resource limits.
+
+A corrupt or adversarial video may make FFmpeg or ffprobe hang forever,
+or consume unbounded memory or CPU time; in a batch or a server, a
+single such file would then stall or starve all others. Processes
+launched through `Process` with `Limits` are
+
+* killed, together with their whole process group, once a timeout
+  expires (reported as ``OSError`` by the functions launching them);
+* started with ``setrlimit`` limits on their address space and CPU
+  time, so that the kernel stops them when exceeded;
+* optionally deprioritized for CPU (``nice``) and I/O (``ionice``,
+  Linux only), so that batch work does not starve interactive work on
+  the same host.
+
+Functions launching FFmpeg or ffprobe (``storyboard.frame``,
+``storyboard.metadata`` and ``storyboard.storyboard``) accept a
+``process_limits`` parameter.
+
+Classes
+-------
+.. autosummary::
+    Limits
+    Process
+
+Routines
+--------
+.. autosummary::
+    add_arguments
+    limits_from_options
+
+----
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import errno
+import os
+import signal
+import subprocess
+import threading
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+
+# I/O scheduling classes accepted by ionice, and the arguments selecting
+# them
+_IONICE_CLASSES = {
+    'idle': ['-c', '3'],
+    'best-effort': ['-c', '2'],
+}
+
+
+def _which(name):
+    """Return the absolute path of an executable on PATH, or None."""
+    for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+        candidate = os.path.join(directory, name)
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return os.path.abspath(candidate)
+    return None
+
+
+class Limits(object):
+
+    """Limits imposed on each FFmpeg or ffprobe process.
+
+    All limits are optional; ``None`` means unlimited (or unchanged).
+
+    Parameters
+    ----------
+    timeout : float, optional
+        Wall clock seconds a process may run before it is killed. For
+        processes streaming frames (see
+        ``storyboard.frame.extract_frames``), seconds the process may
+        go without producing a frame.
+    memory : int, optional
+        Maximum size of the address space of a process, in bytes
+        (``RLIMIT_AS``). Note that this counts virtual memory, which is
+        usually several times the resident memory of FFmpeg.
+    cpu_time : int, optional
+        Maximum CPU time of a process, in seconds (``RLIMIT_CPU``),
+        counting all its threads.
+    nice : int, optional
+        Niceness added to that of processes, e.g., 10 to run them at a
+        lower CPU priority.
+    ionice : str, optional
+        I/O scheduling class of processes, ``'idle'`` (only get disk
+        time when no other process needs it) or ``'best-effort'``
+        (optionally followed by a priority level from 0, highest, to 7,
+        lowest, e.g., ``'best-effort:7'``). Requires the ``ionice``
+        command (Linux).
+
+    Raises
+    ------
+    ValueError
+        If a limit is out of range, or not supported on this platform.
+
+    Attributes
+    ----------
+    timeout, memory, cpu_time, nice, ionice
+        See parameters.
+
+    """
+
+    # pylint: disable=too-few-public-methods,too-many-arguments
+
+    def __init__(self, timeout=None, memory=None, cpu_time=None, nice=None,
+                 ionice=None):
+        for name, value in (('timeout', timeout), ('memory limit', memory),
+                            ('CPU time limit', cpu_time)):
+            if value is not None and value <= 0:
+                raise ValueError("%s should be positive; %s received "
+                                 "instead" % (name, value))
+        if ((memory is not None or cpu_time is not None) and
+                resource is None):
+            raise ValueError("resource limits are not supported on this "
+                             "platform")
+        if nice is not None and not hasattr(os, 'nice'):
+            raise ValueError("nice is not supported on this platform")
+        self._ionice_args = None
+        if ionice is not None:
+            ioclass, _, level = ionice.partition(':')
+            if ioclass not in _IONICE_CLASSES or (
+                    level and (ioclass != 'best-effort' or
+                               level not in '01234567' or len(level) != 1)):
+                raise ValueError("invalid ionice class '%s'" % ionice)
+            ionice_bin = _which('ionice')
+            if ionice_bin is None:
+                raise ValueError("ionice is not available on this platform")
+            self._ionice_args = [ionice_bin] + _IONICE_CLASSES[ioclass]
+            if level:
+                self._ionice_args += ['-n', level]
+        self.timeout = timeout
+        self.memory = memory
+        self.cpu_time = cpu_time
+        self.nice = nice
+        self.ionice = ionice
+
+    def _preexec(self):
+        """Apply the limits; run in the child between fork and exec.
+
+        Only makes system calls (no locks are taken), so that it is
+        safe to fork from a multithreaded parent.
+
+        """
+        if self.memory is not None:
+            resource.setrlimit(resource.RLIMIT_AS,
+                               (self.memory, self.memory))
+        if self.cpu_time is not None:
+            # SIGXCPU at the soft limit, SIGKILL one second later
+            resource.setrlimit(resource.RLIMIT_CPU,
+                               (self.cpu_time, self.cpu_time + 1))
+        if self.nice is not None:
+            os.nice(self.nice)
+
+
+class Process(subprocess.Popen):
+
+    """A ``subprocess.Popen`` subject to `Limits`.
+
+    On POSIX systems, the process is started in a process group of its
+    own, so that `kill` also gets rid of any children it spawned. If a
+    timeout is set, a watchdog thread kills the process once it
+    expires, and sets `timed_out`; call `check_timeout` after the
+    process has finished (or its output has been consumed) to turn that
+    into an error.
+
+    Parameters
+    ----------
+    args : list
+        Command line, as for ``subprocess.Popen``.
+    limits : Limits, optional
+        If ``None``, the process is started just like with
+        ``subprocess.Popen``. Default is ``None``.
+    **kwargs
+        Other keyword arguments of ``subprocess.Popen``.
+
+    Attributes
+    ----------
+    limits : Limits
+    timed_out : bool
+        Whether the process has been killed by the watchdog.
+
+    """
+
+    def __init__(self, args, limits=None, **kwargs):
+        self.limits = limits
+        self.timed_out = False
+        self._name = os.path.basename(args[0])
+        self._own_group = False
+        self._watchdog = None
+        self._watchdog_lock = threading.Lock()
+        if limits is not None:
+            # pylint: disable=protected-access
+            if limits._ionice_args is not None:
+                args = limits._ionice_args + list(args)
+            if os.name == 'posix':
+                self._own_group = True
+                preexec = limits._preexec
+
+                def preexec_fn():
+                    """Start a new session and apply the limits."""
+                    os.setsid()
+                    preexec()
+
+                kwargs['preexec_fn'] = preexec_fn
+        subprocess.Popen.__init__(self, args, **kwargs)
+        self.reset_timeout()
+
+    def reset_timeout(self):
+        """Restart the watchdog, e.g., after the process made progress."""
+        timeout = self.limits.timeout if self.limits is not None else None
+        if timeout is None:
+            return
+        with self._watchdog_lock:
+            if self._watchdog is not None:
+                self._watchdog.cancel()
+            if self.returncode is not None or self.timed_out:
+                return
+            self._watchdog = threading.Timer(timeout, self._expire)
+            self._watchdog.daemon = True
+            self._watchdog.start()
+
+    def _expire(self):
+        """Kill the process upon timeout."""
+        self.timed_out = True
+        self.kill()
+
+    def stop_timeout(self):
+        """Stop the watchdog, if any, until `reset_timeout`."""
+        with self._watchdog_lock:
+            if self._watchdog is not None:
+                self._watchdog.cancel()
+                self._watchdog = None
+
+    def kill(self):
+        """Kill the process (and its process group, if any)."""
+        if self.returncode is not None:
+            return
+        if not self._own_group:
+            try:
+                subprocess.Popen.kill(self)
+            except OSError:
+                # already exited
+                pass
+            return
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except OSError as err:
+            if err.errno != errno.ESRCH:
+                raise
+
+    def terminate(self):
+        """Same as `kill`; FFmpeg holds nothing worth a graceful exit."""
+        self.kill()
+
+    def wait(self, *args, **kwargs):
+        """Wait for the process to exit, then stop the watchdog."""
+        returncode = subprocess.Popen.wait(self, *args, **kwargs)
+        self.stop_timeout()
+        return returncode
+
+    def check_timeout(self):
+        """Raise ``OSError`` if the process has been killed upon timeout."""
+        if self.timed_out:
+            raise OSError("%s timed out after %s seconds" %
+                          (self._name, self.limits.timeout))
+
+
+def add_arguments(parser):
+    """Add command line options for `Limits` to an argparse parser.
+
+    The options are ``--timeout``, ``--memory-limit``,
+    ``--cpu-time-limit``, ``--nice`` and ``--ionice``; see
+    `limits_from_options`.
+
+    """
+    parser.add_argument(
+        '--timeout', type=float, metavar='SECONDS',
+        help="""Kill FFmpeg and ffprobe processes running for longer than
+        SECONDS (or, for processes streaming frames, going without
+        producing a frame for that long), and fail the video. Default is
+        no timeout.""")
+    parser.add_argument(
+        '--memory-limit', type=int, metavar='MiB',
+        help="""Maximum virtual memory (address space) of each FFmpeg and
+        ffprobe process, in MiB. Default is no limit.""")
+    parser.add_argument(
+        '--cpu-time-limit', type=int, metavar='SECONDS',
+        help="""Maximum CPU time of each FFmpeg and ffprobe process, in
+        seconds. Default is no limit.""")
+    parser.add_argument(
+        '--nice', type=int, metavar='N',
+        help="""Run FFmpeg and ffprobe processes with niceness increased
+        by N. Default is 0.""")
+    parser.add_argument(
+        '--ionice', metavar='CLASS',
+        help="""I/O scheduling class of FFmpeg and ffprobe processes:
+        'idle', or 'best-effort' optionally followed by a level from 0
+        to 7, e.g., 'best-effort:7' (Linux only). Default is
+        unchanged.""")
+
+
+def limits_from_options(optreader):
+    """Construct `Limits` from options added by `add_arguments`.
+
+    Parameters
+    ----------
+    optreader : storyboard.util.OptionReader
+        Reading the command line arguments, and config file options
+        named ``timeout``, ``memory_limit``, ``cpu_time_limit``,
+        ``nice`` and ``ionice``.
+
+    Returns
+    -------
+    limits : Limits
+        Or ``None`` if no limit is set.
+
+    Raises
+    ------
+    ValueError
+        If a limit is invalid.
+
+    """
+    timeout = optreader.opt('timeout', opttype=float)
+    memory = optreader.opt('memory_limit', opttype=int)
+    cpu_time = optreader.opt('cpu_time_limit', opttype=int)
+    nice = optreader.opt('nice', opttype=int)
+    ionice = optreader.opt('ionice')
+    if all(value is None for value in (timeout, memory, cpu_time, nice,
+                                       ionice)):
+        return None
+    return Limits(timeout=timeout,
+                  memory=memory * 2 ** 20 if memory is not None else None,
+                  cpu_time=cpu_time, nice=nice, ionice=ionice)
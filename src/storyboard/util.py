@@ -7,15 +7,18 @@ Classes
 .. autosummary::
     ProgressBar
     OptionReader
+    Timings
 
 Routines
 --------
 .. autosummary::
     read_param
+    import_numpy
     round_up
     evaluate_ratio
     humansize
     humantime
+    report_timings
 
 ----
 
@@ -29,10 +32,13 @@ try:
     import configparser
 except ImportError:
     import ConfigParser as configparser
+import contextlib
+import json
 import math
 import os
 import re
 import sys
+import threading
 import time
 
 
@@ -65,6 +71,36 @@ def read_param(params, key, default):
     return params[key] if key in params else default
 
 
+def import_numpy(feature):
+    """Import NumPy, an optional dependency of this package.
+
+    Parameters
+    ----------
+    feature : str
+        What NumPy is needed for, e.g., ``'perceptual hashing'``, to be
+        included in the error message.
+
+    Returns
+    -------
+    numpy : module
+
+    Raises
+    ------
+    ImportError
+        If NumPy is not installed, with a message telling how to install
+        it.
+
+    """
+
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("%s requires NumPy; install it with 'pip install "
+                          "numpy' or 'pip install storyboard[smart]'" %
+                          feature)
+    return numpy
+
+
 def round_up(number, ndigits=0):
     """Round a floating point number *upward* to a given precision.
 
@@ -714,3 +750,129 @@ class OptionReader(object):
             return self._default_opts[name]
         else:
             return None
+
+
+# monotonic high resolution clock where available
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class Timings(dict):
+    """Cumulative wall clock time spent in named stages.
+
+    A dict mapping stage names (e.g., ``'ffprobe'`` or ``'encoding'``)
+    to the total number of seconds spent in them so far, in the order
+    the stages were first entered. Time is accumulated with `add` or
+    the `timer` context manager, both of which are thread-safe.
+
+    Note that when a stage runs concurrently in several threads (e.g.,
+    frame extraction with ``frame_jobs`` greater than 1), the times of
+    all threads are added up, so that the total may exceed the wall
+    clock time of the whole run.
+
+    """
+
+    def __init__(self):
+        dict.__init__(self)
+        self._lock = threading.Lock()
+        self._order = []
+
+    def add(self, stage, seconds):
+        """Add `seconds` to the time spent in `stage`."""
+        with self._lock:
+            if stage not in self:
+                self._order.append(stage)
+                self[stage] = 0.0
+            self[stage] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Context manager timing the enclosed block as `stage`.
+
+        Time is recorded even if the block raises.
+
+        """
+        start = _clock()
+        try:
+            yield
+        finally:
+            self.add(stage, _clock() - start)
+
+    def stages(self):
+        """Return the list of ``(stage, seconds)`` in order."""
+        with self._lock:
+            return [(stage, self[stage]) for stage in self._order]
+
+    def format(self):
+        """Format the timings as a human readable breakdown.
+
+        Returns
+        -------
+        str
+            One line per stage, with the number of seconds and the
+            percentage of the sum of all stages.
+
+        """
+        stages = self.stages()
+        total = sum(seconds for _, seconds in stages)
+        lines = []
+        for stage, seconds in stages:
+            percentage = 100 * seconds / total if total > 0 else 0
+            lines.append('%-16s %9.3fs %5.1f%%' %
+                         (stage, seconds, percentage))
+        lines.append('%-16s %9.3fs' % ('total', total))
+        return '\n'.join(lines)
+
+
+def report_timings(reports, params=None):
+    """Report per-stage timings of a CLI run.
+
+    Parameters
+    ----------
+    reports : list
+        A list of tuples ``(video, timings)``, where ``timings`` is a
+        `Timings` object (or a plain dict of stages) for ``video``.
+    params : dict, optional
+        Optional parameters enclosed in a dict. Default is ``None``.
+        See the "Other Parameters" section for understood key/value
+        pairs.
+
+    Raises
+    ------
+    OSError
+        If the JSON file cannot be written.
+
+    Other Parameters
+    ----------------
+    print_breakdown : bool, optional
+        Whether to print a human readable breakdown of each video to
+        stderr. Default is ``False``.
+    json_file : str, optional
+        Path to a file to write the timings to, as a JSON object
+        mapping each video to an object mapping stages to seconds. If
+        ``None``, do not write JSON. Default is ``None``.
+
+    """
+
+    if params is None:
+        params = {}
+    print_breakdown = read_param(params, 'print_breakdown', False)
+    json_file = read_param(params, 'json_file', None)
+
+    if print_breakdown:
+        for video, timings in reports:
+            if not isinstance(timings, Timings):
+                plain, timings = timings, Timings()
+                for stage in plain:
+                    timings.add(stage, plain[stage])
+            sys.stderr.write("timings of %s:\n%s\n" %
+                             (video, timings.format()))
+    if json_file is not None:
+        try:
+            with open(json_file, 'w') as fp:
+                json.dump(dict((video, dict(timings))
+                               for video, timings in reports),
+                          fp, indent=2, sort_keys=True)
+                fp.write('\n')
+        except IOError as err:
+            # IOError is not a subclass of OSError in Python 2
+            raise OSError(str(err))
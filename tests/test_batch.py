@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import imghdr
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from storyboard import fflocate
+from storyboard.batch import *
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.videofiles = []
+        bins = fflocate.guess_bins()
+        fflocate.check_bins(bins)
+        self.bins = bins
+        for color in ['pink', 'navy']:
+            fd, videofile = tempfile.mkstemp(prefix='storyboard-test-',
+                                             suffix='.mkv')
+            os.close(fd)
+            with open(os.devnull, 'wb') as devnull:
+                subprocess.check_call([
+                    bins[0],
+                    '-f', 'lavfi',
+                    '-i', 'color=c=%s:s=320x180:d=10' % color,
+                    '-y', videofile,
+                ], stdout=devnull, stderr=devnull)
+            self.videofiles.append(videofile)
+        self.output_dir = tempfile.mkdtemp(prefix='storyboard-test-')
+
+    def tearDown(self):
+        for videofile in self.videofiles:
+            os.remove(videofile)
+        for filename in os.listdir(self.output_dir):
+            os.remove(os.path.join(self.output_dir, filename))
+        os.rmdir(self.output_dir)
+
+    def test_cpu_budget(self):
+        self.assertEqual(cpu_budget(2, 8), 4)
+        self.assertEqual(cpu_budget(3, 8), 2)
+        self.assertEqual(cpu_budget(16, 8), 1)
+        self.assertGreaterEqual(cpu_budget(1), 1)
+
+    def test_run(self):
+        nonexistent = os.path.join(self.output_dir, 'nonexistent.mkv')
+        paths = self.videofiles + [nonexistent]
+        results = list(run(paths, params={
+            'jobs': 2,
+            'cpu_budget': 2,
+            'ordered': True,
+            'bins': self.bins,
+            'output_format': ['jpeg', 'png'],
+            'output_dir': self.output_dir,
+            'include_sha1sum': False,
+        }))
+        self.assertEqual([result.video for result in results], paths)
+        for videofile, result in zip(self.videofiles, results):
+            self.assertIsNone(result.error)
+            basename = os.path.splitext(os.path.basename(videofile))[0]
+            self.assertEqual(result.outputs, [
+                os.path.join(self.output_dir, basename + '.jpg'),
+                os.path.join(self.output_dir, basename + '.png'),
+            ])
+            self.assertEqual(imghdr.what(result.outputs[0]), 'jpeg')
+            self.assertEqual(imghdr.what(result.outputs[1]), 'png')
+        self.assertIsNotNone(results[2].error)
+        self.assertEqual(results[2].outputs, [])
+
+        # unordered, in process, temporary files
+        results = list(run(self.videofiles, params={
+            'jobs': 1,
+            'bins': self.bins,
+            'include_sha1sum': False,
+        }))
+        self.assertEqual(sorted(result.video for result in results),
+                         sorted(self.videofiles))
+        for result in results:
+            self.assertEqual(imghdr.what(result.outputs[0]), 'jpeg')
+            os.remove(result.outputs[0])
+
+        with self.assertRaises(ValueError):
+            list(run(self.videofiles, params={'output_format': 'gif'}))
+        with self.assertRaises(ValueError):
+            list(run(self.videofiles, params={'strip_encoding': True}))
+        # same basename in different directories
+        otherdir = tempfile.mkdtemp(prefix='storyboard-test-')
+        self.addCleanup(shutil.rmtree, otherdir)
+        namesake = os.path.join(otherdir, os.path.splitext(
+            os.path.basename(self.videofiles[0]))[0] + '.mp4')
+        shutil.copy(self.videofiles[0], namesake)
+        with self.assertRaises(ValueError):
+            list(run([self.videofiles[0], namesake], params={
+                'output_dir': self.output_dir,
+            }))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import io
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import inputs
+from benchmarks import memory
+from benchmarks.harness import *
+
+
+class TestBenchmarkHarness(unittest.TestCase):
+
+    def test_time_benchmark(self):
+        calls = []
+        stats = time_benchmark(lambda: lambda: calls.append(None), repeat=4)
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(stats['repeat'], 4)
+        self.assertLessEqual(stats['min'], stats['median'])
+
+    def test_compare(self):
+        def results(**medians):
+            return {
+                'version': RESULTS_VERSION,
+                'benchmarks': dict((name, {'median': median})
+                                   for name, median in medians.items()),
+            }
+        baseline = results(a=1.0, b=2.0, c=1.0)
+        current = results(a=1.1, b=3.0, d=1.0)
+        self.assertEqual(compare(current, baseline, tolerance=0.2), [
+            ('a', 1.0, 1.1, 1.1, False),
+            ('b', 2.0, 3.0, 1.5, True),
+        ])
+
+        fp = io.StringIO()
+        save_results(current, fp)
+        fp.seek(0)
+        self.assertEqual(load_results(fp), current)
+        with self.assertRaises(ValueError):
+            load_results(io.StringIO(u'{"benchmarks": {}}'))
+
+
+@unittest.skipUnless(memory.rss_available(), "cannot sample RSS")
+class TestMemoryGuard(unittest.TestCase):
+
+    # reference workload: 4x4 storyboard of a 720p video; absolute
+    # peaks depend on the interpreter, the Pillow build and the
+    # allocator, so only relations between workloads run on the same
+    # host are checked
+    SPEC = inputs.InputSpec('720p-h264-gop25-4s', (1280, 720), 4,
+                            'libx264', 25)
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        cls.video = inputs.generate(cls.SPEC, cls.tmpdir)
+        cls.results = {}
+        for mode in ('default', 'streaming'):
+            cls.results[mode] = memory.measure_isolated({
+                'video': cls.video,
+                'tile': (4, 4),
+                'streaming_assembly': mode == 'streaming',
+            })
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_stages(self):
+        for result in self.results.values():
+            for stage in ('frame_seek', 'resize', 'tiling'):
+                self.assertLessEqual(result['stages'][stage]['peak_rss'],
+                                     result['peak_rss'])
+
+    def test_streaming(self):
+        # streaming assembly holds one frame at a time instead of 16
+        # (2.6 MiB each), which should at least halve the peak RSS
+        default = self.results['default']['peak_rss']
+        streaming = self.results['streaming']['peak_rss']
+        self.assertLess(
+            streaming, default / 2,
+            "streaming peak_rss regressed: %.1f MiB, default %.1f MiB" %
+            (streaming / (1 << 20), default / (1 << 20)))
+
+
+if __name__ == '__main__':
+    unittest.main()
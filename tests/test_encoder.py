@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+from storyboard.encoder import *
+
+
+class TestEncoder(unittest.TestCase):
+
+    def test_encode_image(self):
+        image = Image.new('RGB', (64, 40), 'pink')
+        for fmt in ['jpeg', 'png', 'webp']:
+            self.assertIn(fmt, formats())
+            for preset in PRESETS:
+                output = io.BytesIO()
+                encode_image(image, output, fmt, params={'preset': preset})
+                output.seek(0)
+                self.assertEqual(Image.open(output).format, fmt.upper())
+        self.assertEqual(suffix('jpeg'), '.jpg')
+        with self.assertRaises(ValueError):
+            encode_image(image, io.BytesIO(), 'gif')
+        with self.assertRaises(ValueError):
+            encode_image(image, io.BytesIO(), 'png',
+                         params={'preset': 'fastest'})
+
+    def test_presets(self):
+        # noise, which compresses differently with every setting
+        image = Image.frombytes('RGB', (64, 64), os.urandom(64 * 64 * 3))
+        sizes = {}
+        for fmt in ['jpeg', 'png']:
+            for preset in PRESETS:
+                output = io.BytesIO()
+                encode_image(image, output, fmt, params={'preset': preset})
+                sizes[fmt, preset] = len(output.getvalue())
+        self.assertLessEqual(sizes['jpeg', 'smallest'],
+                             sizes['jpeg', 'balanced'])
+        # presets do not affect quality
+        for preset in PRESETS:
+            output = io.BytesIO()
+            encode_image(image, output, 'jpeg', params={'preset': preset})
+            output.seek(0)
+            reference = io.BytesIO()
+            image.save(reference, 'jpeg', quality=85)
+            reference.seek(0)
+            self.assertEqual(Image.open(output).tobytes(),
+                             Image.open(reference).tobytes())
+        # PNG defaults to the optimized output
+        output = io.BytesIO()
+        image.save(output, 'png', optimize=True)
+        self.assertEqual(sizes['png', 'balanced'], len(output.getvalue()))
+        self.assertEqual(sizes['png', 'smallest'], sizes['png', 'balanced'])
+        # the smallest JPEG is also written to paths
+        tmpdir = tempfile.mkdtemp(prefix='storyboard-test-')
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'smallest.jpg')
+        encode_image(image, path, 'jpeg', params={'preset': 'smallest'})
+        self.assertEqual(os.path.getsize(path), sizes['jpeg', 'smallest'])
+
+    def test_unsupported_format(self):
+        # as if Pillow were built without WebP support
+        Image.init()
+        save_handler = Image.SAVE.pop('WEBP', None)
+        try:
+            with self.assertRaises(ValueError):
+                suffix('webp')
+            with self.assertRaises(ValueError):
+                encode_image(Image.new('RGB', (8, 8)), io.BytesIO(), 'webp')
+        finally:
+            if save_handler is not None:
+                Image.SAVE['WEBP'] = save_handler
+        self.assertEqual(suffix('jpeg'), '.jpg')
+
+    def test_register_format(self):
+        def encode_bmp(image, fp, quality, preset):
+            image.save(fp, 'bmp')
+
+        register_format('bmp', encode_bmp, '.bmp')
+        self.assertEqual(suffix('bmp'), '.bmp')
+        output = io.BytesIO()
+        encode_image(Image.new('RGB', (8, 8)), output, 'bmp')
+        output.seek(0)
+        self.assertEqual(Image.open(output).format, 'BMP')
+
+    def test_png_strip_writer(self):
+        image = Image.new('RGB', (64, 40), 'pink')
+        image.paste(Image.new('RGB', (20, 30), 'navy'), (10, 5))
+        # write in strips of uneven heights
+        fp = io.BytesIO()
+        writer = PNGStripWriter(fp, image.size, params={'chunk_size': 64})
+        for top, bottom in [(0, 7), (7, 8), (8, 33), (33, 40)]:
+            writer.write(image.crop((0, top, 64, bottom)))
+        self.assertEqual(writer.rows_written, 40)
+        writer.close()
+        fp.seek(0)
+        decoded = Image.open(fp)
+        self.assertEqual(decoded.format, 'PNG')
+        self.assertEqual(decoded.size, (64, 40))
+        self.assertEqual(decoded.convert('RGB').tobytes(), image.tobytes())
+        # strips in other modes are converted
+        fp = io.BytesIO()
+        writer = PNGStripWriter(fp, (8, 2))
+        writer.write(Image.new('RGBA', (8, 2), 'red'))
+        writer.close()
+        fp.seek(0)
+        self.assertEqual(Image.open(fp).getpixel((0, 0)), (255, 0, 0))
+
+    def test_png_strip_writer_errors(self):
+        with self.assertRaises(ValueError):
+            PNGStripWriter(io.BytesIO(), (0, 10))
+        writer = PNGStripWriter(io.BytesIO(), (8, 4))
+        # wrong width
+        with self.assertRaises(ValueError):
+            writer.write(Image.new('RGB', (9, 1)))
+        # overflow
+        with self.assertRaises(ValueError):
+            writer.write(Image.new('RGB', (8, 5)))
+        # incomplete image
+        writer.write(Image.new('RGB', (8, 3)))
+        with self.assertRaises(ValueError):
+            writer.close()
+        writer.write(Image.new('RGB', (8, 1)))
+        writer.close()
+        with self.assertRaises(RuntimeError):
+            writer.write(Image.new('RGB', (8, 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
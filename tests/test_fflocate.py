@@ -1,12 +1,25 @@
 #!/usr/bin/env python3
 
+import json
+import os
+import shutil
+import stat
+import tempfile
 import unittest
 
+from storyboard import fflocate
 from storyboard.fflocate import *
 
 
 class TestFFlocate(unittest.TestCase):
 
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.tmpdir, 'cache', 'fflocate.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
     def test_guess_bins(self):
         bins = guess_bins()
         self.assertIsInstance(bins, tuple)
@@ -20,6 +33,86 @@ class TestFFlocate(unittest.TestCase):
         with self.assertRaises(OSError):
             check_bins(('', ''))
 
+    @unittest.skipIf(os.name == 'nt', "requires a POSIX shell")
+    def test_check_bins_disk_cache(self):
+        # fake binary counting its launches
+        launches = os.path.join(self.tmpdir, 'launches')
+        binary = os.path.join(self.tmpdir, 'fakeffmpeg')
+        with open(binary, 'w') as fp:
+            fp.write('#!/bin/sh\necho >>%s\necho "ffmpeg version 1.2.3"\n' %
+                     launches)
+        os.chmod(binary, os.stat(binary).st_mode | stat.S_IXUSR)
+
+        def count_launches():
+            if not os.path.exists(launches):
+                return 0
+            with open(launches) as fp:
+                return len(fp.readlines())
+
+        params = {'cache_file': self.cache_file}
+        self.assertTrue(check_bins((binary, None), params=params))
+        self.assertEqual(count_launches(), 1)
+        # remembered by the process
+        self.assertTrue(check_bins((binary, None), params=params))
+        self.assertEqual(count_launches(), 1)
+        # remembered on disk, e.g., by another process
+        fflocate._checked_bins.discard(binary)
+        self.assertTrue(check_bins((binary, None), params=params))
+        self.assertEqual(count_launches(), 1)
+        # invalidated when the binary is modified
+        fflocate._checked_bins.discard(binary)
+        mtime = os.stat(binary).st_mtime
+        os.utime(binary, (mtime + 10, mtime + 10))
+        self.assertTrue(check_bins((binary, None), params=params))
+        self.assertEqual(count_launches(), 2)
+        # disk cache disabled
+        fflocate._checked_bins.discard(binary)
+        self.assertTrue(check_bins((binary, None),
+                                   params={'cache_file': None}))
+        self.assertEqual(count_launches(), 3)
+
+        with open(self.cache_file) as fp:
+            cache = json.load(fp)
+        self.assertIn(os.path.abspath(binary), cache['binaries'])
+
+    def test_probe(self):
+        ffmpeg_bin, ffprobe_bin = guess_bins()
+        params = {'cache_file': self.cache_file}
+        capabilities = probe(ffmpeg_bin, params=params)
+        self.assertIsInstance(capabilities, Capabilities)
+        self.assertTrue(os.path.isabs(capabilities.path))
+        self.assertTrue(capabilities.version)
+        self.assertIn('png', capabilities.encoders)
+        self.assertIn('h264', capabilities.decoders)
+        self.assertIn('scale', capabilities.filters)
+        self.assertIn('rgb24', capabilities.pix_fmts)
+        self.assertIn('ss', capabilities.options)
+        self.assertNotIn('-ss', capabilities.options)
+        self.assertIn('read_intervals',
+                      probe(ffprobe_bin, params=params).options)
+
+        # cached in the process, and on disk
+        self.assertIs(probe(ffmpeg_bin, params=params), capabilities)
+        fflocate._capabilities.clear()
+        cached = probe(ffmpeg_bin, params=params)
+        self.assertIsNot(cached, capabilities)
+        self.assertEqual(cached.to_dict(), capabilities.to_dict())
+
+        with self.assertRaises(OSError):
+            probe('no-such-ffmpeg', params=params)
+
+    def test_capabilities(self):
+        capabilities = Capabilities('/usr/bin/ffmpeg', 'n4.4.1-3',
+                                    encoders=['png'], options=['ss'])
+        self.assertEqual(capabilities.version_info, (4, 4, 1))
+        self.assertEqual(capabilities.encoders, frozenset(['png']))
+        self.assertEqual(capabilities.filters, frozenset())
+        self.assertEqual(
+            Capabilities.from_dict(capabilities.to_dict()).to_dict(),
+            capabilities.to_dict())
+        self.assertEqual(
+            Capabilities('ffmpeg', 'N-109541-g1a5d2f4').version_info, ())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from PIL import Image, ImageDraw
+
+from storyboard import fflocate
+from storyboard.fingerprint import *
+
+from .testing_infrastructure import capture_stdout, capture_stderr, \
+    change_home
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def test_bk_tree(self):
+        rng = random.Random(0)
+        keys = [rng.getrandbits(16) for _ in range(500)]
+        tree = BKTree(distance=hamming_distance)
+        for index, key in enumerate(keys):
+            tree.add(key, index)
+        self.assertEqual(len(tree), 500)
+        for query in keys[:20]:
+            for radius in [0, 2, 4]:
+                expected = sorted(
+                    index for index, key in enumerate(keys)
+                    if hamming_distance(query, key) <= radius)
+                results = tree.search(query, radius)
+                self.assertEqual(sorted(item for _, _, item in results),
+                                 expected)
+                distances = [distance for distance, _, _ in results]
+                self.assertEqual(distances, sorted(distances))
+        self.assertEqual(BKTree().search(VideoSignature([0]), 10), [])
+
+    def test_signature(self):
+        sig1 = VideoSignature([0x0, 0xff])
+        sig2 = VideoSignature([0x1, 0xf0])
+        self.assertEqual(sig1.distance(sig2), 5)
+        self.assertEqual(sig1.to_string(),
+                         '0000000000000000:00000000000000ff')
+        self.assertEqual(VideoSignature.from_string(sig1.to_string()), sig1)
+        with self.assertRaises(ValueError):
+            sig1.distance(VideoSignature([0]))
+
+        signatures = [
+            ('a', VideoSignature([0x0, 0x0])),
+            ('b', VideoSignature([0xffff, 0xffff])),
+            ('c', VideoSignature([0x7, 0x0])),
+            ('d', VideoSignature([0xfff0, 0xffff])),
+            ('e', VideoSignature([0x3, 0x1])),
+        ]
+        self.assertEqual(find_duplicates(signatures, params={'threshold': 2}),
+                         [['a', 'c', 'e'], ['b', 'd']])
+        self.assertEqual(find_duplicates(signatures, params={'threshold': 1}),
+                         [['c', 'e']])
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def test_hash_images(self):
+        image = Image.new('RGB', (320, 180), 'white')
+        draw = ImageDraw.Draw(image)
+        draw.ellipse([40, 20, 200, 160], fill='navy')
+        draw.rectangle([220, 60, 300, 170], fill='orange')
+        rescaled = image.resize((160, 90), Image.BILINEAR)
+        different = image.transpose(Image.FLIP_LEFT_RIGHT)
+        for method in HASH_METHODS:
+            hashes = hash_images([image, rescaled, different],
+                                 params={'method': method})
+            self.assertTrue(all(0 <= h < 2 ** 64 for h in hashes))
+            self.assertLessEqual(hamming_distance(hashes[0], hashes[1]), 4)
+            self.assertGreater(hamming_distance(hashes[0], hashes[2]), 16)
+        self.assertEqual(hash_images([]), [])
+        with self.assertRaises(ValueError):
+            hash_images([image], params={'method': 'ahash'})
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def test_main(self):
+        tmpdir = tempfile.mkdtemp(prefix='storyboard-test-')
+        self.addCleanup(shutil.rmtree, tmpdir)
+        bins = fflocate.guess_bins()
+        fflocate.check_bins(bins)
+        original = os.path.join(tmpdir, 'original.mkv')
+        copy = os.path.join(tmpdir, 'copy.mp4')
+        other = os.path.join(tmpdir, 'other.mkv')
+        with open(os.devnull, 'wb') as devnull:
+            for source, size, output in [
+                    ('testsrc', '320x180', original),
+                    ('testsrc', '160x90', copy),
+                    ('smptebars', '320x180', other)]:
+                subprocess.check_call([
+                    bins[0], '-f', 'lavfi',
+                    '-i', '%s=s=%s:d=8' % (source, size),
+                    '-y', output,
+                ], stdout=devnull, stderr=devnull)
+        index_file = os.path.join(tmpdir, 'index.json')
+
+        with change_home():
+            with capture_stdout():
+                returncode = main(['--index', index_file, '--json',
+                                   '--frames', '4', original, other])
+                self.assertEqual(returncode, 0)
+                self.assertEqual(json.loads(sys.stdout.getvalue()), [])
+            with open(index_file) as fp:
+                self.assertEqual(len(json.load(fp)['videos']), 2)
+            # the copy is matched against the indexed original
+            with capture_stdout():
+                with capture_stderr():
+                    returncode = main([
+                        '--index', index_file, '--frames', '4',
+                        copy, os.path.join(tmpdir, 'nonexistent.mkv')])
+                    self.assertRegex(sys.stderr.getvalue(), 'nonexistent')
+                self.assertEqual(returncode, 1)
+                self.assertEqual(sys.stdout.getvalue().split('\n'),
+                                 [copy, original, ''])
+            # other settings are refused, and the index is left alone
+            with open(index_file) as fp:
+                stored = fp.read()
+            for settings in (['--frames', '8'], ['--method', 'phash']):
+                with capture_stdout():
+                    with capture_stderr():
+                        returncode = main(['--index', index_file] +
+                                          settings + [other])
+                        self.assertRegex(sys.stderr.getvalue(),
+                                         '--frames 4 --method dhash')
+                    self.assertEqual(returncode, 1)
+                with open(index_file) as fp:
+                    self.assertEqual(fp.read(), stored)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from PIL import Image
+
+from storyboard.frame import *
+
+
+class TestFrame(unittest.TestCase):
+
+    def test_frame_store(self):
+        store = FrameStore()
+        self.assertIsNone(store.nearest(1.0, tolerance=10))
+        frames = [Frame(timestamp, Image.new('RGB', (4, 4)))
+                  for timestamp in [3.0, 1.0, 2.0]]
+        for frame in frames:
+            store.add(frame)
+        self.assertEqual(len(store), 3)
+        self.assertEqual([frame.timestamp for frame in store],
+                         [1.0, 2.0, 3.0])
+        self.assertIn(frames[0], store)
+        self.assertIs(store.nearest(2.0), frames[2])
+        self.assertIsNone(store.nearest(2.2))
+        self.assertIs(store.nearest(2.2, tolerance=0.25), frames[2])
+        self.assertIs(store.nearest(2.8, tolerance=0.25), frames[0])
+        self.assertIs(store.nearest(0.0, tolerance=1), frames[1])
+        self.assertIsNone(store.nearest(3.5, tolerance=0.25))
+        # replace
+        replacement = Frame(2.0, Image.new('RGB', (4, 4)))
+        store.add(replacement)
+        self.assertEqual(len(store), 3)
+        self.assertIs(store.nearest(2.0), replacement)
+        # frames snapped to keyframes are kept apart
+        snapped = Frame(2.0, Image.new('RGB', (4, 4)))
+        store.add(snapped, keyframe=True)
+        self.assertEqual(len(store), 4)
+        self.assertIn(snapped, store)
+        self.assertIs(store.nearest(2.0), replacement)
+        self.assertIs(store.nearest(2.0, keyframe=True), snapped)
+        self.assertIsNone(store.nearest(1.0, tolerance=0.5, keyframe=True))
+        store.clear()
+        self.assertEqual(len(store), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -130,6 +130,59 @@ class TestMetadata(unittest.TestCase):
         self.assertAlmostEqual(vid.duration, 10.0)
         self.assertEqual(humantime(vid.duration), vid.duration_text)
 
+    def test_estimate_duration(self):
+        vid = Video(self.videofile, params={'ffprobe_bin': self.ffprobe_bin})
+        self.assertAlmostEqual(vid.container_duration, vid.duration)
+        self.assertAlmostEqual(vid.sampling_duration, vid.duration)
+
+        # streamed Matroska, without duration (nor index)
+        fd, streamed = tempfile.mkstemp(prefix='storyboard-test-',
+                                        suffix='.mkv')
+        os.close(fd)
+        self.addCleanup(os.remove, streamed)
+        with open(streamed, 'wb') as fp, open(os.devnull, 'wb') as devnull:
+            subprocess.check_call([
+                self.ffmpeg_bin,
+                '-f', 'lavfi',
+                '-i', 'testsrc=s=320x180:r=25:d=10',
+                '-g', '50',
+                '-f', 'matroska', '-',
+            ], stdout=fp, stderr=devnull)
+        vid = Video(streamed, params={'ffprobe_bin': self.ffprobe_bin})
+        self.assertIsNone(vid.container_duration)
+        self.assertIsNone(vid.duration)
+        self.assertAlmostEqual(vid.sampling_duration, 10.0, places=2)
+        vid = Video(streamed, params={'ffprobe_bin': self.ffprobe_bin,
+                                      'estimate_duration': False})
+        self.assertIsNone(vid.sampling_duration)
+
+        # truncated file, claiming the full duration
+        with open(self.videofile, 'rb') as fp:
+            data = fp.read()
+        with open(streamed, 'wb') as fp:
+            fp.write(data[:len(data) // 2])
+        vid = Video(streamed, params={'ffprobe_bin': self.ffprobe_bin})
+        self.assertAlmostEqual(vid.duration, 10.0, places=1)
+        self.assertLess(vid.sampling_duration, 9.0)
+
+        # audio running longer than the video: the reported duration is
+        # still the container duration
+        fd, longer_audio = tempfile.mkstemp(prefix='storyboard-test-',
+                                            suffix='.mp4')
+        os.close(fd)
+        self.addCleanup(os.remove, longer_audio)
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call([
+                self.ffmpeg_bin, '-y',
+                '-f', 'lavfi', '-i', 'testsrc=s=320x180:r=25:d=10',
+                '-f', 'lavfi', '-i', 'sine=d=14',
+                longer_audio,
+            ], stdout=devnull, stderr=devnull)
+        vid = Video(longer_audio, params={'ffprobe_bin': self.ffprobe_bin})
+        self.assertAlmostEqual(vid.duration, 14.0, places=1)
+        self.assertEqual(humantime(vid.duration), vid.duration_text)
+        self.assertAlmostEqual(vid.sampling_duration, 10.0, places=1)
+
     def assertSha1sumIncluded(self):
         # sys.stdout has to support getvalue (e.g., through
         # capture_stdout)
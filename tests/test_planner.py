@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import os
+import subprocess
+import tempfile
+import unittest
+
+from storyboard import fflocate
+from storyboard.metadata import Video
+from storyboard.planner import *
+from storyboard.storyboard import StoryBoard
+
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.bins = fflocate.guess_bins()
+        fd, self.videofile = tempfile.mkstemp(prefix='storyboard-test-',
+                                              suffix='.mkv')
+        os.close(fd)
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call([
+                self.bins[0],
+                '-f', 'lavfi',
+                '-i', 'testsrc=s=320x180:r=25:d=10',
+                '-y', self.videofile,
+            ], stdout=devnull, stderr=devnull)
+        self.video = Video(self.videofile, params={
+            'ffprobe_bin': self.bins[1],
+        })
+
+    def tearDown(self):
+        os.remove(self.videofile)
+
+    def timestamps(self, count):
+        interval = self.video.duration / count
+        return [interval * (i + 0.5) for i in range(count)]
+
+    def test_plan(self):
+        # many frames of a short clip with long GOPs: one pass
+        plan_ = plan(self.video, self.timestamps(16),
+                     params={'gop': 250, 'history': None})
+        self.assertEqual(plan_.strategy, 'sequential')
+        self.assertEqual(set(plan_.estimates), set(['seek', 'sequential']))
+        self.assertEqual(plan_.estimates, plan_.model_estimates)
+        explanation = plan_.explain()
+        self.assertIn('extraction strategy: sequential', explanation)
+        self.assertIn('(chosen)', explanation)
+        self.assertIn('GOP ~250 frames', explanation)
+
+        # a few frames of a two hour video: seeks
+        self.video.duration = 7200
+        plan_ = plan(self.video, self.timestamps(16),
+                     params={'gop': 250, 'jobs': 4, 'history': None})
+        self.assertEqual(plan_.strategy, 'seek')
+        self.video.duration = 10
+
+        # a sequential pass decodes with its own number of threads
+        single = plan(self.video, self.timestamps(16), params={
+            'gop': 250, 'jobs': 4, 'threads': 1, 'history': None})
+        quad = plan(self.video, self.timestamps(16), params={
+            'gop': 250, 'jobs': 4, 'threads': 4, 'history': None})
+        self.assertGreater(single.estimates['sequential'],
+                           quad.estimates['sequential'])
+        self.assertEqual(single.estimates['seek'], quad.estimates['seek'])
+        self.assertIn('with 1 thread ', single.explain())
+
+        plan_ = plan(self.video, self.timestamps(4),
+                     params={'keyframe_seek': True, 'history': None})
+        self.assertEqual(set(plan_.estimates),
+                         set(['keyframe_seek', 'sequential']))
+        plan_ = plan(self.video, self.timestamps(16),
+                     params={'strategies': ('seek',), 'history': None})
+        self.assertEqual(plan_.strategy, 'seek')
+        with self.assertRaises(ValueError):
+            plan(self.video, self.timestamps(4),
+                 params={'strategies': ('telepathy',)})
+
+    def test_history(self):
+        history = History(smoothing=0.5)
+        self.assertEqual(history.factor('seek'), 1.0)
+        history.record('seek', 1.0, 4.0)
+        self.assertEqual(history.factor('seek'), 4.0)
+        history.record('seek', 1.0, 2.0)
+        self.assertEqual(history.factor('seek'), 3.0)
+        # unmeasured strategies follow the speed of the machine
+        history.record('sequential', 1.0, 12.0)
+        self.assertAlmostEqual(history.factor('keyframe_seek'), 6.0)
+        history.record('seek', 0, 1.0)
+        self.assertEqual(history.factor('seek'), 3.0)
+
+        # sequential passes turned out to be very slow
+        timestamps = self.timestamps(16)
+        model = plan(self.video, timestamps,
+                     params={'gop': 250, 'history': None})
+        history = History()
+        history.record('seek', 1.0, 1.0)
+        history.record('sequential', 1.0, 100.0)
+        plan_ = plan(self.video, timestamps,
+                     params={'gop': 250, 'history': history})
+        self.assertEqual(plan_.strategy, 'seek')
+        self.assertEqual(plan_.model_estimates, model.estimates)
+        self.assertIn('corrected from past runs', plan_.explain())
+
+    def test_storyboard(self):
+        history = History()
+        sb = StoryBoard(self.video, params={
+            'bins': self.bins,
+            'plan_history': history,
+        })
+        self.assertIsNone(sb.plan)
+        sb.gen_frames(16)
+        self.assertEqual(sb.plan.strategy, 'sequential')
+        self.assertNotEqual(history.factor('sequential'), 1.0)
+        # the same frames as seeking
+        seeking = StoryBoard(self.video, params={
+            'bins': self.bins,
+            'extraction_strategy': 'seek',
+            'plan_history': None,
+        })
+        seeking.gen_frames(16)
+        self.assertEqual(seeking.plan.strategy, 'seek')
+        for frame, sought in zip(sb.frames, seeking.frames):
+            self.assertEqual(frame.timestamp, sought.timestamp)
+            self.assertEqual(frame.image.tobytes(), sought.image.tobytes())
+
+        # missing frames in between stored ones
+        sb.gen_frames(32)
+        self.assertEqual(len(sb.frame_store), 32)
+        self.assertEqual(len(set(id(frame) for frame in sb.frames)), 32)
+        for frame, timestamp in zip(sb.frames, sb._frame_timestamps(32)):
+            self.assertLessEqual(abs(frame.timestamp - timestamp), 10 / 64)
+
+        # planned with the threads the pass is run with
+        threaded = StoryBoard(self.video, params={
+            'bins': self.bins,
+            'ffmpeg_threads': 3,
+            'plan_history': None,
+        })
+        threaded.gen_frames(16)
+        self.assertIn('with 3 threads', threaded.plan.explain())
+
+        with self.assertRaises(ValueError):
+            StoryBoard(self.video, params={
+                'bins': self.bins,
+                'extraction_strategy': 'telepathy',
+            })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from storyboard.quality import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "NumPy not installed")
+class TestQuality(unittest.TestCase):
+
+    def setUp(self):
+        self.textured = Image.new('RGB', (160, 90), 'gray')
+        draw = ImageDraw.Draw(self.textured)
+        for x in range(0, 160, 8):
+            draw.line([(x, 0), (x, 89)], fill='white', width=2)
+        for y in range(0, 90, 10):
+            draw.line([(0, y), (159, y)], fill='navy', width=3)
+        self.blurred = self.textured.filter(ImageFilter.GaussianBlur(4))
+        self.black = Image.new('RGB', (160, 90), 'black')
+        self.blank = Image.new('RGB', (160, 90), 'pink')
+
+    def test_score_images(self):
+        images = [self.black, self.blank, self.blurred, self.textured]
+        scores = score_images(images)
+        self.assertEqual(len(scores), 4)
+        self.assertLess(scores[0], scores[2])
+        self.assertLess(scores[1], scores[2])
+        self.assertLess(scores[2], scores[3])
+        # thresholds
+        scores = score_images([self.black, self.blank],
+                              params={'dark_threshold': 0,
+                                      'blank_threshold': 0})
+        self.assertGreater(min(scores), -100)
+
+        with self.assertRaises(ValueError):
+            score_images([])
+        with self.assertRaises(ValueError):
+            score_images([self.black, Image.new('RGB', (16, 9))])
+
+    def test_best_image(self):
+        self.assertEqual(best_image([self.black, self.textured,
+                                     self.blurred]), 1)
+        # first one in case of a tie
+        self.assertEqual(best_image([self.blank, self.blank.copy()]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
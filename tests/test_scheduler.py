@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+import io
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from storyboard import fflocate
+from storyboard.scheduler import *
+from storyboard.storyboard import StoryBoard
+
+
+class RecordingScheduler(Scheduler):
+
+    """Scheduler recording the peak usage and the threads granted."""
+
+    def __init__(self, *args, **kwargs):
+        Scheduler.__init__(self, *args, **kwargs)
+        self.peak = (0, 0)
+        self.granted = []
+        self._record_lock = threading.Lock()
+
+    def acquire(self, threads=None):
+        granted = Scheduler.acquire(self, threads)
+        with self._record_lock:
+            processes, used = self.usage()
+            self.peak = (max(self.peak[0], processes),
+                         max(self.peak[1], used))
+            self.granted.append(granted)
+        return granted
+
+
+def _acquire_in_worker(threads):
+    return get_scheduler().acquire(threads)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_acquire_release(self):
+        scheduler = Scheduler(cpus=4, processes=2)
+        self.assertEqual(scheduler.acquire(), 2)
+        self.assertEqual(scheduler.acquire(), 2)
+        self.assertEqual(scheduler.usage(), (2, 4))
+
+        # a third process has to wait
+        acquired = threading.Event()
+
+        def acquire():
+            scheduler.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.2))
+        scheduler.release(2)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        self.assertEqual(scheduler.usage(), (2, 4))
+
+        # threads granted are capped by the CPUs left
+        scheduler = Scheduler(cpus=3, processes=3)
+        with scheduler.slot(2) as threads:
+            self.assertEqual(threads, 2)
+            with scheduler.slot(2) as threads:
+                self.assertEqual(threads, 1)
+        self.assertEqual(scheduler.usage(), (0, 0))
+        with scheduler.slot(10) as threads:
+            self.assertEqual(threads, 3)
+
+        with self.assertRaises(ValueError):
+            Scheduler(cpus=0)
+        with self.assertRaises(ValueError):
+            Scheduler(cpus=2, processes=0)
+
+    def test_process_slot(self):
+        with process_slot(None, 3) as threads:
+            self.assertEqual(threads, 3)
+        with process_slot(None) as threads:
+            self.assertIsNone(threads)
+        scheduler = Scheduler(cpus=2, processes=1)
+        with process_slot(scheduler) as threads:
+            self.assertEqual(threads, 2)
+            self.assertEqual(scheduler.usage(), (1, 2))
+
+    def test_shared(self):
+        scheduler = Scheduler(cpus=4, processes=4, shared=True)
+        set_scheduler(scheduler)
+        try:
+            self.assertIs(get_scheduler(), scheduler)
+            pool = multiprocessing.Pool(2, initializer=set_scheduler,
+                                        initargs=(scheduler,))
+            try:
+                self.assertEqual(pool.map(_acquire_in_worker, [1, 2]),
+                                 [1, 2])
+            finally:
+                pool.terminate()
+                pool.join()
+            # usage is visible to the parent process
+            self.assertEqual(scheduler.usage(), (2, 3))
+        finally:
+            set_scheduler(None)
+
+    def test_io_slot(self):
+        fd, path = tempfile.mkstemp(prefix='storyboard-test-')
+        os.close(fd)
+        try:
+            scheduler = Scheduler(cpus=1,
+                                  io_limits={os.path.dirname(path): 2})
+            running = [0]
+            peak = [0]
+            lock = threading.Lock()
+
+            def job():
+                with io_slot(scheduler, path):
+                    with lock:
+                        running[0] += 1
+                        peak[0] = max(peak[0], running[0])
+                    time.sleep(0.05)
+                    with lock:
+                        running[0] -= 1
+
+            threads = [threading.Thread(target=job) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(peak[0], 2)
+            self.assertEqual(scheduler.io_usage(path), 0)
+
+            # other devices (and missing files) are not limited by
+            # default
+            scheduler = Scheduler(cpus=1)
+            with scheduler.io_slot(path), scheduler.io_slot(path):
+                self.assertEqual(scheduler.io_usage(path), 0)
+            scheduler = Scheduler(cpus=1, io_limit=1)
+            with scheduler.io_slot(path):
+                self.assertEqual(scheduler.io_usage(path), 1)
+                with scheduler.io_slot(path + '.missing'):
+                    pass
+            with io_slot(None, path):
+                pass
+        finally:
+            os.remove(path)
+
+        with self.assertRaises(ValueError):
+            Scheduler(cpus=1, io_limit=0)
+        with self.assertRaises(ValueError):
+            Scheduler(cpus=1, io_limits={'/nonexistent-mount-point': 1})
+
+    def test_parse_io_limits(self):
+        self.assertEqual(parse_io_limits(''), ({}, None))
+        self.assertEqual(parse_io_limits('/mnt/hdd=1, /mnt/ssd=16,4'),
+                         ({'/mnt/hdd': 1, '/mnt/ssd': 16}, 4))
+        self.assertEqual(parse_io_limits('/mnt/a=b=2'), ({'/mnt/a=b': 2},
+                                                          None))
+        with self.assertRaises(ValueError):
+            parse_io_limits('/mnt/hdd')
+        with self.assertRaises(ValueError):
+            parse_io_limits('/mnt/hdd=one')
+
+    def test_storyboard(self):
+        bins = fflocate.guess_bins()
+        fd, videofile = tempfile.mkstemp(prefix='storyboard-test-',
+                                         suffix='.mkv')
+        os.close(fd)
+        try:
+            with open(os.devnull, 'wb') as devnull:
+                subprocess.check_call([
+                    bins[0], '-f', 'lavfi', '-i', 'testsrc=s=320x180:d=10',
+                    '-y', videofile,
+                ], stdout=devnull, stderr=devnull)
+            scheduler = RecordingScheduler(
+                cpus=4, processes=2,
+                io_limits={os.path.dirname(videofile): 2})
+            sb = StoryBoard(videofile, params={
+                'bins': bins,
+                'frame_jobs': 4,
+                'scheduler': scheduler,
+                'extraction_strategy': 'seek',
+            })
+            sb.gen_storyboard(params={'include_sha1sum': False}).close()
+            # ffprobe three times, two seek calibration probes, 16
+            # frames
+            self.assertEqual(len(scheduler.granted), 21)
+            self.assertEqual(scheduler.peak, (2, 4))
+            self.assertEqual(set(scheduler.granted[3:]), set([2]))
+            self.assertEqual(scheduler.usage(), (0, 0))
+            self.assertEqual(scheduler.io_usage(videofile), 0)
+        finally:
+            os.remove(videofile)
+
+    def assertFinishes(self, func, timeout=120):
+        """Assert that func returns (or raises) within timeout."""
+        outcome = []
+
+        def target():
+            try:
+                outcome.append(func())
+            except Exception as err:  # pylint: disable=broad-except
+                outcome.append(err)
+
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        thread.join(timeout)
+        self.assertFalse(thread.is_alive(), "deadlocked")
+        if isinstance(outcome[0], Exception):
+            raise outcome[0]
+        return outcome[0]
+
+    def test_single_pass_io_limit(self):
+        # a suspended single-pass extraction holds the only I/O slot,
+        # which hashing the video file must not wait for
+        bins = fflocate.guess_bins()
+        fd, videofile = tempfile.mkstemp(prefix='storyboard-test-',
+                                         suffix='.mkv')
+        os.close(fd)
+        self.addCleanup(os.remove, videofile)
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call([
+                bins[0], '-f', 'lavfi', '-i', 'testsrc=s=320x180:d=10',
+                '-y', videofile,
+            ], stdout=devnull, stderr=devnull)
+
+        def storyboard():
+            return StoryBoard(videofile, params={
+                'bins': bins,
+                'scheduler': Scheduler(cpus=4, io_limit=1),
+                'extraction_strategy': 'sequential',
+            })
+
+        params = {'tile': (2, 2), 'include_sha1sum': True}
+        self.assertFinishes(lambda: storyboard().gen_storyboard(
+            params=dict(params, streaming_assembly=True)).close())
+        self.assertFinishes(lambda: storyboard().save_storyboard_strips(
+            io.BytesIO(), params=params))
+        self.assertFinishes(lambda: storyboard().gen_storyboard(
+            params=dict(params, keyframes_only=True)).close())
+
+        # the same modes, switched on to meet a memory budget (small
+        # thumbnails, so that frames outweigh the storyboard)
+        params = {'tile': (4, 4), 'thumbnail_width': 80,
+                  'include_sha1sum': True}
+        sb = storyboard()
+        stripped = sb._estimate_memory(dict(params, streaming_assembly=True),
+                                       assembled=False)
+        self.assertFinishes(lambda: sb.save(
+            io.BytesIO(), output_format='png',
+            params=dict(params, memory_budget=stripped)))
+        self.assertEqual(sb.degradations, ['strip encoding'])
+        sb = storyboard()
+        keyframes = sb._estimate_memory(dict(
+            params, output_format='jpeg', streaming_assembly=True,
+            keyframes_only=True))
+        self.assertFinishes(lambda: sb.save(
+            io.BytesIO(), params=dict(params, memory_budget=keyframes)))
+        self.assertEqual(sb.degradations,
+                         ['streaming assembly', 'keyframes only'])
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def test_smart_select_io_limit(self):
+        # the candidates of a slot hold the only I/O slot (and process
+        # slot) until released, which the winner waits for
+        bins = fflocate.guess_bins()
+        fd, videofile = tempfile.mkstemp(prefix='storyboard-test-',
+                                         suffix='.mkv')
+        os.close(fd)
+        self.addCleanup(os.remove, videofile)
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call([
+                bins[0], '-f', 'lavfi', '-i', 'testsrc=s=320x180:d=10',
+                '-y', videofile,
+            ], stdout=devnull, stderr=devnull)
+        # keep the candidate generators alive, as a garbage collector
+        # without reference counting (e.g., PyPy's) would
+        import storyboard.storyboard as storyboard_module
+        extract_frames = storyboard_module._extract_frames
+        kept = []
+
+        def kept_extract_frames(*args, **kwargs):
+            frames = extract_frames(*args, **kwargs)
+            kept.append(frames)
+            return frames
+
+        storyboard_module._extract_frames = kept_extract_frames
+        try:
+            for scheduler in (Scheduler(cpus=4, io_limit=1),
+                              Scheduler(cpus=4, processes=1)):
+                sb = StoryBoard(videofile, params={
+                    'bins': bins,
+                    'scheduler': scheduler,
+                    'extraction_strategy': 'seek',
+                })
+                self.assertFinishes(lambda: sb.gen_frames(
+                    4, params={'smart_select': True}), timeout=60)
+                self.assertEqual(len(sb.frames), 4)
+                self.assertEqual(scheduler.usage(), (0, 0))
+                self.assertEqual(scheduler.io_usage(videofile), 0)
+        finally:
+            storyboard_module._extract_frames = extract_frames
+
+
+if __name__ == '__main__':
+    unittest.main()
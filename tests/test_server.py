@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import unittest
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+from PIL import Image
+
+from storyboard import fflocate
+from storyboard.server import *
+
+
+class UnixHTTPConnection(HTTPConnection):
+
+    def __init__(self, path):
+        HTTPConnection.__init__(self, 'localhost')
+        self.unix_socket = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.unix_socket)
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.videofile = tempfile.mkstemp(prefix='storyboard-test-',
+                                              suffix='.mkv')
+        os.close(fd)
+        bins = fflocate.guess_bins()
+        fflocate.check_bins(bins)
+        self.bins = bins
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call([
+                bins[0],
+                '-f', 'lavfi',
+                '-i', 'color=c=pink:s=320x180:d=10',
+                '-y', self.videofile,
+            ], stdout=devnull, stderr=devnull)
+
+    def tearDown(self):
+        os.remove(self.videofile)
+
+    def start_server(self, address, params=None):
+        server = StoryBoardServer(address, params=params)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def request(self, conn, method, path, body=None):
+        if body is not None:
+            body = json.dumps(body)
+        conn.request(method, path, body=body)
+        response = conn.getresponse()
+        data = response.read()
+        conn.close()
+        return response, data
+
+    def test_work_queue(self):
+        queue = WorkQueue(params={'interactive_size': 2, 'batch_size': 1})
+        self.assertTrue(queue.put('b1', 'batch'))
+        self.assertFalse(queue.put('b2', 'batch'))
+        self.assertTrue(queue.put('i1'))
+        self.assertTrue(queue.put('i2', 'interactive'))
+        self.assertFalse(queue.put('i3'))
+        self.assertEqual(queue.pending(), {'interactive': 2, 'batch': 1})
+        with self.assertRaises(ValueError):
+            queue.put('x', 'urgent')
+        self.assertEqual([queue.get() for _ in range(3)], ['i1', 'i2', 'b1'])
+        queue.close()
+        self.assertFalse(queue.put('i4'))
+        self.assertIsNone(queue.get())
+
+    def test_server(self):
+        server = self.start_server(('127.0.0.1', 0), params={
+            'bins': self.bins,
+            'workers': 1,
+        })
+        host, port = server.server_address[:2]
+
+        request = {
+            'video': self.videofile,
+            'output_format': 'png',
+            'tile': [2, 2],
+            'thumbnail_width': 160,
+        }
+        response, data = self.request(HTTPConnection(host, port),
+                                      'POST', '/storyboard', request)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Content-Type'), 'image/png')
+        image = Image.open(io.BytesIO(data))
+        self.assertEqual(image.format, 'PNG')
+
+        # the same video again, in the batch tier, is served from cache
+        request['priority'] = 'batch'
+        response, data2 = self.request(HTTPConnection(host, port),
+                                       'POST', '/storyboard', request)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(Image.open(io.BytesIO(data2)).tobytes(),
+                         image.tobytes())
+
+        response, data = self.request(HTTPConnection(host, port),
+                                      'GET', '/status')
+        self.assertEqual(response.status, 200)
+        status = json.loads(data.decode('utf-8'))
+        self.assertEqual(status['cached_videos'], 1)
+        self.assertEqual(status['pending'], {'interactive': 0, 'batch': 0})
+
+        # degradations to meet a deadline are reported
+        request = {
+            'video': self.videofile,
+            'tile': [3, 3],
+            'deadline': 0.001,
+        }
+        response, _ = self.request(HTTPConnection(host, port),
+                                   'POST', '/storyboard', request)
+        self.assertEqual(response.status, 200)
+        self.assertIn('tiles reduced from 3x3',
+                      response.getheader('X-Storyboard-Degradations'))
+
+        # errors
+        response, _ = self.request(HTTPConnection(host, port),
+                                   'POST', '/storyboard',
+                                   {'video': self.videofile + '.nonexistent'})
+        self.assertEqual(response.status, 404)
+        response, _ = self.request(HTTPConnection(host, port),
+                                   'POST', '/storyboard',
+                                   {'video': self.videofile,
+                                    'output_format': 'gif'})
+        self.assertEqual(response.status, 400)
+        response, _ = self.request(HTTPConnection(host, port),
+                                   'POST', '/storyboard', ['not', 'a', 'dict'])
+        self.assertEqual(response.status, 400)
+        response, _ = self.request(HTTPConnection(host, port),
+                                   'POST', '/storyboard',
+                                   {'video': self.videofile, 'deadline': 0})
+        self.assertEqual(response.status, 400)
+
+    def test_backpressure(self):
+        # without workers, nothing is ever dequeued
+        server = self.start_server(('127.0.0.1', 0), params={
+            'bins': self.bins,
+            'workers': 0,
+            'interactive_size': 1,
+            'batch_size': 1,
+        })
+        host, port = server.server_address[:2]
+        self.assertIsNotNone(server.submit({'video': self.videofile,
+                                            'priority': 'batch'}))
+        response, data = self.request(HTTPConnection(host, port),
+                                      'POST', '/storyboard',
+                                      {'video': self.videofile,
+                                       'priority': 'batch'})
+        self.assertEqual(response.status, 503)
+        self.assertEqual(response.getheader('Retry-After'), '1')
+        # the interactive tier has room of its own
+        self.assertIsNotNone(server.submit({'video': self.videofile}))
+        self.assertIsNone(server.submit({'video': self.videofile}))
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'),
+                         "Unix domain sockets not supported")
+    def test_unix_socket(self):
+        tmpdir = tempfile.mkdtemp(prefix='storyboard-test-')
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'storyboard.sock')
+        self.start_server(path, params={'bins': self.bins})
+        response, data = self.request(UnixHTTPConnection(path),
+                                      'GET', '/status')
+        self.assertEqual(response.status, 200)
+        self.assertIn('pending', json.loads(data.decode('utf-8')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,9 +3,13 @@
 from __future__ import division
 
 import imghdr
+import io
+import json
 import os
 import subprocess
+import sys
 import tempfile
+import time
 import unittest
 
 from PIL import Image, ImageFont
@@ -14,6 +18,11 @@ from storyboard import fflocate
 from storyboard.frame import Frame
 from storyboard.storyboard import *
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from .testing_infrastructure import capture_stdout, capture_stderr, tee_stderr
 from .testing_infrastructure import change_home
 
@@ -167,6 +176,402 @@ class TestStoryBoard(unittest.TestCase):
         self.assertEqual(board.size[0], 1964)
         board.close()
 
+    def test_storyboard_streaming_assembly(self):
+        bins = (self.ffmpeg_bin, self.ffprobe_bin)
+        sb = StoryBoard(self.videofile, params={'bins': bins})
+        streamed = sb.gen_storyboard(params={
+            'tile': (3, 2),
+            'streaming_assembly': True,
+        })
+        # frames are released rather than kept around
+        self.assertEqual(sb.frames, [])
+        sb.gen_frames(6)
+        self.assertEqual(len(sb.frames), 6)
+        regular = sb.gen_storyboard(params={'tile': (3, 2)})
+        self.assertEqual(streamed.size, regular.size)
+        self.assertEqual(streamed.tobytes(), regular.tobytes())
+        streamed.close()
+        regular.close()
+
+    def test_gen_storyboards(self):
+        import storyboard.storyboard as storyboard_module
+        bins = (self.ffmpeg_bin, self.ffprobe_bin)
+        sb = StoryBoard(self.videofile, params={
+            'bins': bins,
+            'extraction_strategy': 'seek',
+        })
+        fd, archive_file = tempfile.mkstemp(prefix='storyboard-test-',
+                                            suffix='.png')
+        os.close(fd)
+        preview = io.BytesIO()
+        # count frame extractions
+        extracted = []
+        extract_frame = storyboard_module._extract_frame
+
+        def counting_extract_frame(video_path, timestamp, params=None):
+            extracted.append(timestamp)
+            return extract_frame(video_path, timestamp, params=params)
+
+        storyboard_module._extract_frame = counting_extract_frame
+        try:
+            full, small, archive = sb.gen_storyboards([
+                {},
+                {
+                    'tile': (2, 2),
+                    'thumbnail_width': 160,
+                    'include_metadata_sheet': False,
+                    'output': preview,
+                    'output_format': 'jpeg',
+                },
+                {'output': archive_file, 'output_format': 'png'},
+            ], params={'include_sha1sum': True})
+        finally:
+            storyboard_module._extract_frame = extract_frame
+        # 16 frames shared by the 4x4 boards, and reused by the 2x2
+        # board within the default tolerance
+        self.assertEqual(len(extracted), 16)
+        self.assertEqual(full.size[0], 1964)
+        # 160 * 2 + 8 * 1 + 10 * 2 = 348
+        self.assertEqual(small.size[0], 348)
+        self.assertEqual(full.tobytes(), archive.tobytes())
+        # identical to a storyboard generated on its own
+        board = sb.gen_storyboard(params={'include_sha1sum': True})
+        self.assertEqual(full.tobytes(), board.tobytes())
+        # encoded outputs
+        preview.seek(0)
+        self.assertEqual(Image.open(preview).format, 'JPEG')
+        self.assertEqual(imghdr.what(archive_file), 'png')
+        os.remove(archive_file)
+        for image in (full, small, archive, board):
+            image.close()
+
+        # thumbnail_resample applies to the resize pyramid
+        resamples = []
+        pyramid_level = storyboard_module._pyramid_level
+
+        def recording_pyramid_level(image, levels, size, resample=None):
+            resamples.append(resample)
+            return pyramid_level(image, levels, size, resample=resample)
+
+        storyboard_module._pyramid_level = recording_pyramid_level
+        try:
+            sb.gen_storyboards([{'thumbnail_resample': Image.NEAREST}])
+        finally:
+            storyboard_module._pyramid_level = pyramid_level
+        self.assertEqual(set(resamples), set([Image.NEAREST]))
+        gradient = Image.linear_gradient('L').convert('RGB')
+        self.assertEqual(
+            pyramid_level(gradient, [], (64, 64), Image.NEAREST).tobytes(),
+            gradient.resize((64, 64), Image.NEAREST).tobytes())
+
+        # parameters that cannot be honored with shared frames
+        for key, value in (('deadline', 10), ('memory_budget', 2 ** 30),
+                           ('keyframes_only', True)):
+            with self.assertRaises(ValueError):
+                sb.gen_storyboards([{}, {key: value}])
+
+    def test_frame_store(self):
+        import storyboard.storyboard as storyboard_module
+        bins = (self.ffmpeg_bin, self.ffprobe_bin)
+        extracted = []
+        extract_frame = storyboard_module._extract_frame
+
+        def counting_extract_frame(video_path, timestamp, params=None):
+            extracted.append(timestamp)
+            return extract_frame(video_path, timestamp, params=params)
+
+        storyboard_module._extract_frame = counting_extract_frame
+        try:
+            sb = StoryBoard(self.videofile, params={
+                'bins': bins,
+                'extraction_strategy': 'seek',
+            })
+            sb.gen_frames(16)
+            self.assertEqual(len(extracted), 16)
+            # each of the 16 frames falls in the 0.4s time slot of one
+            # of the 25 thumbnails, so only 9 frames are missing
+            sb.gen_frames(25)
+            self.assertEqual(len(sb.frames), 25)
+            self.assertEqual(len(extracted), 16 + 9)
+            self.assertEqual(len(sb.frame_store), 25)
+            self.assertEqual(len(set(id(frame) for frame in sb.frames)), 25)
+            for frame, timestamp in zip(sb.frames, sb._frame_timestamps(25)):
+                self.assertLessEqual(abs(frame.timestamp - timestamp), 0.2)
+            # back to 16: everything is in the store
+            del extracted[:]
+            sb.gen_frames(16)
+            self.assertEqual(extracted, [])
+
+            # exact matches only
+            sb = StoryBoard(self.videofile, params={
+                'bins': bins,
+                'frame_tolerance': 0,
+                'extraction_strategy': 'seek',
+            })
+            del extracted[:]
+            sb.gen_frames(4)
+            sb.gen_frames(8)
+            self.assertEqual(len(extracted), 12)
+            sb.clear_frames()
+
+            # frames snapped to keyframes are not served to accurate
+            # seeks
+            sb = StoryBoard(self.videofile, params={
+                'bins': bins,
+                'extraction_strategy': 'seek',
+            })
+            del extracted[:]
+            sb.gen_frames(4, params={'keyframe_seek': True})
+            self.assertEqual(len(extracted), 4)
+            snapped = sb.frames
+            for frame in snapped:
+                self.assertIs(sb.frame_store.nearest(frame.timestamp,
+                                                     keyframe=True), frame)
+            sb.gen_frames(4)
+            self.assertEqual(len(extracted), 8)
+            self.assertEqual(len(sb.frame_store), 8)
+            for frame in sb.frames:
+                self.assertFalse(any(frame is other for other in snapped))
+            sb.clear_frames()
+            self.assertEqual(len(sb.frame_store), 0)
+            self.assertEqual(sb.frames, [])
+        finally:
+            storyboard_module._extract_frame = extract_frame
+
+    @unittest.skipIf(numpy is None, "NumPy not installed")
+    def test_smart_select(self):
+        # a test pattern blacked out around the center of each of the
+        # four 2s time slots
+        fd, videofile = tempfile.mkstemp(prefix='storyboard-test-',
+                                         suffix='.mkv')
+        os.close(fd)
+        self.addCleanup(os.remove, videofile)
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call([
+                self.ffmpeg_bin,
+                '-f', 'lavfi',
+                '-i', 'testsrc=s=320x180:d=8',
+                '-vf', ("drawbox=c=black:t=fill:"
+                        "enable='between(mod(t,2),0.8,1.2)'"),
+                '-y', videofile,
+            ], stdout=devnull, stderr=devnull)
+
+        def mean_luma(frame):
+            luma = frame.image.convert('L')
+            return sum(luma.getdata()) / (luma.size[0] * luma.size[1])
+
+        bins = (self.ffmpeg_bin, self.ffprobe_bin)
+        sb = StoryBoard(videofile, params={'bins': bins})
+        sb.gen_frames(4)
+        self.assertTrue(all(mean_luma(frame) < 24 for frame in sb.frames))
+        sb.gen_frames(4, params={'smart_select': True})
+        self.assertEqual(len(sb.frames), 4)
+        for frame, timestamp in zip(sb.frames, [1, 3, 5, 7]):
+            self.assertGreater(mean_luma(frame), 24)
+            self.assertLess(abs(frame.timestamp - timestamp), 1)
+            self.assertEqual(frame.image.size, (320, 180))
+
+        # streaming assembly
+        sb = StoryBoard(videofile, params={'bins': bins})
+        storyboard = sb.gen_storyboard(params={
+            'tile': (2, 2),
+            'include_metadata_sheet': False,
+            'include_promotional_banner': False,
+            'smart_select': True,
+            'streaming_assembly': True,
+        })
+        self.assertEqual(sb.frames, [])
+        self.assertGreater(sum(storyboard.convert('L').getdata()) /
+                           (storyboard.size[0] * storyboard.size[1]), 24)
+
+    def test_deadline(self):
+        # a keyframe every 2s
+        fd, videofile = tempfile.mkstemp(prefix='storyboard-test-',
+                                         suffix='.mkv')
+        os.close(fd)
+        self.addCleanup(os.remove, videofile)
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call([
+                self.ffmpeg_bin,
+                '-f', 'lavfi',
+                '-i', 'testsrc=s=320x180:r=25:d=10',
+                '-g', '50', '-sc_threshold', '0',
+                '-y', videofile,
+            ], stdout=devnull, stderr=devnull)
+        bins = (self.ffmpeg_bin, self.ffprobe_bin)
+
+        sb = StoryBoard(videofile, params={'bins': bins,
+                                           'extraction_strategy': 'seek'})
+        sb.gen_frames(4, params={'keyframe_seek': True})
+        for frame, timestamp in zip(sb.frames, [1.25, 3.75, 6.25, 8.75]):
+            self.assertLessEqual(frame.timestamp, timestamp)
+            self.assertAlmostEqual(frame.timestamp % 2, 0, places=2)
+
+        # an unreachable deadline degrades everything
+        sb = StoryBoard(videofile, params={'bins': bins})
+        storyboard = sb.gen_storyboard(params={
+            'include_sha1sum': True,
+            'deadline': 0.001,
+        })
+        self.assertEqual(sb.degradations, [
+            "skipped SHA-1 digest",
+            "bilinear thumbnail resampling",
+            "seeks snapped to keyframes",
+            "tiles reduced from 4x4 to 1x1",
+        ])
+        self.assertIsNone(sb.video.sha1sum)
+        # 480 (thumbnail) + 10 * 2 (margins)
+        self.assertEqual(storyboard.size[0], 500)
+        storyboard.close()
+
+        # a generous one degrades nothing
+        storyboard = sb.gen_storyboard(params={
+            'include_sha1sum': False,
+            'deadline': 3600,
+        })
+        self.assertEqual(sb.degradations, [])
+        self.assertEqual(storyboard.size[0], 1964)
+        storyboard.close()
+        storyboard = sb.gen_storyboard()
+        self.assertEqual(sb.degradations, [])
+        storyboard.close()
+
+        # a slow first-time seek calibration is not taken for the cost
+        # of each frame
+        sb = StoryBoard(videofile, params={'bins': bins})
+        calibrate_seek = sb._calibrate_seek
+
+        def slow_calibrate_seek():
+            if sb.seek_mode is None:
+                time.sleep(2)
+            return calibrate_seek()
+
+        sb._calibrate_seek = slow_calibrate_seek
+        storyboard = sb.gen_storyboard(params={
+            'include_sha1sum': False,
+            'deadline': 20,
+        })
+        self.assertEqual(sb.degradations, [])
+        storyboard.close()
+
+    def test_seek_calibration(self):
+        bins = (self.ffmpeg_bin, self.ffprobe_bin)
+        sb = StoryBoard(self.videofile, params={'bins': bins})
+        self.assertIsNone(sb.seek_mode)
+        sb.gen_frames(4)
+        self.assertEqual(sb.seek_mode, 'input')
+
+        # input seeking in MPEG program streams lands up to a GOP late
+        fd, videofile = tempfile.mkstemp(prefix='storyboard-test-',
+                                         suffix='.vob')
+        os.close(fd)
+        self.addCleanup(os.remove, videofile)
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call([
+                self.ffmpeg_bin,
+                '-f', 'lavfi',
+                '-i', 'testsrc=s=320x180:r=25:d=10',
+                '-c:v', 'mpeg2video', '-g', '15',
+                '-y', videofile,
+            ], stdout=devnull, stderr=devnull)
+        sb = StoryBoard(videofile, params={'bins': bins})
+        sb.gen_frames(4)
+        self.assertEqual(sb.seek_mode, 'hybrid')
+        self.assertEqual(sb.plan.strategy, 'seek')
+        slow = StoryBoard(videofile, params={'bins': bins,
+                                             'seek_mode': 'output'})
+        slow.gen_frames(4)
+        for frame, reference in zip(sb.frames, slow.frames):
+            self.assertEqual(frame.image.tobytes(),
+                             reference.image.tobytes())
+
+        with self.assertRaises(ValueError):
+            StoryBoard(videofile, params={'bins': bins,
+                                          'seek_mode': 'telepathy'})
+
+    def test_keyframes_only(self):
+        # a keyframe every 2s
+        fd, videofile = tempfile.mkstemp(prefix='storyboard-test-',
+                                         suffix='.mkv')
+        os.close(fd)
+        self.addCleanup(os.remove, videofile)
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call([
+                self.ffmpeg_bin,
+                '-f', 'lavfi',
+                '-i', 'testsrc=s=320x180:r=25:d=10',
+                '-g', '50', '-sc_threshold', '0',
+                '-y', videofile,
+            ], stdout=devnull, stderr=devnull)
+        bins = (self.ffmpeg_bin, self.ffprobe_bin)
+
+        sb = StoryBoard(videofile, params={'bins': bins})
+        timestamps = []
+        for frame in sb._iter_keyframes([0.3, 1.2, 2.9, 3.1, 9.9],
+                                        (160, -2)):
+            self.assertEqual(frame.image.size, (160, 90))
+            timestamps.append(round(frame.timestamp, 2))
+        self.assertEqual(timestamps, [0, 2, 2, 4, 8])
+
+        storyboard = sb.gen_storyboard(params={'keyframes_only': True})
+        self.assertEqual(sb.frames, [])
+        regular = sb.gen_storyboard()
+        self.assertEqual(storyboard.size, regular.size)
+        storyboard.close()
+        regular.close()
+
+        # no keyframe decoded at all
+        import storyboard.storyboard as storyboard_module
+        extract_frames = storyboard_module._extract_frames
+
+        def no_frames(video_path, params=None):
+            return
+            yield
+
+        storyboard_module._extract_frames = no_frames
+        try:
+            with self.assertRaises(OSError):
+                list(sb._iter_keyframes([0.3, 1.2], (160, -2)))
+            with self.assertRaises(OSError):
+                sb.gen_storyboard(params={'keyframes_only': True})
+        finally:
+            storyboard_module._extract_frames = extract_frames
+
+    def test_save_storyboard_strips(self):
+        bins = (self.ffmpeg_bin, self.ffprobe_bin)
+        sb = StoryBoard(self.videofile, params={'bins': bins})
+        fp = io.BytesIO()
+        size = sb.save_storyboard_strips(fp, params={'tile': (2, 3)})
+        # frames are not kept around in strip mode
+        self.assertEqual(sb.frames, [])
+        fp.seek(0)
+        stripped = Image.open(fp)
+        self.assertEqual(stripped.format, 'PNG')
+        self.assertEqual(stripped.size, size)
+        # identical to the storyboard assembled in memory
+        board = sb.gen_storyboard(params={'tile': (2, 3)})
+        self.assertEqual(board.size, size)
+        self.assertEqual(stripped.convert('RGB').tobytes(), board.tobytes())
+        board.close()
+        # without the optional sections
+        fp = io.BytesIO()
+        size = sb.save_storyboard_strips(fp, params={
+            'tile': (2, 3),
+            'include_metadata_sheet': False,
+            'include_promotional_banner': False,
+            'margins': (0, 0),
+        })
+        board = sb.gen_storyboard(params={
+            'tile': (2, 3),
+            'include_metadata_sheet': False,
+            'include_promotional_banner': False,
+            'margins': (0, 0),
+        })
+        fp.seek(0)
+        self.assertEqual(Image.open(fp).convert('RGB').tobytes(),
+                         board.tobytes())
+        board.close()
+
     def assertImageFormat(self, image_format):
         image = sys.stdout.getvalue().strip()
         self.assertEqual(imghdr.what(image), image_format)
@@ -181,6 +586,116 @@ class TestStoryBoard(unittest.TestCase):
         # sys.stderr is not empty
         self.assertEqual(sys.stderr.getvalue(), '')
 
+    def test_save(self):
+        sb = StoryBoard(self.videofile)
+        params = {'include_sha1sum': False}
+        data = sb.gen_storyboard_bytes(output_format='png', params=params)
+        image = Image.open(io.BytesIO(data))
+        self.assertEqual(image.format, 'PNG')
+        reference = sb.gen_storyboard(params=params)
+        self.assertEqual(image.tobytes(), reference.tobytes())
+
+        output = io.BytesIO()
+        sb.save(output, output_format='png',
+                params={'include_sha1sum': False, 'strip_encoding': True})
+        output.seek(0)
+        self.assertEqual(Image.open(output).tobytes(), reference.tobytes())
+
+        self.assertEqual(imghdr.what(None, sb.gen_storyboard_bytes()), 'jpeg')
+        with self.assertRaises(ValueError):
+            sb.save(io.BytesIO(), output_format='gif')
+        with self.assertRaises(ValueError):
+            sb.save(io.BytesIO(), params={'strip_encoding': True})
+
+    def test_memory_budget(self):
+        bins = (self.ffmpeg_bin, self.ffprobe_bin)
+        params = {'thumbnail_width': 80, 'include_sha1sum': False}
+        sb = StoryBoard(self.videofile, params={'bins': bins})
+        full = sb._estimate_memory(dict(params, output_format='png'))
+        streamed = sb._estimate_memory(dict(params, output_format='png',
+                                            streaming_assembly=True))
+        stripped = sb._estimate_memory(dict(params, streaming_assembly=True),
+                                       assembled=False)
+        self.assertLess(stripped, streamed)
+        self.assertLess(streamed, full)
+        reference = sb.gen_storyboard(params=params)
+
+        # plenty of memory
+        sb = StoryBoard(self.videofile, params={'bins': bins})
+        data = sb.gen_storyboard_bytes(
+            output_format='png', params=dict(params, memory_budget=full))
+        self.assertEqual(sb.degradations, [])
+        self.assertEqual(Image.open(io.BytesIO(data)).tobytes(),
+                         reference.tobytes())
+
+        # streaming assembly is enough
+        sb = StoryBoard(self.videofile, params={'bins': bins})
+        data = sb.gen_storyboard_bytes(
+            output_format='png', params=dict(params, memory_budget=streamed))
+        self.assertEqual(sb.degradations, ['streaming assembly'])
+        self.assertEqual(sb.frames, [])
+        self.assertEqual(Image.open(io.BytesIO(data)).tobytes(),
+                         reference.tobytes())
+
+        # strip encoding, for PNG only
+        data = sb.gen_storyboard_bytes(
+            output_format='png', params=dict(params, memory_budget=stripped))
+        self.assertEqual(sb.degradations, ['strip encoding'])
+        self.assertEqual(Image.open(io.BytesIO(data)).tobytes(),
+                         reference.tobytes())
+        keyframes = sb._estimate_memory(dict(
+            params, output_format='jpeg', streaming_assembly=True,
+            keyframes_only=True))
+        self.assertGreater(keyframes, stripped)
+        sb.gen_storyboard_bytes(
+            output_format='jpeg', params=dict(params, memory_budget=keyframes))
+        self.assertEqual(sb.degradations,
+                         ['streaming assembly', 'keyframes only'])
+
+        # fails upfront
+        sb = StoryBoard(self.videofile, params={'bins': bins})
+        with self.assertRaises(MemoryError):
+            sb.gen_storyboard_bytes(params=dict(params,
+                                                memory_budget=stripped))
+        self.assertNotIn('frame_seek', sb.timings)
+        reference.close()
+
+    def test_sprite_track(self):
+        sb = StoryBoard(self.videofile)
+        sheets, vtt = sb.gen_sprite_track(params={
+            'interval': 1,
+            'tile': (4, 2),
+            'thumbnail_width': 64,
+        })
+        self.assertEqual([sheet.size for sheet in sheets],
+                         [(256, 72), (256, 36)])
+        lines = vtt.splitlines()
+        self.assertEqual(lines[0], 'WEBVTT')
+        self.assertEqual(vtt.count('-->'), 10)
+        self.assertIn('00:00:00.000 --> 00:00:01.000\n'
+                      'sprite-001.jpg#xywh=0,0,64,36', vtt)
+        self.assertIn('00:00:09.000 --> 00:00:10.000\n'
+                      'sprite-002.jpg#xywh=64,0,64,36', vtt)
+
+        directory = tempfile.mkdtemp(prefix='storyboard-test-')
+        try:
+            vtt_file, sheet_files = sb.save_sprite_track(directory, params={
+                'interval': 5,
+                'tile': (4, 2),
+                'thumbnail_width': 64,
+                'output_format': 'png',
+            })
+            self.assertEqual([os.path.basename(f) for f in sheet_files],
+                             ['sprite-001.png'])
+            self.assertEqual(imghdr.what(sheet_files[0]), 'png')
+            with open(vtt_file) as fileobj:
+                self.assertIn('sprite-001.png#xywh=64,0,64,36',
+                              fileobj.read())
+        finally:
+            for filename in os.listdir(directory):
+                os.remove(os.path.join(directory, filename))
+            os.rmdir(directory)
+
     def test_main(self):
         with change_home() as home:
             config_dir = os.path.join(home, '.config', 'storyboard')
@@ -224,6 +739,114 @@ class TestStoryBoard(unittest.TestCase):
                     self.assertImageFormat('png')
                     self.assertProgressNotPrinted()
 
+            # multiple formats with preset
+            with capture_stdout():
+                with capture_stderr():
+                    sys.argv[1:] = ['-f', 'webp,png,jpeg', '--preset', 'fast',
+                                    self.videofile]
+                    main()
+                    images = sys.stdout.getvalue().split()
+                    self.assertEqual([imghdr.what(image) for image in images],
+                                     ['webp', 'png', 'jpeg'])
+                    for image in images:
+                        os.remove(image)
+            with capture_stdout():
+                with capture_stderr():
+                    with self.assertRaises(SystemExit):
+                        sys.argv[1:] = ['-f', 'jpeg,gif', self.videofile]
+                        main()
+                    self.assertRegex(sys.stderr.getvalue(), 'error')
+
+            # output directory and file
+            output_dir = tempfile.mkdtemp(prefix='storyboard-test-')
+            try:
+                with capture_stdout():
+                    with capture_stderr():
+                        sys.argv[1:] = ['--output-dir', output_dir,
+                                        '-f', 'jpeg,png', self.videofile]
+                        main()
+                        basename = os.path.splitext(
+                            os.path.basename(self.videofile))[0]
+                        self.assertEqual(
+                            sys.stdout.getvalue().split(),
+                            [os.path.join(output_dir, basename + '.jpg'),
+                             os.path.join(output_dir, basename + '.png')])
+                output_file = os.path.join(output_dir, 'board.png')
+                with capture_stdout():
+                    with capture_stderr():
+                        sys.argv[1:] = ['-o', output_file, '-f', 'png',
+                                        '--strip-encoding', self.videofile]
+                        main()
+                        self.assertImageFormat('png')
+                with capture_stdout():
+                    with capture_stderr():
+                        with self.assertRaises(SystemExit):
+                            sys.argv[1:] = ['-o', output_file,
+                                            self.videofile, self.videofile]
+                            main()
+                        self.assertRegex(sys.stderr.getvalue(), 'error')
+            finally:
+                for filename in os.listdir(output_dir):
+                    os.remove(os.path.join(output_dir, filename))
+                os.rmdir(output_dir)
+
+            # parallel jobs
+            with capture_stdout():
+                with capture_stderr():
+                    sys.argv[1:] = ['--jobs', '2', '--ordered',
+                                    self.videofile, self.videofile]
+                    main()
+                    images = sys.stdout.getvalue().split()
+                    self.assertEqual(len(images), 2)
+                    for image in images:
+                        self.assertEqual(imghdr.what(image), 'jpeg')
+                        os.remove(image)
+
+            # timings
+            timings_file = os.path.join(home, 'timings.json')
+            with capture_stdout():
+                with capture_stderr():
+                    sys.argv[1:] = ['--timings', '--timings-json',
+                                    timings_file, self.videofile]
+                    main()
+                    os.remove(sys.stdout.getvalue().strip())
+                    self.assertRegex(sys.stderr.getvalue(),
+                                     r'frame_seek +[0-9.]+s')
+            with open(timings_file) as fp:
+                timings = json.load(fp)
+            self.assertEqual(list(timings), [self.videofile])
+            for stage in ['ffprobe', 'frame_seek', 'resize', 'tiling',
+                          'text', 'encoding']:
+                self.assertGreater(timings[self.videofile][stage], 0)
+
+            # output to stdout
+            saved_stdout = sys.stdout
+            sys.stdout = io.TextIOWrapper(io.BytesIO())
+            try:
+                with capture_stderr():
+                    sys.argv[1:] = ['--output', '-', '-f', 'png',
+                                    self.videofile]
+                    main()
+                    sys.stdout.flush()
+                    data = sys.stdout.buffer.getvalue()
+            finally:
+                sys.stdout = saved_stdout
+            self.assertEqual(Image.open(io.BytesIO(data)).format, 'PNG')
+
+            # strip encoding
+            with capture_stdout():
+                with capture_stderr():
+                    sys.argv[1:] = ['--strip-encoding', '-f', 'png',
+                                    self.videofile]
+                    main()
+                    self.assertImageFormat('png')
+            with capture_stdout():
+                with capture_stderr():
+                    with self.assertRaises(SystemExit):
+                        sys.argv[1:] = ['--strip-encoding', self.videofile]
+                        main()
+                    self.assertRegex(sys.stderr.getvalue(), 'error')
+
             # PNG and verbose via config file
             with open(config_file, 'w') as f:
                 f.write("[storyboard-cli]\n"
@@ -294,6 +917,17 @@ class TestStoryBoard(unittest.TestCase):
                         main()
                     self.assertRegex(sys.stderr.getvalue(), 'error')
 
+    def test_lazy_imports(self):
+        # heavy modules must not be imported merely to start the console
+        # scripts, e.g., for --version or --help
+        heavy = ['PIL', 'pkg_resources', 'multiprocessing.pool']
+        code = ('import sys; import storyboard.storyboard; '
+                'import storyboard.metadata; '
+                'print(" ".join(m for m in %r if m in sys.modules))' % heavy)
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.decode('utf-8').strip(), '')
+        self.assertTrue(os.path.isfile(DEFAULT_FONT_FILE))
+
 
 if __name__ == '__main__':
     unittest.main()
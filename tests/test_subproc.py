@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from storyboard import frame
+from storyboard import metadata
+from storyboard.subproc import *
+
+
+@unittest.skipIf(os.name == 'nt', "requires a POSIX shell")
+class TestSubproc(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        # fake binary hanging forever, with a child of its own
+        self.hanging = os.path.join(self.tmpdir, 'hanging')
+        with open(self.hanging, 'w') as fp:
+            fp.write('#!/bin/sh\nsleep 30 &\nsleep 30\n')
+        os.chmod(self.hanging, os.stat(self.hanging).st_mode | stat.S_IXUSR)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_timeout(self):
+        start = time.time()
+        proc = Process([self.hanging], limits=Limits(timeout=0.2),
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # the pipes are only closed if the whole process group is killed
+        proc.communicate()
+        self.assertLess(time.time() - start, 10)
+        self.assertTrue(proc.timed_out)
+        with self.assertRaises(OSError):
+            proc.check_timeout()
+
+        # the watchdog is stopped once the process exits
+        proc = Process(['true'], limits=Limits(timeout=0.2))
+        proc.wait()
+        time.sleep(0.3)
+        self.assertFalse(proc.timed_out)
+        proc.check_timeout()
+
+    def test_limits(self):
+        script = ('import os, resource; '
+                  'print(resource.getrlimit(resource.RLIMIT_AS)[0]); '
+                  'print(resource.getrlimit(resource.RLIMIT_CPU)[0]); '
+                  'print(os.nice(0))')
+        limits = Limits(memory=2 ** 33, cpu_time=60, nice=3)
+        proc = Process([sys.executable, '-c', script], limits=limits,
+                       stdout=subprocess.PIPE)
+        output = proc.communicate()[0].decode('utf-8').split()
+        self.assertEqual(output, [str(2 ** 33), '60', str(os.nice(0) + 3)])
+
+        with self.assertRaises(ValueError):
+            Limits(timeout=0)
+        with self.assertRaises(ValueError):
+            Limits(memory=-1)
+        with self.assertRaises(ValueError):
+            Limits(ionice='realtime')
+        with self.assertRaises(ValueError):
+            Limits(ionice='idle:3')
+
+    def test_call_sites(self):
+        params = {
+            'ffmpeg_bin': self.hanging,
+            'ffprobe_bin': self.hanging,
+            'scheduler': None,
+            'process_limits': Limits(timeout=0.2),
+        }
+        with self.assertRaises(OSError) as cm:
+            frame.extract_frame(self.hanging, 1, params=params)
+        self.assertIn('timed out', str(cm.exception))
+        with self.assertRaises(OSError) as cm:
+            list(frame.extract_frames(self.hanging, params=params))
+        self.assertIn('timed out', str(cm.exception))
+        with self.assertRaises(OSError) as cm:
+            metadata.Video(self.hanging, params=params)
+        self.assertIn('timed out', str(cm.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,7 @@ try:
 except ImportError:
     import ConfigParser as configparser
 import hashlib
+import json
 import os
 import sys
 import tempfile
@@ -18,6 +19,25 @@ from storyboard.util import *
 
 class TestUtil(unittest.TestCase):
 
+    def setUp(self):
+        if not hasattr(self, 'assertRegex'):
+            self.assertRegex = self.assertRegexpMatches
+
+    def test_import_numpy(self):
+        saved = sys.modules.get('numpy')
+        # makes the import fail, whether NumPy is installed or not
+        sys.modules['numpy'] = None
+        try:
+            with self.assertRaises(ImportError) as context:
+                import_numpy('testing')
+            self.assertRegex(str(context.exception),
+                             '^testing requires NumPy')
+        finally:
+            if saved is None:
+                del sys.modules['numpy']
+            else:
+                sys.modules['numpy'] = saved
+
     def test_round_up(self):
         self.assertAlmostEqual(round_up(1.0), 1.0)
         self.assertAlmostEqual(round_up(0.5), 1.0)
@@ -88,6 +108,35 @@ class TestUtil(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             pbar.finish()
 
+    def test_timings(self):
+        timings = Timings()
+        with timings.timer('b'):
+            pass
+        timings.add('a', 1.0)
+        timings.add('a', 0.5)
+        with self.assertRaises(ValueError):
+            with timings.timer('c'):
+                raise ValueError
+        self.assertEqual([stage for stage, _ in timings.stages()],
+                         ['b', 'a', 'c'])
+        self.assertAlmostEqual(timings['a'], 1.5)
+        self.assertIsInstance(timings, dict)
+        lines = timings.format().split('\n')
+        self.assertEqual(len(lines), 4)
+        self.assertRegex(lines[1], r'^a +1\.500s')
+        self.assertRegex(lines[-1], r'^total ')
+
+        fd, json_file = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            report_timings([('video.mkv', timings)],
+                           params={'json_file': json_file})
+            with open(json_file) as fp:
+                report = json.load(fp)
+            self.assertEqual(sorted(report['video.mkv']), ['a', 'b', 'c'])
+        finally:
+            os.remove(json_file)
+
     def test_option_reader(self):
         parser = argparse.ArgumentParser()
         parser.add_argument('--str')